@@ -0,0 +1,211 @@
+"""
+Time-partitioned archival of the conversations table.
+
+Turns older than a cutoff move out of the hot table into one SQLite file per month
+(``conversations_YYYY_MM.db``) with message and response zlib-compressed. Rows are
+written to the archive and committed before they are deleted from the hot table, so a
+crash in between leaves a duplicate (ignored on re-run) rather than a lost turn.
+
+compact_database() runs the incremental VACUUM/ANALYZE pass used by the maintenance task,
+and checkpoint_database() the WAL checkpoint done at shutdown.
+"""
+
+import glob
+import logging
+import os
+import sqlite3
+import urllib.parse
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import DateTime, bindparam, text
+
+logger = logging.getLogger(__name__)
+
+_SELECT_OLD_TURNS = text(
+    "SELECT id, user_id, timestamp, message, response FROM conversations "
+    "WHERE timestamp < :cutoff ORDER BY id LIMIT :limit"
+).bindparams(bindparam("cutoff", type_=DateTime()))
+_DELETE_TURNS = text("DELETE FROM conversations WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+
+ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        message BLOB,
+        response BLOB
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_archive_user_timestamp ON conversations (user_id, timestamp)",
+]
+
+
+def _compress(value) -> bytes:
+    return zlib.compress((value or "").encode("utf-8"), 6)
+
+
+def _decompress(value) -> str:
+    return zlib.decompress(value).decode("utf-8") if value else ""
+
+
+def _as_datetime(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+class ConversationArchive:
+    """Per-month compressed SQLite archives of conversation turns."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def month_path(self, year: int, month: int) -> str:
+        return os.path.join(self.directory, f"conversations_{year:04d}_{month:02d}.db")
+
+    def month_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "conversations_*.db")))
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=5.0)
+        for ddl in ARCHIVE_SCHEMA:
+            conn.execute(ddl)
+        return conn
+
+    def _connect_readonly(self, path: str) -> sqlite3.Connection:
+        # Month files only exist once archive_before has created their schema
+        return sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True, timeout=5.0)
+
+    def archive_before(self, db_engine, cutoff: datetime, batch_size: int = 1000) -> int:
+        """Move hot turns with timestamp < cutoff into the monthly archives; returns rows moved.
+
+        Each batch is its own short transaction on the hot table so writers are never
+        blocked for long.
+        """
+        moved = 0
+        while True:
+            with db_engine.connect() as conn:
+                rows = conn.execute(_SELECT_OLD_TURNS, {"cutoff": cutoff, "limit": batch_size}).all()
+            if not rows:
+                return moved
+
+            by_month = defaultdict(list)
+            for r in rows:
+                ts = _as_datetime(r.timestamp)
+                by_month[(ts.year, ts.month)].append(
+                    (r.id, r.user_id, ts.isoformat(), _compress(r.message), _compress(r.response)))
+            for (year, month), month_rows in by_month.items():
+                archive = self._connect(self.month_path(year, month))
+                try:
+                    with archive:
+                        archive.executemany("INSERT OR IGNORE INTO conversations VALUES (?, ?, ?, ?, ?)", month_rows)
+                finally:
+                    archive.close()
+
+            with db_engine.begin() as conn:
+                conn.execute(_DELETE_TURNS, {"ids": [r.id for r in rows]})
+            moved += len(rows)
+            if len(rows) < batch_size:
+                return moved
+
+    def read_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """Return a user's archived turns, oldest first, in the /history row format; blocking."""
+        history = []
+        for path in self.month_paths():
+            conn = self._connect_readonly(path)
+            try:
+                rows = conn.execute(
+                    "SELECT id, timestamp, message, response FROM conversations "
+                    "WHERE user_id = ? ORDER BY timestamp", (user_id,)).fetchall()
+            finally:
+                conn.close()
+            history.extend(
+                {
+                    "id": turn_id,
+                    "user_id": user_id,
+                    "message": _decompress(message),
+                    "response": _decompress(response),
+                    "timestamp": timestamp,
+                }
+                for turn_id, timestamp, message, response in rows
+            )
+        return history
+
+    def search_user(self, user_id: str, matches: Callable[[str, str], bool], offset: int = 0,
+                    limit: int = 20) -> List[Dict[str, Any]]:
+        """A user's archived turns for which matches(message, response) holds, newest first; blocking.
+
+        The archives have no full-text index, so every archived turn of the user up to the
+        page is decompressed and tested.
+        """
+        found: List[Dict[str, Any]] = []
+        for path in reversed(self.month_paths()):
+            conn = self._connect_readonly(path)
+            try:
+                rows = conn.execute(
+                    "SELECT id, timestamp, message, response FROM conversations "
+                    "WHERE user_id = ? ORDER BY timestamp DESC", (user_id,)).fetchall()
+            finally:
+                conn.close()
+            for turn_id, timestamp, message, response in rows:
+                message, response = _decompress(message), _decompress(response)
+                if not matches(message, response):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                found.append({"id": turn_id, "user_id": user_id, "message": message, "response": response,
+                              "timestamp": timestamp})
+                if len(found) >= limit:
+                    return found
+        return found
+
+    def delete_user(self, user_id: str) -> int:
+        """Remove a user's turns from every month; returns rows deleted."""
+        deleted = 0
+        for path in self.month_paths():
+            conn = self._connect(path)
+            try:
+                with conn:
+                    deleted += conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,)).rowcount
+            finally:
+                conn.close()
+        return deleted
+
+
+def checkpoint_database(db_engine) -> None:
+    """Fold the WAL back into the main database file and close pooled connections.
+
+    Called at shutdown, so a stopped worker leaves a self-contained database file.
+    """
+    if db_engine.dialect.name == "sqlite":
+        with db_engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_engine.dispose()
+
+
+def compact_database(db_engine, max_pages: int = 1000) -> None:
+    """Reclaim free pages and refresh planner statistics a little at a time.
+
+    The first run on a database created without auto_vacuum=INCREMENTAL pays for one
+    full VACUUM to switch modes; after that each run frees at most max_pages pages.
+    """
+    if db_engine.dialect.name != "sqlite":
+        return
+    raw = db_engine.raw_connection()
+    try:
+        raw.commit()
+        cursor = raw.cursor()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("Enabling incremental auto_vacuum (one-time full VACUUM)")
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor.execute("VACUUM")
+        cursor.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+        # Bound the rows ANALYZE samples so the pass stays cheap on large tables
+        cursor.execute("PRAGMA analysis_limit=400")
+        cursor.execute("PRAGMA optimize")
+        cursor.close()
+        raw.commit()
+    finally:
+        raw.close()
@@ -0,0 +1,108 @@
+"""
+Binary audio frames for WebSocket transport.
+
+Sending audio as base64 inside JSON costs a third more bytes and an encode/decode pass on
+both ends. A frame is instead a 14-byte header, the session id, then the raw audio:
+
+    offset  size  field
+    0       2     magic b"VA"
+    2       1     version (1)
+    3       1     codec (CODEC_PCM16 or CODEC_WAV)
+    4       1     flags (FLAG_END: last frame of an utterance or reply)
+    5       1     session id length n, in UTF-8 bytes
+    6       4     sample rate (Hz), little-endian
+    10      4     sequence number, little-endian
+    14      n     session id
+    14 + n  ...   payload: 16-bit little-endian mono PCM, or a WAV file
+
+parse_frame returns the payload as a memoryview into the received message, so a chunk
+reaches the voice activity detector without being copied. Frames with a sample rate
+outside what audioprep accepts, or a WAV payload that is not a RIFF/WAVE file, are
+rejected.
+"""
+
+import json
+import struct
+from typing import NamedTuple, Optional, Tuple, Union
+
+from audioprep import MAX_SAMPLE_RATE, MIN_SAMPLE_RATE
+
+MAGIC = b"VA"
+VERSION = 1
+CODEC_PCM16 = 1
+CODEC_WAV = 2
+FLAG_END = 0x01
+
+HEADER = struct.Struct("<2sBBBBII")
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class FrameError(ValueError):
+    """Raised for data that is not a well-formed audio frame."""
+
+
+class AudioFrame(NamedTuple):
+    session_id: str
+    seq: int
+    codec: int
+    sample_rate: int
+    flags: int
+    payload: memoryview
+
+    @property
+    def end(self) -> bool:
+        return bool(self.flags & FLAG_END)
+
+
+def is_frame(data: Buffer) -> bool:
+    return len(data) >= HEADER.size and bytes(data[:2]) == MAGIC
+
+
+def parse_frame(data: Buffer) -> AudioFrame:
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise FrameError(f"Frame shorter than its {HEADER.size}-byte header")
+    magic, version, codec, flags, session_len, sample_rate, seq = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise FrameError("Not an audio frame")
+    if version != VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if codec not in (CODEC_PCM16, CODEC_WAV):
+        raise FrameError(f"Unknown codec {codec}")
+    start = HEADER.size + session_len
+    if len(view) < start:
+        raise FrameError("Frame truncated inside the session id")
+    if codec == CODEC_PCM16 and (len(view) - start) % 2:
+        raise FrameError("PCM16 payload has an odd number of bytes")
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise FrameError(f"Sample rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE} Hz")
+    # An empty WAV frame can still end an utterance
+    if codec == CODEC_WAV and len(view) > start and not (view[start:start + 4] == b"RIFF"
+                                                         and view[start + 8:start + 12] == b"WAVE"):
+        raise FrameError("WAV frame payload is not a RIFF/WAVE file")
+    try:
+        session_id = str(view[HEADER.size:start], "utf-8")
+    except UnicodeDecodeError:
+        raise FrameError("Session id is not valid UTF-8") from None
+    return AudioFrame(session_id, seq, codec, sample_rate, flags, view[start:])
+
+
+def encode_frame(session_id: str, seq: int, payload: Buffer, sample_rate: int,
+                 codec: int = CODEC_PCM16, flags: int = 0) -> bytes:
+    """One frame as bytes; the payload is copied once, straight into place."""
+    session = session_id.encode("utf-8")
+    if len(session) > 255:
+        raise FrameError("Session id longer than 255 bytes")
+    header = HEADER.pack(MAGIC, VERSION, codec, flags, len(session), sample_rate, seq & 0xFFFFFFFF)
+    return b"".join((header, session, payload))
+
+
+def echo_reply(data: Buffer) -> Tuple[Optional[AudioFrame], Union[bytes, str]]:
+    """The test echo servers' answer to a binary message: the frame and the message unchanged,
+    or None and a JSON error."""
+    try:
+        frame = parse_frame(data)
+    except FrameError as e:
+        return None, json.dumps({"type": "error", "error": str(e)})
+    return frame, bytes(data)
@@ -0,0 +1,259 @@
+"""
+Audio preprocessing for speech-to-text, vectorized with NumPy.
+
+Chunks of 16-bit PCM go through three stages:
+
+    Resampler        windowed-sinc low-pass (when downsampling) and linear interpolation
+                     to the STT model's rate, streaming: filter history and the fractional
+                     read position carry over between chunks
+    voice activity   per 30 ms frame, RMS energy in dBFS plus zero-crossing rate, so quiet
+                     fricatives ("s", "f") count as speech but equally quiet hum does not
+    trimming         leading silence is dropped except for a short pre-roll kept in a ring
+                     buffer, trailing silence is cut after the utterance ends
+
+SpeechPreprocessor returns finished utterances at the target rate, loudness-normalized
+so the STT backend sees similar levels from every microphone. Per-sample work is array
+operations over whole chunks; the only Python loop is over runs of speech or silence.
+"""
+
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Input rates accepted from clients; the resampling filter grows with the rate ratio, so an
+# absurd rate would mean a filter with millions of taps run on every chunk
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+
+
+def check_sample_rate(rate: int) -> int:
+    """rate if it is a supported input rate; raises ValueError otherwise."""
+    if not MIN_SAMPLE_RATE <= rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"Sample rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE} Hz")
+    return rate
+
+
+def pcm16_to_float(pcm: Buffer) -> np.ndarray:
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def float_to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768.0).astype("<i2").tobytes()
+
+
+def lowpass_taps(cutoff: float, width: int) -> np.ndarray:
+    """Hann-windowed sinc low-pass with `width` taps; cutoff in cycles per sample (< 0.5)."""
+    n = np.arange(width) - (width - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hanning(width)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class Resampler:
+    """Streaming sample-rate conversion from src_rate to dst_rate."""
+
+    def __init__(self, src_rate: int, dst_rate: int, taps_per_ratio: int = 16):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.step = src_rate / dst_rate  # input samples per output sample
+        if self.step > 1:
+            width = int(taps_per_ratio * np.ceil(self.step)) | 1
+            self.taps = lowpass_taps(0.45 / self.step, width)
+        else:
+            self.taps = None
+        self._history = np.zeros(0 if self.taps is None else len(self.taps) - 1, dtype=np.float32)
+        self._last = np.zeros(1, dtype=np.float32)  # last filtered sample of the previous chunk
+        self._consumed = 0  # filtered samples seen before the current chunk
+        self._next = 0.0  # position of the next output sample, in filtered samples
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.step == 1:
+            return samples
+        if self.taps is not None:
+            padded = np.concatenate((self._history, samples))
+            self._history = padded[len(padded) - len(self._history):]
+            filtered = np.convolve(padded, self.taps, mode="valid")
+        else:
+            filtered = samples
+        if not len(filtered):
+            return filtered
+        # Interpolate over [previous last sample] + this chunk, indexed from _consumed - 1
+        source = np.concatenate((self._last, filtered))
+        end = self._consumed + len(filtered) - 1
+        count = int(np.floor((end - self._next) / self.step)) + 1 if self._next <= end else 0
+        positions = self._next + self.step * np.arange(count)
+        out = np.interp(positions - (self._consumed - 1), np.arange(len(source)), source).astype(np.float32)
+        self._next += self.step * count
+        self._consumed += len(filtered)
+        self._last = filtered[-1:]
+        return out
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    return Resampler(src_rate, dst_rate).process(samples)
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: float = -20.0, max_gain_db: float = 30.0) -> np.ndarray:
+    """Scale to target_dbfs RMS, never boosting more than max_gain_db or past full scale."""
+    if not len(samples):
+        return samples
+    rms = float(np.sqrt(np.mean(samples.astype(np.float64) ** 2)))
+    peak = float(np.max(np.abs(samples)))
+    if rms <= 0 or peak <= 0:
+        return samples
+    gain = min(10 ** ((target_dbfs - 20 * np.log10(rms)) / 20), 10 ** (max_gain_db / 20), 0.99 / peak)
+    return (samples * gain).astype(np.float32)
+
+
+def frame_features(samples: np.ndarray, frame_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Energy (dBFS) and zero-crossing rate of each whole frame."""
+    frames = samples[:len(samples) - len(samples) % frame_len].reshape(-1, frame_len)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+    return energy_db, zcr
+
+
+def speech_frames(energy_db: np.ndarray, zcr: np.ndarray, energy_threshold_db: float = -40.0,
+                  zcr_threshold: float = 0.25, fricative_margin_db: float = 10.0) -> np.ndarray:
+    """Frames that are loud enough, or somewhat quieter but noisy like a fricative."""
+    return (energy_db > energy_threshold_db) | (
+        (energy_db > energy_threshold_db - fricative_margin_db) & (zcr > zcr_threshold))
+
+
+class RingBuffer:
+    """The most recent `capacity` samples."""
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._end = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, samples: np.ndarray) -> None:
+        capacity = len(self._data)
+        if not capacity:
+            return
+        samples = samples[-capacity:]
+        first = min(len(samples), capacity - self._end)
+        self._data[self._end:self._end + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._end = (self._end + len(samples)) % capacity
+        self._size = min(capacity, self._size + len(samples))
+
+    def read(self) -> np.ndarray:
+        """Contents oldest first, as a new array."""
+        start = (self._end - self._size) % len(self._data) if len(self._data) else 0
+        return np.concatenate((self._data[start:start + self._size],
+                               self._data[:max(0, start + self._size - len(self._data))]))
+
+    def clear(self) -> None:
+        self._end = self._size = 0
+
+
+class SpeechPreprocessor:
+    """Streaming resample, voice activity detection, trimming and normalization.
+
+    feed() takes 16-bit PCM at input_rate and returns a finished utterance (16-bit PCM
+    at target_rate) once silence_ms of silence follows at least min_speech_ms of speech.
+    """
+
+    def __init__(self, input_rate: int, target_rate: int = 16000, frame_ms: int = 30,
+                 energy_threshold_db: float = -40.0, zcr_threshold: float = 0.25,
+                 silence_ms: int = 600, min_speech_ms: int = 200, preroll_ms: int = 300,
+                 max_utterance_s: float = 30.0, target_dbfs: float = -20.0):
+        self.input_rate = check_sample_rate(input_rate)
+        self.sample_rate = target_rate
+        self.frame_len = target_rate * frame_ms // 1000
+        self.frame_ms = frame_ms
+        self.energy_threshold_db = energy_threshold_db
+        self.zcr_threshold = zcr_threshold
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_frames = int(max_utterance_s * 1000 / frame_ms)
+        self.target_dbfs = target_dbfs
+        self._resampler = Resampler(input_rate, target_rate)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._preroll = RingBuffer(target_rate * preroll_ms // 1000)
+        self._chunks: List[np.ndarray] = []
+        self._frames = 0
+        self._speech_frames = 0
+        self._trailing_silence = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._speech_frames > 0
+
+    @property
+    def speech_ms(self) -> int:
+        return self._frames * self.frame_ms
+
+    def speech(self) -> bytes:
+        """The utterance so far as 16-bit PCM, for partial transcripts."""
+        return float_to_pcm16(np.concatenate(self._chunks)) if self._chunks else b""
+
+    def feed(self, pcm: Buffer) -> Optional[bytes]:
+        samples = self._resampler.process(pcm16_to_float(pcm))
+        if len(self._pending):
+            samples = np.concatenate((self._pending, samples))
+        whole = len(samples) - len(samples) % self.frame_len
+        self._pending = samples[whole:]
+        if not whole:
+            return None
+        energy_db, zcr = frame_features(samples[:whole], self.frame_len)
+        speech = speech_frames(energy_db, zcr, self.energy_threshold_db, self.zcr_threshold)
+        done = None
+        # Runs of frames with the same state are handled as one slice
+        edges = np.flatnonzero(np.diff(speech.astype(np.int8))) + 1
+        for start, stop in zip(np.concatenate(([0], edges)), np.concatenate((edges, [len(speech)]))):
+            block = samples[start * self.frame_len:stop * self.frame_len]
+            if speech[start]:
+                if not self._speech_frames:
+                    self._chunks.append(self._preroll.read())
+                    self._preroll.clear()
+                self._chunks.append(block)
+                self._speech_frames += stop - start
+                self._frames += stop - start
+                self._trailing_silence = 0
+            elif not self._speech_frames:
+                self._preroll.write(block)
+            else:
+                # Keep silence only up to the point where it ends the utterance
+                keep = min(stop - start, self.silence_frames - self._trailing_silence)
+                self._chunks.append(block[:keep * self.frame_len])
+                self._frames += keep
+                self._trailing_silence += keep
+                if self._trailing_silence >= self.silence_frames:
+                    utterance = self._take()
+                    if utterance is not None:
+                        done = utterance
+                    self._preroll.write(block[keep * self.frame_len:])
+            if self._frames >= self.max_frames:
+                done = self._take() or done
+        return done
+
+    def flush(self) -> Optional[bytes]:
+        return self._take()
+
+    def _take(self) -> Optional[bytes]:
+        """Finish the utterance; None if it was too short to be speech."""
+        enough = self._speech_frames >= self.min_speech_frames
+        samples = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+        tail = self._trailing_silence * self.frame_len
+        self._chunks = []
+        self._frames = self._speech_frames = self._trailing_silence = 0
+        if not enough:
+            return None
+        # Trailing silence is trimmed, leaving 100 ms so the last word isn't clipped
+        samples = samples[:len(samples) - max(0, tail - self.sample_rate // 10)]
+        return float_to_pcm16(normalize_loudness(samples, self.target_dbfs))
+
+
+def preprocess_utterance(pcm: Buffer, rate: int, target_rate: int = 16000, **options) -> Optional[bytes]:
+    """One complete recording: resampled, trimmed and normalized; None if it holds no speech."""
+    preprocessor = SpeechPreprocessor(rate, target_rate, silence_ms=10 ** 9, max_utterance_s=10 ** 6, **options)
+    utterance = preprocessor.feed(pcm)
+    return utterance if utterance is not None else preprocessor.flush()
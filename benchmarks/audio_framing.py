@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Binary audio frames vs JSON with base64 audio.
+
+Cuts test_samples/test_speech.wav into chunks (20 ms by default) and measures:
+
+    codec      encode + decode per chunk on one core, with no I/O
+    websocket  a loopback WebSocket round trip: the client sends every chunk, the
+               server decodes each one and acknowledges the last
+
+Usage (from the repo root):
+    python -m benchmarks.audio_framing --chunk-ms 20 --repeat 50
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+from pathlib import Path
+
+import websockets
+
+from audioframes import encode_frame, parse_frame
+from voice import wav_to_pcm
+
+SAMPLE = Path(__file__).resolve().parent.parent / "test_samples" / "test_speech.wav"
+SESSION = "bench-session"
+
+
+def json_encode(seq, chunk, rate):
+    return json.dumps({"type": "audio", "session_id": SESSION, "seq": seq, "sample_rate": rate,
+                       "audio": base64.b64encode(chunk).decode("ascii")})
+
+
+def json_decode(message):
+    data = json.loads(message)
+    return base64.b64decode(data["audio"])
+
+
+def frame_encode(seq, chunk, rate):
+    return encode_frame(SESSION, seq, chunk, rate)
+
+
+def frame_decode(message):
+    return parse_frame(message).payload
+
+
+FORMATS = {"json+base64": (json_encode, json_decode), "binary frame": (frame_encode, frame_decode)}
+
+
+def bench_codec(chunks, rate, repeat):
+    results = {}
+    for name, (encode, decode) in FORMATS.items():
+        wire = sum(len(encode(i, c, rate)) for i, c in enumerate(chunks))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for i, chunk in enumerate(chunks):
+                decode(encode(i, chunk, rate))
+        elapsed = time.perf_counter() - start
+        results[name] = (wire, elapsed / (repeat * len(chunks)) * 1e6, repeat * sum(map(len, chunks)) / elapsed / 1e6)
+    return results
+
+
+async def bench_websocket(chunks, rate, repeat):
+    results = {}
+    for name, (encode, decode) in FORMATS.items():
+        async def handler(ws):
+            count = 0
+            async for message in ws:
+                decode(message)
+                count += 1
+                if count % len(chunks) == 0:
+                    await ws.send("ok")
+
+        async with websockets.serve(handler, "127.0.0.1", 0, max_size=None) as server:
+            port = server.sockets[0].getsockname()[1]
+            async with websockets.connect(f"ws://127.0.0.1:{port}", max_size=None) as ws:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    for i, chunk in enumerate(chunks):
+                        await ws.send(encode(i, chunk, rate))
+                    await ws.recv()
+                elapsed = time.perf_counter() - start
+        results[name] = elapsed / (repeat * len(chunks)) * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pcm, rate = wav_to_pcm(SAMPLE.read_bytes())
+    step = rate * args.chunk_ms // 1000 * 2
+    chunks = [pcm[i:i + step] for i in range(0, len(pcm), step)]
+    print(f"{SAMPLE.name}: {len(pcm)} bytes of PCM in {len(chunks)} chunks of {args.chunk_ms} ms\n")
+
+    codec = bench_codec(chunks, rate, args.repeat)
+    ws = asyncio.run(bench_websocket(chunks, rate, args.repeat))
+    print(f"{'format':<14}{'wire bytes':>12}{'overhead':>10}{'codec us/chunk':>16}{'codec MB/s':>12}{'ws us/chunk':>13}")
+    for name, (wire, us, mbps) in codec.items():
+        print(f"{name:<14}{wire:>12}{(wire / len(pcm) - 1) * 100:>9.1f}%{us:>16.2f}{mbps:>12.0f}{ws[name]:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
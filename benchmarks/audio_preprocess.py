@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Real-time factor of the audio preprocessing stage on long recordings.
+
+Builds a recording of --minutes from test_samples/test_speech.wav with a second of
+silence between repeats, converts it to each input rate, then streams it through
+SpeechPreprocessor in --chunk-ms chunks (resample to 16 kHz, VAD, trimming,
+normalization). RTF is processing time over audio duration on one core; 0.01 means
+one core keeps up with 100 live streams.
+
+Usage (from the repo root):
+    python -m benchmarks.audio_preprocess --minutes 10 --chunk-ms 20
+"""
+
+import os
+
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from audioprep import SpeechPreprocessor, float_to_pcm16, pcm16_to_float, preprocess_utterance, resample
+from voice import wav_to_pcm
+
+SAMPLE = Path(__file__).resolve().parent.parent / "test_samples" / "test_speech.wav"
+
+
+def build_recording(minutes, rate):
+    pcm, sample_rate = wav_to_pcm(SAMPLE.read_bytes())
+    speech = pcm16_to_float(pcm)
+    block = np.concatenate((speech, np.zeros(sample_rate, dtype=np.float32)))
+    repeats = int(np.ceil(minutes * 60 * sample_rate / len(block)))
+    recording = np.tile(block, repeats)[:int(minutes * 60 * sample_rate)]
+    if rate != sample_rate:
+        recording = resample(recording, sample_rate, rate)
+    return float_to_pcm16(recording)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    duration = args.minutes * 60
+    print(f"{args.minutes:g} min recording, {args.chunk_ms} ms chunks\n")
+    print(f"{'input rate':<12}{'mode':<12}{'utterances':>11}{'seconds':>10}{'RTF':>10}{'x realtime':>12}")
+    for rate in (16000, 44100, 48000):
+        pcm = build_recording(args.minutes, rate)
+        step = rate * args.chunk_ms // 1000 * 2
+        view = memoryview(pcm)
+        preprocessor = SpeechPreprocessor(rate)
+        utterances = 0
+        start = time.process_time()
+        for i in range(0, len(pcm), step):
+            utterances += preprocessor.feed(view[i:i + step]) is not None
+        utterances += preprocessor.flush() is not None
+        elapsed = time.process_time() - start
+        print(f"{rate:<12}{'streaming':<12}{utterances:>11}{elapsed:>10.2f}{elapsed / duration:>10.4f}"
+              f"{duration / elapsed:>12.0f}")
+
+        start = time.process_time()
+        preprocess_utterance(pcm, rate)
+        elapsed = time.process_time() - start
+        print(f"{rate:<12}{'one-shot':<12}{1:>11}{elapsed:>10.2f}{elapsed / duration:>10.4f}{duration / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
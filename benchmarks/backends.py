@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Local stand-ins for the Hugging Face inference API and LibreTranslate.
+
+They answer in the same response shapes after a configurable delay, so load tests
+measure Virgil itself rather than a third-party service or the network. Point the app
+at them with HUGGINGFACE_API_URL=http://HOST:PORT/inference and
+LIBRETRANSLATE_URL=http://HOST:PORT/translate.
+
+Usage (from the repo root):
+    python -m benchmarks.backends --port 8100 --inference-ms 150 --translate-ms 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+INFERENCE_DELAY = float(os.getenv("VIRGIL_STUB_INFERENCE_MS", "150")) / 1000
+TRANSLATE_DELAY = float(os.getenv("VIRGIL_STUB_TRANSLATE_MS", "30")) / 1000
+REPLY = "Let us walk this path together, one step at a time. " * 4
+
+
+async def _read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return json.loads(body or b"{}")
+
+
+async def _respond(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    """Bare ASGI app so the stand-in costs far less per request than the service under test."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            await send({"type": message["type"] + ".complete"})
+            if message["type"] == "lifespan.shutdown":
+                return
+    data = await _read_json(receive)
+    if scope["path"] == "/inference":
+        await asyncio.sleep(INFERENCE_DELAY)
+        # The real API echoes the prompt before the generated text
+        await _respond(send, 200, [{"generated_text": data.get("inputs", "") + " " + REPLY}])
+    elif scope["path"] == "/translate":
+        await asyncio.sleep(TRANSLATE_DELAY)
+        await _respond(send, 200, {"translatedText": data.get("q", "")[::-1]})
+    else:
+        await _respond(send, 404, {"detail": "Not Found"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--inference-ms", type=float, default=None)
+    parser.add_argument("--translate-ms", type=float, default=None)
+    args = parser.parse_args()
+    if args.inference_ms is not None:
+        os.environ["VIRGIL_STUB_INFERENCE_MS"] = str(args.inference_ms)
+    if args.translate_ms is not None:
+        os.environ["VIRGIL_STUB_TRANSLATE_MS"] = str(args.translate_ms)
+
+    import uvicorn
+    uvicorn.run("benchmarks.backends:app", host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+/history payload size and serialization time for one user with many turns.
+
+Compares the previous path (ORM objects, manual isoformat(), FastAPI's
+jsonable_encoder and the standard JSON encoder) with the current one (column rows and
+FastJSONResponse), then reports the wire size and end-to-end time of GET /history
+with identity, gzip and brotli encodings.
+
+Usage (from the repo root):
+    python -m benchmarks.history_payload --turns 10000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("VIRGIL_DB_URL", f"sqlite:///{tempfile.mkdtemp(prefix='virgil_bench_history_')}/virgil.db")
+os.environ.setdefault("VIRGIL_LOG_LEVEL", "WARNING")
+os.environ.setdefault("VIRGIL_RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("VIRGIL_ARCHIVE_ENABLED", "false")
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import main as virgil
+from fastjson import FastJSONResponse
+
+USER = "bench-history"
+
+
+def seed(turns):
+    db = virgil.SessionLocal()
+    start = datetime(2026, 1, 1)
+    db.add_all(virgil.Conversation(user_id=USER, message=f"Question {i}: how do I keep practising when I feel stuck?",
+                                   response=f"Answer {i}: " + "Small daily steps add up; pick one passage and play it slowly. " * 3,
+                                   timestamp=start + timedelta(minutes=i)) for i in range(turns))
+    db.commit()
+    db.close()
+
+
+def legacy_body():
+    db = virgil.SessionLocal()
+    try:
+        rows = db.query(virgil.Conversation).filter_by(user_id=USER).order_by(virgil.Conversation.timestamp.asc()).all()
+        history = [{"id": h.id, "user_id": h.user_id, "message": h.message, "response": h.response,
+                    "timestamp": h.timestamp.isoformat()} for h in rows]
+        return JSONResponse(jsonable_encoder({"history": history})).body
+    finally:
+        db.close()
+
+
+def current_body():
+    db = virgil.SessionLocal()
+    try:
+        rows = db.query(virgil.Conversation.id, virgil.Conversation.message, virgil.Conversation.response,
+                        virgil.Conversation.timestamp).filter(virgil.Conversation.user_id == USER).order_by(
+            virgil.Conversation.timestamp.asc()).all()
+        history = [{"id": h.id, "user_id": USER, "message": h.message, "response": h.response, "timestamp": h.timestamp}
+                   for h in rows]
+        return FastJSONResponse({"history": history}).body
+    finally:
+        db.close()
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+async def _fetch(encoding, repeat):
+    transport = httpx.ASGITransport(app=virgil.app)
+    samples, size = [], 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://virgil") as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            async with client.stream("GET", "/history", headers={"X-User-Id": USER, "Accept-Encoding": encoding}) as r:
+                size = 0
+                async for chunk in r.aiter_raw():
+                    size += len(chunk)
+            samples.append(time.perf_counter() - start)
+    return size, statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    virgil.Base.metadata.create_all(bind=virgil.engine)
+    seed(args.turns)
+    assert len(legacy_body()) == len(current_body())
+
+    print(f"{'build + serialize':<28}{'ms':>10}")
+    print(f"{'  previous (ORM + encoder)':<28}{_time(legacy_body, args.repeat):>10.1f}")
+    print(f"{'  current (rows + fastjson)':<28}{_time(current_body, args.repeat):>10.1f}")
+    print()
+    print(f"{'GET /history':<28}{'bytes':>10}{'ms':>10}")
+    for encoding in ("identity", "gzip", "br"):
+        size, ms = asyncio.run(_fetch(encoding, args.repeat))
+        print(f"{'  ' + encoding:<28}{size:>10}{ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark for /history/search on a large conversation history.
+
+Seeds a fresh database with synthetic turns (the FTS index is maintained by the same
+triggers the app uses), then times the ranked FTS query against the LIKE scan a client
+would otherwise need.
+
+Usage (from the repo root):
+    python -m benchmarks.history_search --rows 1000000 --users 1000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Keep main from touching the real database when it is imported.
+os.environ.setdefault("VIRGIL_DB_URL", f"sqlite:///{tempfile.gettempdir()}/virgil_bench_import.db")
+
+from sqlalchemy import text
+
+from main import Base, build_fts_query, create_db_engine, ensure_conversation_fts
+
+# Synthetic vocabulary with a Zipf-like frequency curve, so common words appear in most
+# turns and most search terms are comparatively rare, as in real chat text.
+VOCABULARY = [f"w{i:05d}" for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+FTS_SQL = """SELECT c.id, snippet(conversations_fts, 0, '<mark>', '</mark>', '…', 16),
+                    snippet(conversations_fts, 1, '<mark>', '</mark>', '…', 16), bm25(conversations_fts, 1.0, 1.0, 0.0) AS rank
+             FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+             WHERE conversations_fts MATCH :match AND c.user_id = :user_id
+             ORDER BY rank LIMIT 20"""
+
+LIKE_SQL = """SELECT id, message, response FROM conversations
+              WHERE user_id = :user_id AND (message LIKE :pattern OR response LIKE :pattern)
+              ORDER BY timestamp DESC LIMIT 20"""
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=n))
+
+
+def seed(engine, rows, users, batch=20000):
+    rng = random.Random(42)
+    start_ts = datetime.utcnow() - timedelta(days=365)
+    started = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for offset in range(0, rows, batch):
+            chunk = [
+                (f"user-{rng.randrange(users)}", _sentence(rng, 12), _sentence(rng, 40),
+                 (start_ts + timedelta(seconds=offset + i)).isoformat(" "))
+                for i in range(min(batch, rows - offset))
+            ]
+            cursor.executemany(
+                "INSERT INTO conversations (user_id, message, response, timestamp) VALUES (?, ?, ?, ?)", chunk)
+            raw.commit()
+    finally:
+        raw.close()
+    return time.perf_counter() - started
+
+
+def time_queries(engine, sql, make_params, iterations):
+    samples = []
+    with engine.connect() as conn:
+        for i in range(iterations):
+            params = make_params(i)
+            start = time.perf_counter()
+            conn.execute(text(sql), params).all()
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples) * 1000, samples[int(len(samples) * 0.95) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="virgil_bench_search_")
+    engine = create_db_engine(f"sqlite:///{workdir}/bench.db")
+    Base.metadata.create_all(bind=engine)
+    if not ensure_conversation_fts(engine):
+        raise SystemExit("SQLite was built without FTS5")
+
+    elapsed = seed(engine, args.rows, args.users)
+    print(f"seeded {args.rows} rows with incremental indexing in {elapsed:.1f}s ({args.rows / elapsed:.0f} rows/s)")
+
+    rng = random.Random(7)
+    # Search terms from the mid-frequency band, single words and two-word queries
+    band = VOCABULARY[50:2000]
+    terms = [rng.choice(band) + (" " + rng.choice(band) if i % 2 else "") for i in range(args.iterations)]
+    users = [f"user-{rng.randrange(args.users)}" for _ in range(args.iterations)]
+
+    fts = time_queries(engine, FTS_SQL,
+                       lambda i: {"match": build_fts_query(terms[i], users[i]), "user_id": users[i]}, args.iterations)
+    like = time_queries(engine, LIKE_SQL,
+                        lambda i: {"pattern": f"%{terms[i].split()[0]}%", "user_id": users[i]}, args.iterations)
+    print(f"{'query':<12}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"{'fts5 bm25':<12}{fts[0]:>10.2f}{fts[1]:>10.2f}")
+    print(f"{'like scan':<12}{like[0]:>10.2f}{like[1]:>10.2f}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+"""
+End-to-end load test for the Virgil API.
+
+Starts the stand-in backends (benchmarks.backends) and the real app under uvicorn,
+each in its own process with a fresh database, then drives these scenarios over HTTP
+and WebSockets:
+
+    guide       concurrent chat sessions, each sending sequential /guide turns
+    quick       bursts of concurrent /quick-guide requests
+    calculate   closed-loop /calculate traffic for a fixed duration
+    translate   closed-loop /translate traffic for a fixed duration
+    history     /history reads for the sessions created by the guide scenario
+    ws          thousands of /ws/notify sockets held open, then one echo round trip each
+
+Every scenario reports request count, errors, throughput and p50/p95/p99 latency.
+--output writes the report as JSON (with the git commit) and --compare prints the
+change against an earlier report, so runs can be compared across commits.
+
+Usage (from the repo root):
+    python -m benchmarks.load --output before.json
+    python -m benchmarks.load --compare before.json --scenarios guide,history
+    python -m benchmarks.load --url http://127.0.0.1:8000   # an already running server
+    python -m benchmarks.load --workers 4                   # serve.py --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+SCENARIOS = ("guide", "quick", "calculate", "translate", "history", "ws")
+EXPRESSIONS = ["2 + 2", "sqrt(144) * 3", "sin(pi / 4) ** 2 + cos(pi / 4) ** 2", "factorial(12) / 7", "log(1e6, 10)"]
+MESSAGES = [
+    "I keep putting off the work that matters most to me.",
+    "How do I stay calm when a meeting goes badly?",
+    "Remind me why I started learning the cello.",
+    "What should I focus on this week?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Recorder:
+    """Latencies and errors for one scenario."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.started = self.finished = time.perf_counter()
+
+    async def timed(self, coro):
+        start = time.perf_counter()
+        try:
+            response = await coro
+            if getattr(response, "status_code", 200) >= 400:
+                self.errors += 1
+                return response
+        except Exception:
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        return response
+
+    def summary(self):
+        ordered = sorted(self.latencies)
+        elapsed = max(self.finished - self.started, 1e-9)
+        return {
+            "requests": len(ordered) + self.errors,
+            "errors": self.errors,
+            "throughput_rps": round(len(ordered) / elapsed, 1),
+            "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(_percentile(ordered, 95) * 1000, 2),
+            "p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+        }
+
+
+async def _closed_loop(recorder, concurrency, seconds, make_request):
+    deadline = time.perf_counter() + seconds
+
+    async def worker(n):
+        i = n
+        while time.perf_counter() < deadline:
+            await recorder.timed(make_request(i))
+            i += concurrency
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+
+
+async def scenario_guide(client, args, state):
+    recorder = Recorder()
+
+    async def session(n):
+        session_id = f"load-session-{n}"
+        state["sessions"].append(session_id)
+        for turn in range(args.turns):
+            await recorder.timed(client.post("/guide", json={
+                "message": MESSAGES[(n + turn) % len(MESSAGES)], "session_id": session_id, "tone": "supportive"}))
+
+    await asyncio.gather(*(session(n) for n in range(args.sessions)))
+    return recorder
+
+
+async def scenario_quick(client, args, state):
+    recorder = Recorder()
+    for burst in range(args.bursts):
+        await asyncio.gather(*(recorder.timed(client.post("/quick-guide", json={"message": MESSAGES[i % len(MESSAGES)]}))
+                               for i in range(args.burst_size)))
+    return recorder
+
+
+async def scenario_calculate(client, args, state):
+    recorder = Recorder()
+    await _closed_loop(recorder, args.concurrency, args.seconds,
+                       lambda i: client.post("/calculate", json={"expression": EXPRESSIONS[i % len(EXPRESSIONS)]}))
+    return recorder
+
+
+async def scenario_translate(client, args, state):
+    recorder = Recorder()
+    await _closed_loop(recorder, args.concurrency, args.seconds,
+                       lambda i: client.post("/translate", json={"text": MESSAGES[i % len(MESSAGES)], "target": "es"}))
+    return recorder
+
+
+async def scenario_history(client, args, state):
+    recorder = Recorder()
+    sessions = state["sessions"] or [f"load-session-{n}" for n in range(args.sessions)]
+    await _closed_loop(recorder, args.concurrency, args.seconds,
+                       lambda i: client.get("/history", headers={"X-User-Id": sessions[i % len(sessions)]}))
+    return recorder
+
+
+async def scenario_ws(client, args, state):
+    """Open args.sockets connections (connect latency), then time one echo per socket."""
+    connect = Recorder()
+    echo = Recorder()
+    ws_url = str(client.base_url).replace("http", "ws", 1).rstrip("/")
+    gate = asyncio.Semaphore(args.ws_connect_concurrency)
+    sockets = []
+
+    async def open_socket(n):
+        user_id = f"load-ws-{n}"
+        async with gate:
+            ws = await connect.timed(websockets.connect(
+                f"{ws_url}/ws/notify/{user_id}", additional_headers={"X-User-Id": user_id},
+                open_timeout=30, ping_interval=None))
+        if ws is not None:
+            sockets.append(ws)
+
+    async def round_trip(ws):
+        await ws.send("ping")
+        return await ws.recv()
+
+    await asyncio.gather(*(open_socket(n) for n in range(args.sockets)))
+    connect.finished = time.perf_counter()
+    await asyncio.sleep(args.ws_hold)
+    echo.started = time.perf_counter()
+    await asyncio.gather(*(echo.timed(round_trip(ws)) for ws in sockets))
+    echo.finished = time.perf_counter()
+    await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+    state["ws_open"] = len(sockets)
+    return {"ws_connect": connect, "ws_echo": echo}
+
+
+RUNNERS = {
+    "guide": scenario_guide,
+    "quick": scenario_quick,
+    "calculate": scenario_calculate,
+    "translate": scenario_translate,
+    "history": scenario_history,
+    "ws": scenario_ws,
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+def _start_servers(args):
+    """Launch the stand-in backends and the app; returns (base_url, processes)."""
+    workdir = tempfile.mkdtemp(prefix="virgil_load_")
+    stub_port, app_port = _free_port(), _free_port()
+    stub_env = dict(os.environ, VIRGIL_STUB_INFERENCE_MS=str(args.inference_ms),
+                    VIRGIL_STUB_TRANSLATE_MS=str(args.translate_ms))
+    app_env = dict(
+        os.environ,
+        VIRGIL_DB_URL=f"sqlite:///{workdir}/virgil.db",
+        VIRGIL_RETRIEVAL_DIR=f"{workdir}/vectors",
+        VIRGIL_ARCHIVE_DIR=f"{workdir}/archive",
+        VIRGIL_TTS_CACHE_DIR=f"{workdir}/tts_cache",
+        HUGGINGFACE_API_URL=f"http://127.0.0.1:{stub_port}/inference",
+        LIBRETRANSLATE_URL=f"http://127.0.0.1:{stub_port}/translate",
+        # All load comes from one client address; measure the app, not the limiter
+        VIRGIL_RATE_LIMIT_ENABLED=os.environ.get("VIRGIL_RATE_LIMIT_ENABLED", "false"),
+    )
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning", "--no-access-log"]
+    serve = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning",
+             "--no-access-log", "--workers", str(args.workers)]
+    app_env.update(VIRGIL_RATE_LIMIT_DB=f"{workdir}/ratelimit.db", VIRGIL_LOCAL_STORE_DB=f"{workdir}/local.db")
+    processes = [
+        subprocess.Popen(uvicorn + ["--port", str(stub_port), "benchmarks.backends:app"], env=stub_env),
+        subprocess.Popen(serve, env=app_env,
+                         stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL),
+    ]
+    base_url = f"http://127.0.0.1:{app_port}"
+    deadline = time.time() + 60
+    while True:
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=1).status_code == 200:
+                return base_url, processes
+        except httpx.HTTPError:
+            pass
+        if time.time() > deadline or any(p.poll() is not None for p in processes):
+            for p in processes:
+                p.terminate()
+            raise SystemExit("server did not start; rerun with --verbose to see its output")
+        time.sleep(0.2)
+
+
+async def run(base_url, args):
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.sessions, args.burst_size) + 10)
+    report = {}
+    state = {"sessions": []}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        for name in args.scenarios:
+            print(f"running {name}...", file=sys.stderr)
+            result = await RUNNERS[name](client, args, state)
+            if isinstance(result, Recorder):
+                result.finished = time.perf_counter()
+                result = {name: result}
+            for key, recorder in result.items():
+                report[key] = recorder.summary()
+    return report
+
+
+def print_report(report, baseline=None):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+    print(f"{'scenario':<12}" + "".join(f"{c:>16}" for c in columns))
+    for name, row in report.items():
+        cells = []
+        for c in columns:
+            cell = f"{row[c]}"
+            previous = (baseline or {}).get(name, {}).get(c)
+            if previous and c not in ("requests", "errors"):
+                cell += f" ({(row[c] - previous) / previous * 100:+.0f}%)"
+            cells.append(f"{cell:>16}")
+        print(f"{name:<12}" + "".join(cells))
+
+
+def build_parser(description: str = __doc__) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="app worker processes (serve.py --workers)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32, help="workers for the closed-loop scenarios")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of the closed-loop scenarios")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=100)
+    parser.add_argument("--sockets", type=int, default=2000)
+    parser.add_argument("--ws-hold", type=float, default=2, help="seconds to hold all sockets open")
+    parser.add_argument("--ws-connect-concurrency", type=int, default=200)
+    parser.add_argument("--inference-ms", type=float, default=150, help="stand-in inference latency")
+    parser.add_argument("--translate-ms", type=float, default=30, help="stand-in translation latency")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    return parser
+
+
+def parse_scenarios(parser: argparse.ArgumentParser, spec: str):
+    scenarios = [s.strip() for s in spec.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return scenarios
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    args.scenarios = parse_scenarios(parser, args.scenarios)
+
+    # Each socket is a file descriptor on both ends when the server runs locally
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, args.sockets * 2 + 1024))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    processes = []
+    base_url = args.url
+    if not base_url:
+        base_url, processes = _start_servers(args)
+    try:
+        report = asyncio.run(run(base_url, args))
+    finally:
+        for p in processes:
+            p.terminate()
+            p.wait(10)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["scenarios"]
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": _git_commit(),
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+                "scenarios": report,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
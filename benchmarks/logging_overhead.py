@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Logging cost per /guide request on the event loop thread.
+
+Runs the same /guide traffic in-process (the inference call goes to the stand-in
+backend with no delay) under three logging setups and reports the time spent inside
+logging calls on the request path, plus the overall request time:
+
+    sync     a StreamHandler on the root logger writing plain text, which is what
+             logging.basicConfig installed before
+    queued   logsetup.configure_logging: JSON, redaction and sampling, written from a
+             background thread
+    off      no handlers at WARNING, as a floor
+
+Usage (from the repo root):
+    python -m benchmarks.logging_overhead --requests 2000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+# Keep main from touching the real database and make the stand-in answer immediately
+os.environ.setdefault("VIRGIL_DB_URL", f"sqlite:///{tempfile.gettempdir()}/virgil_bench_logging.db")
+os.environ["VIRGIL_STUB_INFERENCE_MS"] = "0"
+os.environ["VIRGIL_SLOW_CALLBACK_MS"] = "0"
+os.environ.setdefault("VIRGIL_RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import main as virgil
+from benchmarks import backends
+from logsetup import configure_logging, parse_sample_rates
+
+_logging_time = [0.0]
+_original_log = logging.Logger._log
+
+
+def _timed_log(self, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return _original_log(self, *args, **kwargs)
+    finally:
+        _logging_time[0] += time.perf_counter() - start
+
+
+def _setup(mode, sink):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == "sync":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    elif mode == "queued":
+        configure_logging("INFO", sample_rates=parse_sample_rates("virgil.requests=0.1,httpx=0.1"), stream=sink)
+    else:
+        root.setLevel(logging.WARNING)
+
+
+async def _drive(client, requests):
+    latencies, logging_costs = [], []
+    for i in range(requests):
+        before = _logging_time[0]
+        start = time.perf_counter()
+        await client.post("/quick-guide", json={"message": f"How do I keep going on day {i}?", "tone": "friendly"})
+        await client.post("/guide", json={"message": f"Tell me about step {i}", "session_id": f"bench-{i % 50}"})
+        latencies.append((time.perf_counter() - start) / 2)
+        logging_costs.append((_logging_time[0] - before) / 2)
+    return latencies, logging_costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    virgil.Base.metadata.create_all(bind=virgil.engine)
+    virgil.HTTP_CLIENT = httpx.AsyncClient(transport=httpx.ASGITransport(app=backends.app), base_url="http://stub")
+    virgil.HUGGINGFACE_API_URL = "http://stub/inference"
+    logging.Logger._log = _timed_log
+
+    print(f"{'mode':<8}{'logging us/req':>16}{'request ms p50':>16}{'request ms p95':>16}")
+    for mode in ("sync", "queued", "off"):
+        with tempfile.TemporaryFile("w+") as sink:
+            _setup(mode, sink)
+
+            async def run():
+                transport = httpx.ASGITransport(app=virgil.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://virgil") as client:
+                    await _drive(client, 50)  # warm up
+                    return await _drive(client, args.requests)
+
+            latencies, costs = asyncio.run(run())
+            latencies.sort()
+            print(f"{mode:<8}{statistics.mean(costs) * 1e6:>16.1f}"
+                  f"{statistics.median(latencies) * 1000:>16.2f}{latencies[int(len(latencies) * 0.95)] * 1000:>16.2f}")
+    logging.Logger._log = _original_log
+
+
+if __name__ == "__main__":
+    main()
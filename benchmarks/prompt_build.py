@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Prompt construction microbenchmark: compiled tone templates vs the old += builder.
+
+The old builder recomputed the system prompt f-string and grew the prompt with
+repeated string concatenation, one copy per history message. The compiled template
+joins the pieces once.
+
+Usage (from the repo root):
+    python -m benchmarks.prompt_build --turns 10 100 1000
+"""
+
+import argparse
+import timeit
+
+from prompts import PromptTemplates, pairs_from_messages
+
+
+def legacy_build(message, previous_messages):
+    """The builder generate_response used before tone templates (history only, no tone)."""
+    formatted_prompt = ""
+    if previous_messages:
+        for msg in previous_messages:
+            if msg["role"] == "user":
+                formatted_prompt += f"<s>[INST] {msg['content']} [/INST]"
+            else:
+                formatted_prompt += f" {msg['content']} </s>"
+    if formatted_prompt:
+        formatted_prompt += f"<s>[INST] {message} [/INST]"
+    else:
+        formatted_prompt = f"<s>[INST] {message} [/INST]"
+    return formatted_prompt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--chars", type=int, default=400, help="characters per message")
+    args = parser.parse_args()
+
+    templates = PromptTemplates.load()
+    print(f"{'turns':>8}{'legacy us':>12}{'compiled us':>14}{'speedup':>10}")
+    for turns in args.turns:
+        messages = []
+        for i in range(turns):
+            messages.append({"role": "user", "content": f"question {i} " + "x" * args.chars})
+            messages.append({"role": "assistant", "content": f"answer {i} " + "y" * args.chars})
+        number = max(10, 20000 // turns)
+        legacy = min(timeit.repeat(lambda: legacy_build("next", messages), number=number, repeat=5)) / number
+        pairs = pairs_from_messages(messages)
+        compiled = min(timeit.repeat(lambda: templates.render("friendly", pairs, "next"),
+                                     number=number, repeat=5)) / number
+        print(f"{turns:>8}{legacy * 1e6:>12.1f}{compiled * 1e6:>14.1f}{legacy / compiled:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Bytes sent upstream per /guide turn over a long conversation.
+
+Drives one session through --turns /guide requests in-process, with the inference call
+going to the stand-in backend, and records each prompt sent upstream. For every turn it
+reports the prompt size and how much of it is a byte-identical prefix of the previous
+turn's prompt, which is the part a prefix/KV cache upstream can reuse. Two modes run:
+
+    cached    the per-session PrefixCache: new turns are appended to the prefix
+    sliding   the previous behaviour: the last MAX_HISTORY_LENGTH turns re-rendered
+              from the database on every request
+
+Usage (from the repo root):
+    python -m benchmarks.prompt_prefix --turns 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+os.environ.setdefault("VIRGIL_DB_URL", f"sqlite:///{tempfile.mkdtemp(prefix='virgil_bench_prefix_')}/virgil.db")
+os.environ["VIRGIL_STUB_INFERENCE_MS"] = "0"
+os.environ["VIRGIL_RETRIEVAL_ENABLED"] = "false"
+os.environ.setdefault("VIRGIL_LOG_LEVEL", "WARNING")
+os.environ.setdefault("VIRGIL_RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+import main as virgil
+from benchmarks import backends
+from prompts import PrefixCache
+
+
+class SlidingWindow(PrefixCache):
+    """Never reuses a prefix and keeps the whole window, as /guide did before."""
+
+    def get(self, session_id, tone, latest_turn_id):
+        return None
+
+    def _fit(self, tone, turns):
+        return list(turns)
+
+
+def _shared_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+async def _run(turns, session_id):
+    prompts = []
+
+    async def recording_backend(scope, receive, send):
+        if scope["type"] == "http":
+            body = b""
+            while True:
+                message = await receive()
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            prompts.append(json.loads(body)["inputs"])
+
+            async def replay():
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await backends.app(scope, replay, send)
+        return await backends.app(scope, receive, send)
+
+    virgil.HTTP_CLIENT = httpx.AsyncClient(transport=httpx.ASGITransport(app=recording_backend), base_url="http://stub")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=virgil.app), base_url="http://virgil") as client:
+        for i in range(turns):
+            await client.post("/guide", json={"message": f"Turn {i}: what should I practise next on the cello?",
+                                              "session_id": session_id})
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--every", type=int, default=20, help="print one row per this many turns")
+    args = parser.parse_args()
+
+    virgil.Base.metadata.create_all(bind=virgil.engine)
+    virgil.HUGGINGFACE_API_URL = "http://stub/inference"
+    results = {}
+    for mode in ("cached", "sliding"):
+        if mode == "sliding":
+            virgil.PROMPT_PREFIXES = SlidingWindow(10 ** 9, virgil.MAX_HISTORY_LENGTH)
+        prompts = asyncio.run(_run(args.turns, f"bench-{mode}"))
+        rows = []
+        previous = ""
+        for prompt in prompts:
+            sent = len(prompt.encode("utf-8"))
+            reusable = len(prompt[:_shared_prefix(previous, prompt)].encode("utf-8"))
+            rows.append((sent, reusable))
+            previous = prompt
+        results[mode] = rows
+
+    print(f"{'turn':>6}" + "".join(f"{m + ' sent':>16}{m + ' reusable':>20}" for m in results))
+    for i in range(0, args.turns, args.every):
+        print(f"{i + 1:>6}" + "".join(f"{rows[i][0]:>16}{rows[i][1]:>20}" for rows in results.values()))
+    print()
+    for mode, rows in results.items():
+        sent = sum(r[0] for r in rows)
+        reusable = sum(r[1] for r in rows)
+        print(f"{mode:<8} total sent {sent} bytes, reusable prefix {reusable} bytes "
+              f"({reusable / sent * 100:.0f}%), new bytes per turn {(sent - reusable) / len(rows):.0f}")
+
+
+if __name__ == "__main__":
+    main()
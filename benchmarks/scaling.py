@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Throughput scaling with the number of worker processes (serve.py --workers).
+
+For each worker count, starts a fresh server the way benchmarks.load does and drives
+the closed-loop scenarios from several client processes at once, so that a single
+client's event loop is not what limits throughput. Prints requests per second per
+scenario and the speedup over the first worker count.
+
+Worker counts above the machine's core count only add contention; the default is
+1, 2, 4, ... up to os.cpu_count(). The router is one more process, and so are the
+clients, so expect sub-linear scaling once they compete with the workers for cores.
+
+Usage (from the repo root):
+    python -m benchmarks.scaling
+    python -m benchmarks.scaling --workers 1,2,4,8 --clients 4 --scenarios calculate,history --output scaling.json
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+from datetime import datetime, timezone
+
+from benchmarks import load
+
+DEFAULT_SCENARIOS = "calculate,history"
+
+
+def _default_worker_counts():
+    counts, n = [], 1
+    while n < (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def _client(base_url, args):
+    return asyncio.run(load.run(base_url, args))
+
+
+def measure(args, workers: int):
+    """One server with this many workers; returns per-scenario totals over all clients."""
+    args.workers = workers
+    base_url, processes = load._start_servers(args)
+    try:
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            reports = pool.starmap(_client, [(base_url, args)] * args.clients)
+    finally:
+        for p in processes:
+            p.terminate()
+            p.wait(60)
+    totals = {}
+    for name in reports[0]:
+        rows = [report[name] for report in reports]
+        totals[name] = {
+            "throughput_rps": round(sum(r["throughput_rps"] for r in rows), 1),
+            "errors": sum(r["errors"] for r in rows),
+            "p50_ms": round(sum(r["p50_ms"] for r in rows) / len(rows), 2),
+            "p99_ms": max(r["p99_ms"] for r in rows),
+        }
+    return totals
+
+
+def main():
+    parser = load.build_parser(__doc__)
+    parser.set_defaults(scenarios=DEFAULT_SCENARIOS, seconds=10.0, concurrency=16)
+    parser.add_argument("--worker-counts", default=",".join(str(n) for n in _default_worker_counts()),
+                        help="comma-separated worker counts to measure")
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="load-generating processes, each with --concurrency requests in flight")
+    args = parser.parse_args()
+    args.scenarios = load.parse_scenarios(parser, args.scenarios)
+    if args.url:
+        parser.error("--url is not supported: each worker count needs its own server")
+    counts = [int(n) for n in args.worker_counts.split(",")]
+
+    results = {}
+    for workers in counts:
+        print(f"measuring {workers} worker(s)...", file=sys.stderr)
+        results[workers] = measure(args, workers)
+
+    print(f"{'scenario':<12}{'workers':>8}{'rps':>12}{'speedup':>10}{'p50_ms':>10}{'p99_ms':>10}{'errors':>8}")
+    for name in results[counts[0]]:
+        base = results[counts[0]][name]["throughput_rps"] or 1e-9
+        for workers in counts:
+            row = results[workers][name]
+            print(f"{name:<12}{workers:>8}{row['throughput_rps']:>12}{row['throughput_rps'] / base:>9.2f}x"
+                  f"{row['p50_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": load._git_commit(),
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "cpu_count": os.cpu_count(),
+                "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+                "workers": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Concurrent read/write benchmark for the SQLite profiles in main.SQLITE_PROFILES.
+
+Writer threads insert conversation turns and reminders while reader threads run the
+same queries /guide, /history and /reminders issue. Each profile gets a fresh database
+file so results are comparable.
+
+Usage (from the repo root):
+    python -m benchmarks.sqlite_profiles --seconds 5 --readers 4 --writers 2
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Keep main from touching the real database when it is imported.
+os.environ.setdefault("VIRGIL_DB_URL", f"sqlite:///{tempfile.gettempdir()}/virgil_bench_import.db")
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from main import SQLITE_PROFILES, MAX_HISTORY_LENGTH, Base, Conversation, PersistentReminder, create_db_engine
+
+USERS = [f"user-{i}" for i in range(50)]
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _writer(Session, stop, latencies, errors):
+    db = Session()
+    while not stop.is_set():
+        user_id = random.choice(USERS)
+        start = time.perf_counter()
+        try:
+            db.add(Conversation(user_id=user_id, message="benchmark message " * 4, response="benchmark reply " * 16))
+            db.add(PersistentReminder(user_id=user_id, message="benchmark reminder",
+                                      remind_at=datetime.utcnow() - timedelta(seconds=1), delivered=False))
+            db.commit()
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            db.rollback()
+            errors.append(1)
+    db.close()
+
+
+def _reader(Session, stop, latencies, errors):
+    db = Session()
+    while not stop.is_set():
+        user_id = random.choice(USERS)
+        start = time.perf_counter()
+        try:
+            db.query(Conversation).filter_by(user_id=user_id).order_by(
+                Conversation.timestamp.desc()).limit(MAX_HISTORY_LENGTH).all()
+            db.query(PersistentReminder).filter_by(user_id=user_id, delivered=False).filter(
+                PersistentReminder.remind_at <= datetime.utcnow()).all()
+            db.commit()
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            db.rollback()
+            errors.append(1)
+    db.close()
+
+
+def run_profile(profile, seconds, readers, writers, seed_rows):
+    """Run one profile against a fresh database and return a result dict."""
+    workdir = tempfile.mkdtemp(prefix=f"virgil_bench_{profile}_")
+    engine = create_db_engine(f"sqlite:///{workdir}/bench.db", profile=profile)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    seed = Session()
+    seed.bulk_save_objects([
+        Conversation(user_id=random.choice(USERS), message="seed message", response="seed reply")
+        for _ in range(seed_rows)
+    ])
+    seed.commit()
+    seed.close()
+
+    stop = threading.Event()
+    write_lat, read_lat, errors = [], [], []
+    threads = [threading.Thread(target=_writer, args=(Session, stop, write_lat, errors)) for _ in range(writers)]
+    threads += [threading.Thread(target=_reader, args=(Session, stop, read_lat, errors)) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    return {
+        "profile": profile,
+        "writes_per_s": len(write_lat) / seconds,
+        "reads_per_s": len(read_lat) / seconds,
+        "write_p50_ms": statistics.median(write_lat) * 1000 if write_lat else 0.0,
+        "write_p95_ms": _percentile(write_lat, 95) * 1000,
+        "read_p50_ms": statistics.median(read_lat) * 1000 if read_lat else 0.0,
+        "read_p95_ms": _percentile(read_lat, 95) * 1000,
+        "busy_errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seed-rows", type=int, default=10000)
+    parser.add_argument("--profiles", nargs="*", default=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    header = f"{'profile':<10}{'writes/s':>10}{'reads/s':>10}{'w p50':>9}{'w p95':>9}{'r p50':>9}{'r p95':>9}{'busy':>6}"
+    print(header)
+    print("-" * len(header))
+    for profile in args.profiles:
+        r = run_profile(profile, args.seconds, args.readers, args.writers, args.seed_rows)
+        print(f"{r['profile']:<10}{r['writes_per_s']:>10.0f}{r['reads_per_s']:>10.0f}"
+              f"{r['write_p50_ms']:>9.2f}{r['write_p95_ms']:>9.2f}"
+              f"{r['read_p50_ms']:>9.2f}{r['read_p95_ms']:>9.2f}{r['busy_errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Time to first audio and whole-reply time for fallback replies, with and without the
+TTS cache.
+
+Every fallback reply is spoken through stream_speech three ways:
+
+    uncached   straight to a backend that takes --synth-ms per sentence (a stand-in
+               for a remote TTS endpoint), which is what every voice turn paid before
+    cold       through CachedTTS on an empty cache directory
+    warm       through CachedTTS after the startup pre-warm, so reads are mmap hits
+
+Usage (from the repo root):
+    python -m benchmarks.tts_cache --synth-ms 250
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from ttscache import AudioCache, CachedTTS
+from voice import StubTTS, stream_speech
+
+
+class SlowTTS(StubTTS):
+    def __init__(self, synth_ms):
+        super().__init__()
+        self.synth_ms = synth_ms
+
+    async def synthesize(self, text, tone="default"):
+        await asyncio.sleep(self.synth_ms / 1000)
+        return await super().synthesize(text, tone)
+
+
+async def speak_all(tts, replies):
+    first, total = [], []
+    for reply in replies:
+        started = time.perf_counter()
+
+        async def send(seq, sentence, audio, last):
+            if seq == 0:
+                first.append(time.perf_counter() - started)
+
+        await stream_speech(tts, reply, send)
+        total.append(time.perf_counter() - started)
+    return first, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synth-ms", type=float, default=250)
+    args = parser.parse_args()
+
+    import main as virgil
+    replies = list(virgil.FALLBACK_TOPIC_RESPONSES.values()) + virgil.FALLBACK_RESPONSES
+    for responses in virgil.TONE_FALLBACK_RESPONSES.values():
+        replies += responses
+    sentences = virgil.fallback_sentences()
+
+    print(f"{len(replies)} replies, {len(sentences)} sentences, {args.synth_ms:.0f} ms per synthesis")
+    print(f"{'mode':<10}{'first audio ms p50':>20}{'reply ms p50':>16}")
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SlowTTS(args.synth_ms)
+        cached = CachedTTS(backend, AudioCache(directory, 256 * 1024 * 1024))
+
+        async def run():
+            results = {"uncached": await speak_all(backend, replies), "cold": await speak_all(cached, replies)}
+            cached.cache.clear()
+            started = time.perf_counter()
+            await cached.prewarm(sentences, ["default"])
+            print(f"(pre-warm of {len(sentences)} sentences took {time.perf_counter() - started:.1f}s)")
+            results["warm"] = await speak_all(cached, replies)
+            return results
+
+        for mode, (first, total) in asyncio.run(run()).items():
+            print(f"{mode:<10}{statistics.median(first) * 1000:>20.2f}{statistics.median(total) * 1000:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
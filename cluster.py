@@ -0,0 +1,400 @@
+"""
+Multi-process mode: a router in front of N single-process workers.
+
+    python serve.py --workers 4 --port 8000
+
+The parent process listens on the public port and runs Router, a small ASGI reverse
+proxy. Each worker is an ordinary serve.py process (the whole app, drain handling
+included) listening on a Unix socket in a private directory. Every request and
+WebSocket of one user or session reaches the same worker, picked on a consistent-hash
+ring from the first of:
+
+    1. an X-Virgil-Worker: <n> header, or ?worker=<n> on /metrics and /admin/ paths,
+       which pins a worker (per-worker scrapes and profiling)
+    2. the id in /ws/notify/{user_id} and /ws/audio/{session_id}
+    3. session_id in a POST /guide body
+    4. the JWT subject (claims are only read here; the worker verifies the token)
+    5. X-User-Id
+    6. the client address
+
+These mirror how main.py identifies a caller, so per-user state in the workers
+(conversation prefixes, ETag versions, notification logs, long polls, sockets) stays
+consistent without being shared. State that belongs to the whole host goes through
+localstore.py and the rate limiter's SQLite buckets; the launcher defaults both to SQLite.
+
+A worker that exits is restarted on the same socket, so the ring and every user's
+worker stay the same. /health and /health/ready are ready only while every worker is;
+/health/live is the router's own. On SIGTERM the router reports draining, forwards
+SIGTERM to the workers so each drains as described in drain.py (their reconnect hints
+and 1012 closes pass through), waits for them to exit, and then stops.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+from jose import jwt
+from jose.exceptions import JOSEError
+from websockets.asyncio.client import unix_connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from health import HealthMonitor
+
+logger = logging.getLogger(__name__)
+
+WORKER_HEADER = b"x-virgil-worker"
+PINNABLE_PATHS = ("/metrics", "/admin/")
+# Answered by the router itself unless a worker is pinned
+HEALTH_PATHS = ("/health", "/health/live", "/health/ready")
+SESSION_BODY_PATHS = ("/guide",)
+MAX_SESSION_BODY = 64 * 1024
+HOP_BY_HOP = frozenset({b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+                        b"te", b"trailer", b"transfer-encoding", b"upgrade"})
+# Set by the WebSocket client library for its own handshake with the worker
+WS_HANDSHAKE = HOP_BY_HOP | {b"host", b"sec-websocket-key", b"sec-websocket-version",
+                             b"sec-websocket-extensions", b"sec-websocket-protocol"}
+TIMEOUTS = {"connect": 5.0, "read": None, "write": 60.0, "pool": None}
+# Close codes that may not be sent in a close frame, and what the client gets instead
+CLOSE_SUBSTITUTES = {1005: 1000, 1006: 1012}
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, each placed at replicas points on the ring."""
+
+    def __init__(self, nodes: Iterable[int], replicas: int = 128):
+        points = sorted((_hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        return self._nodes[bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)]
+
+
+def routing_key(scope, body: bytes = b"") -> str:
+    """The user or session a request belongs to (steps 2-6 in the module docstring)."""
+    path = scope["path"]
+    for prefix in ("/ws/notify/", "/ws/audio/"):
+        if path.startswith(prefix) and len(path) > len(prefix):
+            return path[len(prefix):]
+    if scope["type"] == "http" and scope["method"] == "POST" and path in SESSION_BODY_PATHS \
+            and len(body) <= MAX_SESSION_BODY:
+        try:
+            session_id = json.loads(body).get("session_id", "default")
+        except (ValueError, AttributeError):
+            session_id = None
+        if isinstance(session_id, str) and session_id:
+            return session_id
+    headers = dict(scope["headers"])
+    auth = headers.get(b"authorization", b"")
+    if auth.startswith(b"Bearer "):
+        try:
+            sub = jwt.get_unverified_claims(auth[7:].decode("latin-1")).get("sub")
+        except (JOSEError, AttributeError):
+            sub = None
+        if sub:
+            return str(sub)
+    if headers.get(b"x-user-id"):
+        return headers[b"x-user-id"].decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "guest"
+
+
+def _pinned_worker(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == WORKER_HEADER:
+            return value.decode("latin-1")
+    if scope["path"].startswith(PINNABLE_PATHS):
+        for pair in scope.get("query_string", b"").decode("latin-1").split("&"):
+            if pair.startswith("worker="):
+                return pair[7:]
+    return None
+
+
+def _forwarded_headers(scope, skip: frozenset) -> List[Tuple[bytes, bytes]]:
+    """The request's headers for the worker, with X-Forwarded-For/-Proto set by the router.
+
+    The worker trusts these from any peer, so whatever the client sent in them is
+    replaced rather than extended: the client address is the one the router's own
+    server resolved (proxy headers from FORWARDED_ALLOW_IPS only).
+    """
+    headers = [(k, v) for k, v in scope["headers"]
+               if k not in skip and k not in (b"x-forwarded-for", b"x-forwarded-proto", WORKER_HEADER)]
+    client = scope.get("client")
+    if client:
+        headers.append((b"x-forwarded-for", client[0].encode("latin-1")))
+    headers.append((b"x-forwarded-proto", b"https" if scope.get("scheme") in ("https", "wss") else b"http"))
+    return headers
+
+
+def _target(scope) -> str:
+    target = scope.get("raw_path") or scope["path"].encode("utf-8")
+    if scope.get("query_string"):
+        target += b"?" + scope["query_string"]
+    return target.decode("latin-1")
+
+
+class Backend:
+    """One worker process, reached over its Unix socket."""
+
+    def __init__(self, index: int, socket_path: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.index = index
+        self.socket_path = socket_path
+        # The transport rather than a client, which would add its own default headers
+        self.transport = transport or httpx.AsyncHTTPTransport(
+            uds=socket_path, limits=httpx.Limits(max_connections=None, max_keepalive_connections=256))
+
+    async def request(self, method: str, target: str, headers, body: bytes = b"") -> httpx.Response:
+        request = httpx.Request(method, "http://worker" + target, headers=headers, content=body,
+                                extensions={"timeout": TIMEOUTS})
+        return await self.transport.handle_async_request(request)
+
+    async def connect_websocket(self, target: str, headers, subprotocols: Optional[Sequence[str]]):
+        return await unix_connect(self.socket_path, uri=f"ws://worker{target}", additional_headers=headers,
+                                  subprotocols=subprotocols or None, compression=None, max_size=None,
+                                  ping_interval=None, open_timeout=10)
+
+    async def check_ready(self) -> Dict[str, str]:
+        """Health probe: the worker's own readiness, which must be ok or degraded."""
+        response = await self.request("GET", "/health/ready", [(b"host", b"worker")])
+        try:
+            await response.aread()
+            status = response.json().get("status", "unknown")
+        finally:
+            await response.aclose()
+        if response.status_code != 200:
+            raise RuntimeError(f"worker {self.index} is {status}")
+        return {"worker_status": status}
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class WorkerPool:
+    """Starts one process per socket path and restarts any that exit."""
+
+    def __init__(self, command: List[str], socket_paths: List[str], env: Optional[Dict[str, str]] = None):
+        self.command = command
+        self.socket_paths = socket_paths
+        self.env = dict(os.environ if env is None else env)
+        self.processes: List[Optional[subprocess.Popen]] = [None] * len(socket_paths)
+        self.stopping = False
+        self._started = [0.0] * len(socket_paths)
+        self._failures = [0] * len(socket_paths)
+        self._restart_at: List[Optional[float]] = [None] * len(socket_paths)
+
+    def _spawn(self, index: int) -> None:
+        env = dict(self.env, VIRGIL_WORKER_INDEX=str(index), VIRGIL_WORKER_COUNT=str(len(self.socket_paths)))
+        self.processes[index] = subprocess.Popen(self.command + ["--uds", self.socket_paths[index]], env=env)
+        self._started[index] = time.monotonic()
+
+    async def start(self, timeout: float = 60.0) -> None:
+        """Start worker 0, wait until it listens, then the rest.
+
+        The first worker to import the app creates or migrates the database schema, which
+        must not happen in several processes at once.
+        """
+        self._spawn(0)
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(self.socket_paths[0]) and time.monotonic() < deadline:
+            if self.processes[0].poll() is not None:
+                break
+            await asyncio.sleep(0.1)
+        for index in range(1, len(self.socket_paths)):
+            self._spawn(index)
+        logger.info(f"Started {len(self.socket_paths)} workers")
+
+    async def supervise(self, interval: float = 1.0) -> None:
+        """Restart exited workers; one that keeps dying soon after starting backs off up to 30s."""
+        while not self.stopping:
+            now = time.monotonic()
+            for index, process in enumerate(self.processes):
+                if process is None or process.poll() is None:
+                    continue
+                if self._restart_at[index] is None:
+                    early = now - self._started[index] < 10
+                    self._failures[index] = self._failures[index] + 1 if early else 0
+                    delay = min(30.0, 2.0 ** self._failures[index] - 1)
+                    logger.warning(f"Worker {index} exited with {process.returncode}; restarting in {delay:g}s")
+                    self._restart_at[index] = now + delay
+                if now >= self._restart_at[index]:
+                    self._restart_at[index] = None
+                    self._spawn(index)
+            await asyncio.sleep(interval)
+
+    def alive(self) -> List[subprocess.Popen]:
+        return [p for p in self.processes if p is not None and p.poll() is None]
+
+    async def stop(self, timeout: float) -> None:
+        """SIGTERM every worker (each drains), then SIGKILL whatever is left after timeout."""
+        self.stopping = True
+        for process in self.alive():
+            process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while self.alive() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for process in self.alive():
+            logger.warning(f"Worker pid {process.pid} did not exit in {timeout:g}s; killing it")
+            process.kill()
+        for process in self.processes:
+            if process is not None:
+                process.wait()
+
+
+class Router:
+    """ASGI app forwarding each request or WebSocket to the worker that owns its key."""
+
+    def __init__(self, backends: List[Backend], pool: Optional[WorkerPool] = None, drain_timeout: float = 20.0,
+                 health_interval: float = 2.0, health_timeout: float = 3.0):
+        self.backends = backends
+        self.pool = pool
+        self.drain_timeout = drain_timeout
+        self.ring = HashRing(range(len(backends)))
+        self.health = HealthMonitor(interval=health_interval, timeout=health_timeout)
+        for backend in backends:
+            self.health.add(f"worker-{backend.index}", backend.check_ready)
+        self._tasks: List[asyncio.Task] = []
+
+    def pick(self, scope, body: bytes = b"") -> Backend:
+        pinned = _pinned_worker(scope)
+        if pinned is not None and pinned.isdigit() and int(pinned) < len(self.backends):
+            return self.backends[int(pinned)]
+        return self.backends[self.ring.node_for(routing_key(scope, body))]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            if scope["path"] in HEALTH_PATHS and _pinned_worker(scope) is None:
+                return await self._health(scope, send)
+            return await self._http(scope, receive, send)
+        if scope["type"] == "websocket":
+            return await self._websocket(scope, receive, send)
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.pool is not None:
+                    await self.pool.start()
+                    self._tasks.append(asyncio.ensure_future(self.pool.supervise()))
+                self._tasks.append(asyncio.ensure_future(self.health.run()))
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.pool is not None and self.pool.alive():
+                    await self.pool.stop(timeout=5.0)
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                await asyncio.gather(*(backend.aclose() for backend in self.backends))
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def drain(self) -> None:
+        """Report draining, then let every worker drain and exit (serve.py calls this on SIGTERM)."""
+        if self.health.draining:
+            return
+        self.health.draining = True
+        logger.info(f"Draining {len(self.backends)} workers")
+        if self.pool is not None:
+            # Each worker has drain_timeout for its own requests, plus time to shut down
+            await self.pool.stop(self.drain_timeout + 10.0)
+
+    async def _health(self, scope, send) -> None:
+        if scope["path"] == "/health/live":
+            report = self.health.live()
+            ok = report["status"] == "ok"
+        else:
+            report = self.health.ready()
+            ok = HealthMonitor.is_ready(report)
+        await _respond(send, 200 if ok else 503, report, [(b"cache-control", b"no-store")])
+
+    async def _http(self, scope, receive, send) -> None:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        backend = self.pick(scope, body)
+        try:
+            response = await backend.request(scope["method"], _target(scope), _forwarded_headers(scope, HOP_BY_HOP), body)
+        except httpx.TransportError as e:
+            logger.warning(f"Worker {backend.index} unreachable: {type(e).__name__}: {e}")
+            return await _respond(send, 503, {"detail": "Worker unavailable"}, [(b"retry-after", b"1")])
+        try:
+            headers = [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_BY_HOP]
+            headers.append((WORKER_HEADER, str(backend.index).encode()))
+            await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+            async for chunk in response.stream:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def _websocket(self, scope, receive, send) -> None:
+        if (await receive())["type"] != "websocket.connect":
+            return
+        backend = self.pick(scope)
+        headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in _forwarded_headers(scope, WS_HANDSHAKE)]
+        try:
+            upstream = await backend.connect_websocket(_target(scope), headers, scope.get("subprotocols"))
+        except (InvalidHandshake, OSError, asyncio.TimeoutError):
+            # Refused by the worker (auth, draining) or unreachable: refuse the client too
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        await send({"type": "websocket.accept", "subprotocol": upstream.subprotocol,
+                    "headers": [(WORKER_HEADER, str(backend.index).encode())]})
+
+        async def client_to_worker():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    await upstream.send(message["bytes"])
+                else:
+                    await upstream.send(message.get("text") or "")
+
+        async def worker_to_client():
+            try:
+                async for data in upstream:
+                    if isinstance(data, str):
+                        await send({"type": "websocket.send", "text": data})
+                    else:
+                        await send({"type": "websocket.send", "bytes": data})
+            except ConnectionClosed:
+                pass
+            code = upstream.close_code or 1000
+            await send({"type": "websocket.close", "code": CLOSE_SUBSTITUTES.get(code, code),
+                        "reason": upstream.close_reason or ""})
+
+        tasks = [asyncio.ensure_future(client_to_worker()), asyncio.ensure_future(worker_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+
+
+async def _respond(send, status: int, content, headers: Sequence[Tuple[bytes, bytes]] = ()) -> None:
+    body = json.dumps(content).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers]})
+    await send({"type": "http.response.body", "body": body})
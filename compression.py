@@ -0,0 +1,113 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Brotli is used when the client accepts it and the optional ``brotli`` package is
+installed, otherwise gzip. Bodies under minimum_size, responses that already carry a
+Content-Encoding, and event streams are passed through untouched. Streaming responses
+are compressed chunk by chunk.
+"""
+
+import zlib
+from typing import Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - exercised only without the optional dependency
+    brotli = None
+
+DEFAULT_SKIP_TYPES = (b"text/event-stream", b"image/", b"audio/", b"video/", b"application/zip")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q=0."""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=brotli_quality)
+            self.compress, self.finish = self._c.process, self._c.finish
+        else:
+            self._c = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self.finish = self._c.compress, self._c.flush
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 skip_types: Sequence[bytes] = DEFAULT_SKIP_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.skip_types = tuple(skip_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = b""
+        for name, value in scope.get("headers", ()):
+            if name == b"accept-encoding":
+                accept = value
+                break
+        encoding = choose_encoding(accept.decode("latin-1")) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = dict(message.get("headers", ()))
+                content_type = headers.get(b"content-type", b"")
+                if b"content-encoding" in headers or content_type.startswith(self.skip_types):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                if not more and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = [(k, v) for k, v in start.get("headers", ())
+                           if k not in (b"content-length", b"vary")]
+                vary = dict(start.get("headers", ())).get(b"vary")
+                headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more:
+                    data = compressor.compress(body) + compressor.finish()
+                    headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start, "headers": headers})
+                    return await send({"type": "http.response.body", "body": data})
+                await send({**start, "headers": headers})
+            data = compressor.compress(body)
+            if not more:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
+
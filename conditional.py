@@ -0,0 +1,127 @@
+"""
+ETags and conditional GET.
+
+VersionCounter keeps a version per key (e.g. per user) that is bumped whenever the
+data behind a response changes, so an ETag can be derived and checked without reading
+the data. Versions come from one process-wide sequence and every ETag carries a
+random per-process token, so a tag is never reused with a different meaning: not after
+a restart, and not after a key is evicted and counted again from scratch. Data that
+changes by itself at a known time (a reminder falling due) registers that time with
+expire_at, and the version moves on once it has passed. Listeners registered with listen
+are called with the key on every bump (None for bump_all); longpoll.py uses them to wake
+parked requests.
+
+The ETags are weak (W/"...") because the compression middleware may re-encode the body.
+"""
+
+import hashlib
+import itertools
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Response
+
+PROCESS_TOKEN = secrets.token_hex(4)
+
+
+class VersionCounter:
+    """Monotonic per-key versions in a bounded LRU map.
+
+    A key that was never bumped, or was evicted, reports the floor: the highest version
+    handed out to any evicted key. Eviction can therefore only make a version go up,
+    which at worst costs a client one full response.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._expiry: Dict[str, float] = {}
+        self._sequence = itertools.count(1)
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+    def get(self, key: str, now: Optional[float] = None) -> int:
+        with self._lock:
+            expires = self._expiry.get(key)
+            if expires is not None and (time.time() if now is None else now) >= expires:
+                return self._bump(key)
+            return self._versions.get(key, self._floor)
+
+    def bump(self, key: str) -> int:
+        with self._lock:
+            return self._bump(key)
+
+    def expire_at(self, key: str, when: float) -> None:
+        """Move key to a new version once time.time() reaches when."""
+        with self._lock:
+            if key not in self._versions:
+                self._versions[key] = self._floor
+                self._evict()
+            self._expiry[key] = when
+
+    def expires(self, key: str) -> Optional[float]:
+        """When key's registered expiry falls, if it has one."""
+        with self._lock:
+            return self._expiry.get(key)
+
+    def bump_all(self) -> None:
+        """Invalidate every key at once, e.g. after a bulk rewrite."""
+        with self._lock:
+            self._versions.clear()
+            self._expiry.clear()
+            self._floor = next(self._sequence)
+            for listener in self._listeners:
+                listener(None)
+
+    def listen(self, callback: Callable[[Optional[str]], None]) -> None:
+        """Call callback(key) on every bump; it runs under the lock and must not block."""
+        self._listeners.append(callback)
+
+    def _bump(self, key: str) -> int:
+        version = next(self._sequence)
+        self._versions[key] = version
+        self._versions.move_to_end(key)
+        self._expiry.pop(key, None)
+        self._evict()
+        for listener in self._listeners:
+            listener(key)
+        return version
+
+    def _evict(self) -> None:
+        while len(self._versions) > self.max_keys:
+            evicted_key, evicted = self._versions.popitem(last=False)
+            if self._expiry.pop(evicted_key, None) is not None:
+                # Its pending expiry is forgotten, so move past any tag issued for it
+                evicted = next(self._sequence)
+            self._floor = max(self._floor, evicted)
+
+
+def make_etag(*parts) -> str:
+    return 'W/"' + "-".join(str(p) for p in (PROCESS_TOKEN,) + parts) + '"'
+
+
+def content_etag(body: bytes) -> str:
+    """ETag for a response whose body is fixed for the life of the process."""
+    return make_etag(hashlib.sha256(body).hexdigest()[:16])
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against etag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
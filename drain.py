@@ -0,0 +1,78 @@
+"""
+Graceful draining for rolling deploys.
+
+Draining takes a worker out of rotation before it exits, in this order:
+
+    1. readiness reports "draining" (503) so the load balancer stops sending traffic,
+       and new WebSockets are refused
+    2. connected WebSocket clients get a reconnect hint with a random delay, spreading
+       their reconnects over a window instead of all at once
+    3. in-flight HTTP requests and voice turns get until the deadline to finish
+    4. the WebSockets are closed with code 1012 (service restart)
+
+Drainer holds the state and counts in-flight work; InFlightMiddleware counts HTTP
+requests. Plain uvicorn closes listening sockets and WebSockets as soon as it gets SIGTERM,
+before the app's shutdown handlers run, so serve.py runs the drain first and only then
+lets the server stop.
+"""
+
+import asyncio
+import contextlib
+import random
+from typing import Any, Dict, Optional
+
+CLOSE_SERVICE_RESTART = 1012
+
+
+class Drainer:
+    def __init__(self):
+        self.draining = False
+        self._inflight = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @contextlib.contextmanager
+    def track(self):
+        """Count the enclosed work as in flight."""
+        self._inflight += 1
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            if not self._inflight and self._idle is not None:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait until nothing is in flight; False if the timeout came first."""
+        if not self._inflight:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._idle = None
+
+
+class InFlightMiddleware:
+    """Counts HTTP requests in flight on a Drainer."""
+
+    def __init__(self, app, drainer: Drainer):
+        self.app = app
+        self.drainer = drainer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with self.drainer.track():
+            await self.app(scope, receive, send)
+
+
+def reconnect_hint(jitter_seconds: float) -> Dict[str, Any]:
+    return {"type": "reconnect", "reason": "server restart",
+            "retry_after_ms": int(random.uniform(0, jitter_seconds) * 1000)}
@@ -0,0 +1,71 @@
+"""
+JSON responses through orjson when it is installed, with datetime support either way.
+
+orjson is an optional dependency: without it FastJSONResponse falls back to the
+standard library encoder, so endpoints can return datetimes directly in both cases.
+Endpoints returning a FastJSONResponse themselves also skip FastAPI's
+jsonable_encoder pass, which dominates the cost for large lists of plain dicts.
+
+Both encoders give the same output where orjson has limits: integers wider than 64 bits
+go through the standard library encoder, and NaN/inf become null on either path.
+"""
+
+import json
+import math
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without the optional dependency
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(obj: Any):
+    """obj with NaN/inf floats replaced by None, as orjson writes them."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    try:
+        text = json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    except ValueError:
+        text = json.dumps(_finite(content), default=_default, ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":"))
+    return text.encode("utf-8")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        try:
+            # Naive datetimes come out as isoformat() does; NaN/inf become null instead of failing
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        except (orjson.JSONEncodeError, TypeError):
+            pass  # e.g. an int wider than 64 bits, which the standard library encodes exactly
+    return _stdlib_dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
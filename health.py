@@ -0,0 +1,144 @@
+"""
+Liveness and readiness from cached background probes.
+
+Load balancers poll health endpoints every few seconds from every node, so a check that
+reached the database or the inference endpoint on each poll would multiply upstream
+traffic and make a slow dependency look like a dead server. HealthMonitor instead runs
+the registered probes on a background schedule, each with a timeout, and the endpoints
+only read the latest results:
+
+    live    the process is up and its event loop is responsive (recent lag under a limit)
+    ready   live, every critical probe passed recently, and not draining (see drain.py)
+
+A probe is an async function returning a dict of details, or raising on failure. A
+non-critical probe that fails (say, translation) marks the service "degraded" without
+taking it out of rotation. A result older than stale_after seconds counts as a failure,
+so a wedged probe loop cannot keep reporting the last good answer.
+
+Event-loop lag is measured by a ticker that sleeps lag_interval and records how late it
+woke up; the report carries the latest and the worst over the last few seconds.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Check = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class Probe:
+    def __init__(self, name: str, check: Check, critical: bool = True):
+        self.name = name
+        self.check = check
+        self.critical = critical
+        self.result: Optional[Dict[str, Any]] = None
+
+
+class HealthMonitor:
+    """Runs dependency probes in the background and answers health checks from their results."""
+
+    def __init__(self, interval: float = 10.0, timeout: float = 3.0, stale_after: Optional[float] = None,
+                 max_lag_ms: float = 1000.0, lag_interval: float = 0.25, lag_window: int = 20):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after if stale_after is not None else 3 * interval + timeout
+        self.max_lag = max_lag_ms / 1000
+        self.lag_interval = lag_interval
+        self.probes: List[Probe] = []
+        self.started_at = time.time()
+        self.draining = False
+        self._lags: "deque[float]" = deque(maxlen=lag_window)
+        self._extra: Dict[str, Callable[[], Any]] = {}
+
+    def add(self, name: str, check: Check, critical: bool = True) -> None:
+        self.probes.append(Probe(name, check, critical))
+
+    def report(self, name: str, value: Callable[[], Any]) -> None:
+        """Add a cheap in-process value (e.g. connection counts) to every report."""
+        self._extra[name] = value
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self._run(probe) for probe in self.probes))
+
+    async def run(self) -> None:
+        """Probe loop plus lag ticker; run as a background task."""
+        ticker = asyncio.ensure_future(self._measure_lag())
+        try:
+            while True:
+                await self.check_all()
+                await asyncio.sleep(self.interval)
+        finally:
+            ticker.cancel()
+
+    async def _run(self, probe: Probe) -> None:
+        started = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(probe.check(), self.timeout)
+            result = {"status": "ok"}
+            result.update(details or {})
+        except asyncio.TimeoutError:
+            result = {"status": "fail", "error": f"timed out after {self.timeout:g}s"}
+        except Exception as e:
+            result = {"status": "fail", "error": f"{type(e).__name__}: {e}"[:200]}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["checked_at"] = time.time()
+        if probe.result is not None and probe.result["status"] != result["status"]:
+            log = logger.info if result["status"] == "ok" else logger.warning
+            log(f"Health probe {probe.name}: {probe.result['status']} -> {result['status']}"
+                f"{' (' + result['error'] + ')' if 'error' in result else ''}")
+        probe.result = result
+
+    async def _measure_lag(self) -> None:
+        while True:
+            expected = time.monotonic() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self._lags.append(max(0.0, time.monotonic() - expected))
+
+    def lag(self) -> Dict[str, float]:
+        return {
+            "last_ms": round(self._lags[-1] * 1000, 1) if self._lags else 0.0,
+            "max_ms": round(max(self._lags) * 1000, 1) if self._lags else 0.0,
+        }
+
+    def live(self) -> Dict[str, Any]:
+        lag = self.lag()
+        ok = lag["max_ms"] <= self.max_lag * 1000
+        return {"status": "ok" if ok else "fail", "uptime_seconds": round(time.time() - self.started_at, 1),
+                "event_loop_lag": lag}
+
+    def ready(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Readiness report; its "status" is "ok", "degraded", "starting", "draining" or "fail"."""
+        now = time.time() if now is None else now
+        checks, failed, degraded, pending = {}, False, False, False
+        for probe in self.probes:
+            result = dict(probe.result) if probe.result is not None else {"status": "pending"}
+            if result["status"] == "ok" and now - result["checked_at"] > self.stale_after:
+                result["status"] = "stale"
+            result["critical"] = probe.critical
+            checks[probe.name] = result
+            if result["status"] == "pending":
+                pending = pending or probe.critical
+            elif result["status"] != "ok":
+                failed = failed or probe.critical
+                degraded = degraded or not probe.critical
+        live = self.live()
+        if self.draining:
+            status = "draining"
+        elif failed or live["status"] != "ok":
+            status = "fail"
+        elif pending:
+            status = "starting"
+        else:
+            status = "degraded" if degraded else "ok"
+        report = {"status": status, "checks": checks, "event_loop_lag": live["event_loop_lag"]}
+        for name, value in self._extra.items():
+            report[name] = value()
+        return report
+
+    @staticmethod
+    def is_ready(report: Dict[str, Any]) -> bool:
+        return report["status"] in ("ok", "degraded")
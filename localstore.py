@@ -0,0 +1,123 @@
+"""
+Small key-value store for the state that has to agree across the workers of one host.
+
+Under serve.py --workers N, each user's requests and WebSockets are pinned to one worker
+(see cluster.py), so per-user state such as conversation prefixes, ETag versions,
+notification logs and sockets can stay in process. What remains is state that belongs to
+the host rather than to a user:
+
+    leases       which worker runs a host-wide job (archive maintenance, TTS pre-warm)
+    generations  counters a worker bumps so the others drop caches (e.g. after archiving)
+
+MemoryStore keeps them in the process, which is all a single worker needs. SQLiteStore
+shares them between processes through a small SQLite file, like ratelimit.SQLiteBucketStore.
+Values are strings; every method is a short, blocking call.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class MemoryStore:
+    """Per-process store; expired entries are dropped when next read."""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._entries[key]
+            return None
+        return entry[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key, time.time())
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._live(key, time.time()) or 0) + 1
+            self._entries[key] = (str(value), None)
+            return value
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease key for owner; False while another owner holds it."""
+        with self._lock:
+            now = time.time()
+            holder = self._live(key, now)
+            if holder is not None and holder != owner:
+                return False
+            self._entries[key] = (owner, now + ttl)
+            return True
+
+
+class SQLiteStore:
+    """Store shared by every worker on a host through one SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute("CREATE TABLE IF NOT EXISTS local_store "
+                                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT value FROM local_store WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._connect().execute("INSERT OR REPLACE INTO local_store (key, value, expires) VALUES (?, ?, ?)",
+                                (key, value, time.time() + ttl if ttl else None))
+
+    def incr(self, key: str) -> int:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM local_store WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row else 1
+            conn.execute("INSERT OR REPLACE INTO local_store (key, value, expires) VALUES (?, ?, NULL)",
+                         (key, str(value)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease key for owner; False while another owner holds it."""
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO local_store (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE local_store.value = excluded.value OR local_store.expires <= ?",
+            (key, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+
+def make_local_store(backend: str, path: str = ""):
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sqlite":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown local store backend: {backend!r} (expected 'memory' or 'sqlite')")
@@ -0,0 +1,171 @@
+"""
+Structured, non-blocking logging.
+
+configure_logging() replaces the root handlers with a QueueHandler. Records are
+filtered (sampling, redaction) and flattened on the calling thread, which is cheap,
+then a QueueListener thread does the JSON formatting and the write. A full queue drops
+the record and counts it rather than blocking the event loop.
+
+User content never goes into log messages. Pass it as an extra field named in
+REDACTED_FIELDS (``extra={"user_message": message}``); the field is logged as its
+length unless VIRGIL_LOG_CONTENT=true.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+REDACTED_FIELDS = frozenset({"user_message", "reply", "prompt"})
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "logger=rate,logger=rate" into a dict, e.g. "main.requests=0.1"."""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in every 1/rate records at INFO and below for the configured loggers.
+
+    A rate applies to the named logger and its children. WARNING and above always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rate_for(self, name: str) -> Optional[float]:
+        while True:
+            if name in self.rates:
+                return self.rates[name]
+            if "." not in name:
+                return None
+            name = name.rsplit(".", 1)[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate_for(record.name)
+        if rate is None or rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        every = round(1 / rate)
+        with self._lock:
+            count = self._counters.get(record.name, 0)
+            self._counters[record.name] = count + 1
+        if count % every:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class RedactingFilter(logging.Filter):
+    """Replaces user-content extras with their length."""
+
+    def __init__(self, log_content: bool = False):
+        super().__init__()
+        self.log_content = log_content
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.log_content:
+            for field in REDACTED_FIELDS:
+                value = record.__dict__.get(field)
+                if value is not None:
+                    record.__dict__[field] = f"<redacted {len(str(value))} chars>"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, then any extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args and tracebacks now: they may reference objects that change later
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = "INFO", json_format: bool = True, sample_rates: Optional[Dict[str, float]] = None,
+                      log_content: bool = False, queue_size: int = 10000, stream=None) -> NonBlockingQueueHandler:
+    """Install the queue-based pipeline on the root logger; returns the queue handler."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(SamplingFilter(sample_rates or {}))
+    handler.addFilter(RedactingFilter(log_content))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    return handler
+
+
+def shutdown_logging() -> None:
+    """Flush queued records; registered with atexit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
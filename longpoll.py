@@ -0,0 +1,93 @@
+"""
+Long-polling on top of conditional.VersionCounter.
+
+Clients that cannot hold a WebSocket poll GET /reminders. With wait=<seconds> and the
+ETag of their last empty answer, the request is parked here instead of getting a 304
+straight away, and released as soon as the user's version moves on: a bump (a reminder
+scheduled, delivered or deleted) or the expiry registered for the next reminder falling
+due. Only then does the handler query the database, so a client polling in a loop costs
+one query per change rather than one per poll, and hears about a due reminder within
+moments instead of at its next poll.
+
+Parked requests hold no database session, only a socket and an asyncio.Event. Beyond
+max_waiters the wait is refused and the request answers at once, as a plain poll would.
+close() releases every parked request, e.g. when the worker starts draining.
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from conditional import VersionCounter
+
+# Wake a little after an expiry so VersionCounter.get sees it has passed
+EXPIRY_SLACK = 0.01
+
+
+class VersionWaiters:
+    """Lets requests wait for a key of a VersionCounter to move past a version."""
+
+    def __init__(self, versions: VersionCounter, max_waiters: int = 10000):
+        self.versions = versions
+        self.max_waiters = max_waiters
+        self.closed = False
+        self._waiting: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+        versions.listen(self.wake)
+
+    @property
+    def waiting(self) -> int:
+        return self._count
+
+    async def wait(self, key: str, version: int, timeout: float) -> bool:
+        """Wait up to timeout seconds for key to move past version; True if it did."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        waiter = (loop, asyncio.Event())
+        with self._lock:
+            refused = self.closed or self._count >= self.max_waiters
+            if not refused:
+                self._waiting[key].add(waiter)
+                self._count += 1
+        if refused:
+            return self.versions.get(key) != version
+        try:
+            while True:
+                # Clear before checking, so a wake between the check and the wait is not lost
+                waiter[1].clear()
+                if self.versions.get(key) != version:
+                    return True
+                remaining = deadline - loop.time()
+                if remaining <= 0 or self.closed:
+                    return False
+                expires = self.versions.expires(key)
+                if expires is not None:
+                    remaining = min(remaining, max(0.0, expires - time.time()) + EXPIRY_SLACK)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                self._waiting[key].discard(waiter)
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                self._count -= 1
+
+    def wake(self, key: Optional[str]) -> None:
+        """Release the waiters on key (all of them for None) to re-check their version."""
+        with self._lock:
+            if key is None:
+                waiters = [w for ws in self._waiting.values() for w in ws]
+            else:
+                waiters = list(self._waiting.get(key, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def close(self) -> None:
+        """Release every parked request and refuse new waits."""
+        self.closed = True
+        self.wake(None)
@@ -6,23 +6,57 @@ import time
 import logging
 import random
 import uuid
+import socket
 import math
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
-from fastapi import FastAPI, Request, Response, HTTPException, Depends, WebSocket, WebSocketDisconnect
+import threading
+import base64
+import re
+import wave
+from typing import Dict, Any, List, Optional, Set
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, WebSocket, WebSocketDisconnect, BackgroundTasks, Query
 from jose import JWTError, jwt
 from pydantic import BaseModel
 import asyncio
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import create_engine, event, func, text, Column, Index, Integer, String, DateTime, Text, Boolean
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from retrieval import RetrievalIndex, select_context_turns
+from archive import ConversationArchive, checkpoint_database, compact_database
+from notifications import NotificationLog
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, MetricsRegistry
+from tracing import OTLPFileExporter, Tracer
+from profiler import LoopWatchdog, ProfilerBusy, SamplingProfiler, format_collapsed
+from logsetup import configure_logging, parse_sample_rates
+from prompts import PrefixCache, PromptTemplates, pairs_from_messages
+from localstore import make_local_store
+from ratelimit import Limit, RateLimiter, RateLimitMiddleware, make_store, parse_route_limits
+from drain import CLOSE_SERVICE_RESTART, Drainer, InFlightMiddleware, reconnect_hint
+from fastjson import FastJSONResponse, dumps
+from health import HealthMonitor
+from recurrence import parse_rule
+from conditional import VersionCounter, content_etag, etag_matches, make_etag, not_modified
+from longpoll import VersionWaiters
+from audioframes import CODEC_PCM16, CODEC_WAV, FLAG_END, FrameError, encode_frame, is_frame, parse_frame
+from audioprep import SpeechPreprocessor, check_sample_rate, preprocess_utterance
+from ttscache import AudioCache, CachedTTS
+from voice import is_wav, make_stt, make_tts, split_sentences, stream_speech, wav_sample_rate, wav_to_pcm
+from compression import CompressionMiddleware
 
 # --- APP INIT ---
-logging.basicConfig(level=logging.INFO)
+# JSON lines through a background queue; per-request INFO lines ("virgil.requests", httpx) are sampled
+configure_logging(
+    level=os.getenv("VIRGIL_LOG_LEVEL", "INFO"),
+    json_format=os.getenv("VIRGIL_LOG_FORMAT", "json") == "json",
+    sample_rates=parse_sample_rates(os.getenv("VIRGIL_LOG_SAMPLE", "virgil.requests=0.1,httpx=0.1")),
+    log_content=os.getenv("VIRGIL_LOG_CONTENT", "false").lower() == "true",
+)
 logger = logging.getLogger(__name__)
-app = FastAPI()
+request_logger = logging.getLogger("virgil.requests")
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # (Database setup and models are defined later in the file)
 
@@ -42,11 +76,62 @@ app.add_middleware(
 )
 
 # --- GLOBALS ---
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mixtral-8x7B-Instruct-v0.1"
+HUGGINGFACE_API_URL = os.getenv("HUGGINGFACE_API_URL", "https://api-inference.huggingface.co/models/mistralai/Mixtral-8x7B-Instruct-v0.1")
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 HTTP_CLIENT = httpx.AsyncClient(timeout=120.0)
 CONVERSATION_HISTORY = {}
 MAX_HISTORY_LENGTH = 10
+# Tone templates are compiled once here; VIRGIL_TONES_FILE adds or overrides tones
+PROMPTS = PromptTemplates.load(os.getenv("VIRGIL_TONES_FILE", ""))
+
+# --- METRICS ---
+METRICS = MetricsRegistry()
+HTTP_REQUESTS_TOTAL = METRICS.counter(
+    "virgil_http_requests_total", "HTTP requests by route template, method and status.", ("route", "method", "status"))
+HTTP_REQUEST_DURATION = METRICS.histogram(
+    "virgil_http_request_duration_seconds", "HTTP request latency by route template.", ("route", "method"))
+INFERENCE_DURATION = METRICS.histogram(
+    "virgil_inference_duration_seconds", "Upstream inference round trip by HTTP status (or error).", ("status",))
+INFERENCE_PROMPT_BYTES = METRICS.histogram(
+    "virgil_inference_prompt_bytes", "Prompt bytes sent upstream per inference request.",
+    buckets=(1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144))
+PROMPT_PREFIX_TOTAL = METRICS.counter(
+    "virgil_prompt_prefix_total", "Session prompt prefixes reused from cache or rebuilt from the database.", ("result",))
+DB_QUERY_DURATION = METRICS.histogram(
+    "virgil_db_query_duration_seconds", "Database statement latency by statement type.", ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+REMINDER_DELIVERY_LAG = METRICS.histogram(
+    "virgil_reminder_delivery_lag_seconds", "Delay between a reminder's remind_at and its push.",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0))
+VOICE_STAGE_DURATION = METRICS.histogram(
+    "virgil_voice_stage_seconds", "Voice turn stages: stt, guide, first_audio (from end of speech) and total.",
+    ("stage",), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+METRICS.gauge("virgil_websocket_connections", "Open notification WebSockets.",
+              lambda: len(manager.active_connections))
+METRICS.gauge("virgil_reminder_long_polls", "GET /reminders requests parked waiting for a reminder.",
+              lambda: reminder_waiters.waiting)
+
+# --- TRACING ---
+TRACE_EXPORT_PATH = os.getenv("VIRGIL_TRACE_EXPORT_PATH", "")
+tracer = Tracer(
+    slow_threshold_ms=float(os.getenv("VIRGIL_TRACE_SLOW_MS", "500")),
+    buffer_size=int(os.getenv("VIRGIL_TRACE_BUFFER_SIZE", "100")),
+    exporter=OTLPFileExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None,
+    enabled=os.getenv("VIRGIL_TRACING_ENABLED", "true").lower() == "true",
+)
+
+# --- PROFILING ---
+# The /admin/profile sampler is opt-in; the loop watchdog is on unless VIRGIL_SLOW_CALLBACK_MS=0
+PROFILING_ENABLED = os.getenv("VIRGIL_PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_MAX_SECONDS = 60
+SLOW_CALLBACK_MS = float(os.getenv("VIRGIL_SLOW_CALLBACK_MS", "100"))
+profiler = SamplingProfiler()
+EVENT_LOOP_BLOCK_DURATION = METRICS.histogram(
+    "virgil_event_loop_block_seconds", "Event loop stalls longer than VIRGIL_SLOW_CALLBACK_MS.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+loop_watchdog = LoopWatchdog(
+    SLOW_CALLBACK_MS, on_block=lambda seconds, stack: EVENT_LOOP_BLOCK_DURATION.observe(seconds)
+) if SLOW_CALLBACK_MS > 0 else None
 
 # --- AUTH (simple JWT for demo) ---
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev_secret_change_me")
@@ -88,33 +173,178 @@ def get_current_user_from_request(request: Request) -> str:
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+
+# Subjects allowed to use /admin endpoints; empty means nobody
+ADMIN_USERS = {u.strip() for u in os.getenv("VIRGIL_ADMIN_USERS", "").split(",") if u.strip()}
+
+
+def require_admin(request: Request) -> str:
+    user_id = get_current_user_from_request(request)
+    if user_id not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user_id
+
+
+# --- WORKERS ---
+# serve.py --workers N runs N copies of this app behind a router that keeps each user on
+# one worker (cluster.py). Per-user state stays in process; host-wide state (leases for
+# jobs one worker should run, generation counters) goes through local_store, which the
+# launcher points at a SQLite file shared by the workers.
+WORKER_INDEX = int(os.getenv("VIRGIL_WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("VIRGIL_WORKER_COUNT", "1"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+local_store = make_local_store(os.getenv("VIRGIL_LOCAL_STORE", "memory"),
+                               os.getenv("VIRGIL_LOCAL_STORE_DB", "./virgil_local.db"))
+
+
+def hold_lease(name: str, ttl: float) -> bool:
+    """Whether this worker is (still) the one running the host-wide job name; blocking."""
+    return local_store.acquire(f"lease:{name}", WORKER_ID, ttl)
+
+
+# --- RATE LIMITING ---
+# "/path=requests/seconds[:burst]" per caller and route, plus one quota per caller across them
+RATE_LIMIT_ENABLED = os.getenv("VIRGIL_RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMITS = parse_route_limits(os.getenv(
+    "VIRGIL_RATE_LIMITS", "/guide=30/60,/quick-guide=30/60,/translate=60/60,/calculate=120/60"))
+RATE_LIMIT_USER = os.getenv("VIRGIL_RATE_LIMIT_USER", "600/3600")
+RATE_LIMITED_TOTAL = METRICS.counter(
+    "virgil_rate_limited_total", "Requests rejected with 429 by route.", ("route",))
+rate_limiter = RateLimiter(
+    make_store(os.getenv("VIRGIL_RATE_LIMIT_BACKEND", "memory"),
+               os.getenv("VIRGIL_RATE_LIMIT_DB", "./virgil_ratelimit.db")),
+    RATE_LIMITS,
+    user_limit=Limit.parse(RATE_LIMIT_USER) if RATE_LIMIT_USER else None,
+)
+
+
+def rate_limit_identity(scope) -> str:
+    """JWT subject when a valid bearer token is sent, otherwise the client IP.
+
+    X-User-Id is not used here: anyone can send a fresh one with every request.
+    """
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            if value.startswith(b"Bearer "):
+                try:
+                    sub = jwt.decode(value[7:].decode("latin-1"), SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+                    if sub:
+                        return f"user:{sub}"
+                except JWTError:
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, identify=rate_limit_identity,
+                       on_limited=lambda path: RATE_LIMITED_TOTAL.labels(path).inc())
+
+# --- CONDITIONAL GET ---
+# /history and /reminders carry ETags derived from per-user versions that every write
+# bumps, so a matching If-None-Match gets a 304 without touching the database.
+# /tones and / are fixed for the life of the process and may be cached by clients.
+STATIC_CACHE_CONTROL = f"public, max-age={int(os.getenv('VIRGIL_STATIC_MAX_AGE', '86400'))}"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+history_versions = VersionCounter()
+reminder_versions = VersionCounter()
+
+# GET /reminders?wait=<seconds> parks a request that would be empty until a reminder
+# falls due (see longpoll.py); waits are capped at LONGPOLL_MAX_WAIT_SECONDS
+LONGPOLL_MAX_WAIT_SECONDS = float(os.getenv("VIRGIL_LONGPOLL_MAX_WAIT_SECONDS", "30"))
+LONGPOLL_MAX_WAITERS = int(os.getenv("VIRGIL_LONGPOLL_MAX_WAITERS", "10000"))
+reminder_waiters = VersionWaiters(reminder_versions, LONGPOLL_MAX_WAITERS)
+
+
+def static_json(content) -> Dict[str, Any]:
+    body = dumps(content)
+    return {"body": body, "etag": content_etag(body)}
+
+
+def static_json_response(request: Request, static: Dict[str, Any]) -> Response:
+    headers = {"ETag": static["etag"], "Cache-Control": STATIC_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), static["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(static["body"], media_type="application/json", headers=headers)
+
+
 # Connection manager for real-time notifications
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, log: NotificationLog):
         self.active_connections: Dict[str, WebSocket] = {}
         self.lock = asyncio.Lock()
+        self.log = log
+        self._held: Dict[WebSocket, List[str]] = {}  # live messages for sockets still being replayed to
+
+    async def _send(self, ws: WebSocket, message: str):
+        """Send under self.lock, or hold the message back until the socket's replay is out."""
+        held = self._held.get(ws)
+        if held is not None:
+            held.append(message)
+        else:
+            await ws.send_text(message)
 
-    async def connect(self, user_id: str, websocket: WebSocket):
+    async def connect(self, user_id: str, websocket: WebSocket, since: Optional[int] = None,
+                      epoch: Optional[str] = None):
+        """Register the socket; with since, first replay what the user missed (see notifications.py)."""
         await websocket.accept()
         async with self.lock:
             self.active_connections[user_id] = websocket
+            if since is None:
+                return
+            missed, complete = self.log.replay(user_id, since, epoch)
+            header = json.dumps({
+                "type": "replay", "since": since, "count": len(missed), "complete": complete,
+                "seq": self.log.latest(user_id), "epoch": self.log.epoch,
+            })
+            # The replay is sent outside the lock; live messages wait so none overtakes it
+            self._held[websocket] = []
+        try:
+            await websocket.send_text(header)
+            for message in missed:
+                await websocket.send_text(message)
+        except Exception:
+            async with self.lock:
+                self._held.pop(websocket, None)
+            raise
+        async with self.lock:
+            for message in self._held.pop(websocket):
+                await websocket.send_text(message)
 
-    async def disconnect(self, user_id: str):
+    async def disconnect(self, user_id: str, websocket: Optional[WebSocket] = None):
+        """Close and forget the user's socket; given websocket, only if it is still the current one."""
         async with self.lock:
-            if user_id in self.active_connections:
+            current = self.active_connections.get(user_id)
+            if current is not None and (websocket is None or current is websocket):
                 try:
-                    await self.active_connections[user_id].close()
+                    await current.close()
                 except Exception:
                     pass
                 del self.active_connections[user_id]
 
+    async def notify(self, user_id: str, payload: Dict[str, Any]) -> bool:
+        """Send a numbered notification and log it for replay; False if the user is not connected."""
+        async with self.lock:
+            ws = self.active_connections.get(user_id)
+            if not ws:
+                return False
+            seq, message = self.log.next_message(payload)
+            try:
+                await self._send(ws, message)
+            except Exception:
+                del self.active_connections[user_id]
+                return False
+            self.log.record(user_id, seq, message)
+            return True
+
     async def send_personal_message(self, user_id: str, message: str):
         async with self.lock:
             ws = self.active_connections.get(user_id)
             if not ws:
                 return False
             try:
-                await ws.send_text(message)
+                await self._send(ws, message)
                 return True
             except Exception:
                 # If sending fails, remove the stale connection
@@ -125,11 +355,14 @@ class ConnectionManager:
         async with self.lock:
             for uid, ws in list(self.active_connections.items()):
                 try:
-                    await ws.send_text(message)
+                    await self._send(ws, message)
                 except Exception:
                     del self.active_connections[uid]
 
-manager = ConnectionManager()
+# Each user's last VIRGIL_NOTIFY_REPLAY_SIZE notifications are kept for replay on reconnect
+NOTIFY_REPLAY_SIZE = int(os.getenv("VIRGIL_NOTIFY_REPLAY_SIZE", "100"))
+NOTIFY_REPLAY_USERS = int(os.getenv("VIRGIL_NOTIFY_REPLAY_USERS", "10000"))
+manager = ConnectionManager(NotificationLog(NOTIFY_REPLAY_SIZE, NOTIFY_REPLAY_USERS))
 
 # Background task handle
 _background_tasks = []
@@ -160,6 +393,7 @@ async def calculate(request: Request):
 LIBRETRANSLATE_URL = os.getenv("LIBRETRANSLATE_URL", "https://libretranslate.de/translate")
 LIBRETRANSLATE_API_KEY = os.getenv("LIBRETRANSLATE_API_KEY", "")
 @app.post("/translate")
+@tracer.traced("POST /translate")
 async def translate_text(request: Request):
     data = await request.json()
     text = data.get('text')
@@ -177,7 +411,9 @@ async def translate_text(request: Request):
         payload["api_key"] = LIBRETRANSLATE_API_KEY
     try:
         async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(LIBRETRANSLATE_URL, json=payload)
+            with tracer.span("translate.http", target=target) as span:
+                resp = await client.post(LIBRETRANSLATE_URL, json=payload)
+                span.set("http.status_code", resp.status_code)
             resp.raise_for_status()
             result = resp.json()
             return {"translated": result.get("translatedText", "")}
@@ -186,21 +422,102 @@ async def translate_text(request: Request):
         raise HTTPException(status_code=500, detail="Translation service error")
 
 
-@app.get("/tones")
-async def get_tones():
-    """Return available conversation tones/modes for the frontend tone selector."""
-    # For frontend compatibility return a simple list of tone ids (strings)
-    tones = ["default", "friendly", "professional"]
-    return {"tones": tones}
+_TONES_RESPONSE: Optional[Dict[str, Any]] = None
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+
+def tones_response() -> Dict[str, Any]:
+    """The /tones body and ETag, rendered again only if PROMPTS is replaced."""
+    global _TONES_RESPONSE
+    if _TONES_RESPONSE is None or _TONES_RESPONSE["prompts"] is not PROMPTS:
+        # For frontend compatibility "tones" stays a simple list of tone ids (strings)
+        _TONES_RESPONSE = dict(static_json({"tones": PROMPTS.names(), "descriptions": PROMPTS.descriptions()}),
+                               prompts=PROMPTS)
+    return _TONES_RESPONSE
 
 
+@app.get("/tones")
+async def get_tones(request: Request):
+    """Return available conversation tones/modes for the frontend tone selector."""
+    return static_json_response(request, tones_response())
+
 # SQLite setup for persistent memory
 SQLALCHEMY_DATABASE_URL = os.getenv("VIRGIL_DB_URL", "sqlite:///./virgil_memory.db")
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+
+# Pragmas applied to every new SQLite connection. "wal" lets readers keep going while
+# a writer commits and only fsyncs at checkpoints; "default" leaves SQLite's own settings.
+SQLITE_PROFILES = {
+    "default": {},
+    "wal": {
+        # Must precede journal_mode: it only takes effect before the file is first written,
+        # and compact_database() converts existing databases
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,  # negative means KiB, so ~64MB of page cache
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PROFILE = os.getenv("VIRGIL_SQLITE_PROFILE", "wal")
+DB_POOL_SIZE = int(os.getenv("VIRGIL_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("VIRGIL_DB_MAX_OVERFLOW", "20"))
+
+
+def sqlite_pragmas(profile: str) -> Dict[str, Any]:
+    """Resolve a profile to its pragmas, letting VIRGIL_SQLITE_<PRAGMA> env vars override single values."""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PROFILES["wal"]:
+        override = os.getenv(f"VIRGIL_SQLITE_{name.upper()}")
+        if override:
+            pragmas[name] = override
+    return pragmas
+
+
+def create_db_engine(url: str, profile: str = SQLITE_PROFILE):
+    """Create an engine for url, applying the SQLite profile on connect when url is SQLite."""
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+    engine_kwargs: Dict[str, Any] = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" not in url:
+        engine_kwargs["pool_size"] = DB_POOL_SIZE
+        engine_kwargs["max_overflow"] = DB_MAX_OVERFLOW
+    db_engine = create_engine(url, **engine_kwargs)
+    pragmas = sqlite_pragmas(profile)
+    if pragmas:
+        @event.listens_for(db_engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return db_engine
+
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
+_DB_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+# The start time lives on the statement's execution context, so a statement that fails
+# (and never reaches after_cursor_execute) leaves nothing behind
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._virgil_query_start = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_virgil_query_start", None)
+    if started is None:
+        return
+    operation = statement.lstrip()[:6].upper()
+    DB_QUERY_DURATION.labels(operation if operation in _DB_OPERATIONS else "OTHER").observe(
+        time.perf_counter() - started)
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -211,16 +528,81 @@ class Conversation(Base):
     message = Column(Text)
     response = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    # /guide and /history read one user's turns in time order
+    __table_args__ = (Index("ix_conversations_user_timestamp", "user_id", "timestamp"),)
 
 class PersistentReminder(Base):
     __tablename__ = "reminders"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, index=True)
     message = Column(Text)
-    remind_at = Column(DateTime)
+    remind_at = Column(DateTime)  # for a recurring reminder, its next occurrence
     delivered = Column(Boolean, default=False)
+    recurrence = Column(String, nullable=True)  # rule string, see recurrence.py
+    repeat_until = Column(DateTime, nullable=True)
+    # The scheduler's due query scans pending reminders of every user
+    __table_args__ = (Index("ix_reminders_due", "delivered", "remind_at"),)
 
 Base.metadata.create_all(bind=engine)
+# create_all skips indexes and new columns on tables that already exist
+with engine.begin() as _conn:
+    _reminder_columns = {row[1] for row in _conn.execute(text("PRAGMA table_info(reminders)"))}
+    for _name, _type in (("recurrence", "VARCHAR"), ("repeat_until", "DATETIME")):
+        if _name not in _reminder_columns:
+            _conn.execute(text(f"ALTER TABLE reminders ADD COLUMN {_name} {_type}"))
+for _index in list(Conversation.__table__.indexes) + list(PersistentReminder.__table__.indexes):
+    _index.create(bind=engine, checkfirst=True)
+
+# Full-text index over conversation turns. It is an external-content FTS5 table, so it
+# stores only the index; triggers keep it in step with every insert, update and delete
+# on conversations (including the bulk deletes done by /user-data). The owner column
+# holds one token per user so a search intersects that user's postings instead of
+# filtering every global hit.
+CONVERSATION_FTS_DDL = [
+    """CREATE VIEW IF NOT EXISTS conversations_fts_source AS
+        SELECT id, message, response, 'u' || hex(user_id) AS owner FROM conversations""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+        message, response, owner,
+        content='conversations_fts_source', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, message, response, owner)
+        VALUES (new.id, new.message, new.response, 'u' || hex(new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, message, response, owner)
+        VALUES ('delete', old.id, old.message, old.response, 'u' || hex(old.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, message, response, owner)
+        VALUES ('delete', old.id, old.message, old.response, 'u' || hex(old.user_id));
+        INSERT INTO conversations_fts(rowid, message, response, owner)
+        VALUES (new.id, new.message, new.response, 'u' || hex(new.user_id));
+    END""",
+]
+
+
+def ensure_conversation_fts(db_engine) -> bool:
+    """Create the FTS index and triggers if missing; returns False when FTS5 is unavailable."""
+    if db_engine.dialect.name != "sqlite":
+        return False
+    try:
+        with db_engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='conversations_fts'"
+            )).first()
+            for ddl in CONVERSATION_FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                # Index rows written before the FTS table existed
+                conn.execute(text("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')"))
+        return True
+    except OperationalError as e:
+        logger.warning(f"Full-text search disabled: {e}")
+        return False
+
+
+FTS_ENABLED = ensure_conversation_fts(engine)
 
 def get_db():
     db = SessionLocal()
@@ -244,14 +626,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress bodies over the threshold when the client accepts br or gzip
+if os.getenv("VIRGIL_COMPRESSION_ENABLED", "true").lower() == "true":
+    app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("VIRGIL_COMPRESSION_MIN_BYTES", "1024")))
+
+# Graceful draining on SIGTERM or POST /admin/drain (see drain.py): in-flight work gets up to
+# VIRGIL_DRAIN_TIMEOUT_SECONDS, and WebSocket clients are told to reconnect at a random point
+# within VIRGIL_RECONNECT_JITTER_SECONDS
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("VIRGIL_DRAIN_TIMEOUT_SECONDS", "20"))
+RECONNECT_JITTER_SECONDS = float(os.getenv("VIRGIL_RECONNECT_JITTER_SECONDS", "10"))
+drainer = Drainer()
+app.add_middleware(InFlightMiddleware, drainer=drainer)
+
+# Outermost, so it times the whole stack including CORS
+app.add_middleware(MetricsMiddleware, requests_total=HTTP_REQUESTS_TOTAL, request_duration=HTTP_REQUEST_DURATION)
+
 # Hugging Face API settings
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mixtral-8x7B-Instruct-v0.1"
+HUGGINGFACE_API_URL = os.getenv("HUGGINGFACE_API_URL", "https://api-inference.huggingface.co/models/mistralai/Mixtral-8x7B-Instruct-v0.1")
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 HTTP_CLIENT = httpx.AsyncClient(timeout=120.0)  # Longer timeout for model inference
 
 
 CONVERSATION_HISTORY = {}  # Still used for fast access, but now also persist
 MAX_HISTORY_LENGTH = 10
+
+# Retrieval of relevant older turns for /guide context (see retrieval.py)
+RETRIEVAL_ENABLED = os.getenv("VIRGIL_RETRIEVAL_ENABLED", "true").lower() == "true"
+RETRIEVAL_DIR = os.getenv("VIRGIL_RETRIEVAL_DIR", "./virgil_vectors")
+RETRIEVAL_TOP_K = int(os.getenv("VIRGIL_RETRIEVAL_TOP_K", "4"))
+PROMPT_HISTORY_BUDGET_CHARS = int(os.getenv("VIRGIL_PROMPT_HISTORY_BUDGET_CHARS", "6000"))
+# Part of the history budget kept for retrieved turns, so relevant older turns are not
+# crowded out by recent ones in the cached prefix
+RETRIEVAL_BUDGET_CHARS = min(int(os.getenv("VIRGIL_RETRIEVAL_BUDGET_CHARS", "2000")), PROMPT_HISTORY_BUDGET_CHARS) \
+    if RETRIEVAL_ENABLED else 0
+# Per-session prompt prefixes; turns are appended so consecutive prompts share a cacheable prefix
+PROMPT_PREFIXES = PrefixCache(PROMPT_HISTORY_BUDGET_CHARS - RETRIEVAL_BUDGET_CHARS, MAX_HISTORY_LENGTH,
+                              max_sessions=int(os.getenv("VIRGIL_PROMPT_PREFIX_SESSIONS", "10000")))
+retrieval_index = RetrievalIndex(RETRIEVAL_DIR, max_open=int(os.getenv("VIRGIL_RETRIEVAL_OPEN_INDEXES", "1000"))) \
+    if RETRIEVAL_ENABLED else None
+
+
+# Archival of old turns into per-month compressed files (see archive.py)
+ARCHIVE_ENABLED = os.getenv("VIRGIL_ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_DIR = os.getenv("VIRGIL_ARCHIVE_DIR", "./virgil_archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("VIRGIL_ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("VIRGIL_ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_VACUUM_PAGES = int(os.getenv("VIRGIL_ARCHIVE_VACUUM_PAGES", "2000"))
+conversation_archive = ConversationArchive(ARCHIVE_DIR) if ARCHIVE_ENABLED else None
+
+
+def load_turns_for_index(user_id: str, after_id: int):
+    """Backfill loader for the retrieval index; runs on the indexing worker thread."""
+    db = SessionLocal()
+    try:
+        rows = db.query(Conversation.id, Conversation.message, Conversation.response).filter(
+            Conversation.user_id == user_id, Conversation.id > after_id).order_by(Conversation.id).all()
+        return [(r.id, f"{r.message}\n{r.response}") for r in rows]
+    finally:
+        db.close()
 from datetime import datetime, timedelta
 def get_user_id(request: Request) -> str:
     # Prefer JWT subject if provided in Authorization header
@@ -276,51 +708,163 @@ def cleanup_reminders_db(db, user_id):
     db.commit()
 
 
-# Endpoint to schedule a reminder (persistent)
-@app.post("/reminder")
-async def schedule_reminder(request: Request):
-    data = await request.json()
+REMINDER_BULK_MAX = int(os.getenv("VIRGIL_REMINDER_BULK_MAX", "500"))
+
+
+def _parse_utc(value: str) -> datetime:
+    """ISO8601 to the naive UTC datetimes the reminders table holds."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _reminder_from_request(user_id: str, data: Any) -> PersistentReminder:
+    """Validate one reminder from a request body; raises ValueError with the reason."""
+    if not isinstance(data, dict):
+        raise ValueError("Reminder must be an object")
     message = data.get('message')
     remind_at = data.get('remind_at')  # ISO8601 string
     if not message or not remind_at:
-        raise HTTPException(status_code=400, detail="Missing message or remind_at")
+        raise ValueError("Missing message or remind_at")
+    try:
+        remind_time = _parse_utc(remind_at)
+    except Exception:
+        raise ValueError("Invalid remind_at format")
+    recurrence, until = data.get('recurrence'), data.get('until')
+    if recurrence:
+        if not isinstance(recurrence, str):
+            raise ValueError("recurrence must be a string")
+        parse_rule(recurrence)
     try:
-        remind_time = datetime.fromisoformat(remind_at)
+        repeat_until = _parse_utc(until) if until else None
     except Exception:
-        raise HTTPException(status_code=400, detail="Invalid remind_at format")
+        raise ValueError("Invalid until format")
+    if repeat_until is not None and repeat_until < remind_time:
+        raise ValueError("until is before remind_at")
+    return PersistentReminder(user_id=user_id, message=message, remind_at=remind_time, delivered=False,
+                              recurrence=recurrence or None, repeat_until=repeat_until)
+
+
+def reminder_out(reminder: PersistentReminder) -> Dict[str, Any]:
+    return {
+        'id': reminder.id,
+        'message': reminder.message,
+        'remind_at': reminder.remind_at,
+        'delivered': reminder.delivered,
+        'recurrence': reminder.recurrence,
+    }
+
+
+def mark_reminder_delivered(reminder: PersistentReminder, now: datetime) -> None:
+    """A one-shot reminder is done; a recurring one moves on to its next occurrence after now."""
+    if reminder.recurrence:
+        try:
+            following = parse_rule(reminder.recurrence).next_after(reminder.remind_at, now)
+        except ValueError:
+            following = None
+        if following is not None and (reminder.repeat_until is None or following <= reminder.repeat_until):
+            reminder.remind_at = following
+            return
+    reminder.delivered = True
+
+
+# Endpoint to schedule a reminder (persistent)
+@app.post("/reminder")
+async def schedule_reminder(request: Request):
+    data = await request.json()
     user_id = get_user_id(request)
+    try:
+        reminder = _reminder_from_request(user_id, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db = next(get_db())
-    reminder = PersistentReminder(user_id=user_id, message=message, remind_at=remind_time, delivered=False)
     db.add(reminder)
     db.commit()
     db.refresh(reminder)
-    return {"status": "scheduled", "reminder": {
-        'id': reminder.id,
-        'message': reminder.message,
-        'remind_at': reminder.remind_at.isoformat(),
-        'delivered': reminder.delivered
-    }}
+    reminder_versions.bump(user_id)
+    return {"status": "scheduled", "reminder": reminder_out(reminder)}
+
+
+@app.post("/reminders")
+async def schedule_reminders(request: Request):
+    """Schedule up to REMINDER_BULK_MAX reminders in one transaction; all or none are stored."""
+    data = await request.json()
+    items = data.get('reminders') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="Missing reminders list")
+    if len(items) > REMINDER_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {REMINDER_BULK_MAX} reminders per request")
+    user_id = get_user_id(request)
+    reminders = []
+    for i, item in enumerate(items):
+        try:
+            reminders.append(_reminder_from_request(user_id, item))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"reminders[{i}]: {e}")
+    db = next(get_db())
+    db.add_all(reminders)
+    with tracer.span("db.commit", rows=len(reminders)):
+        # Flush first so the ids are known without reloading every row after the commit
+        db.flush()
+        out = [reminder_out(r) for r in reminders]
+        db.commit()
+    reminder_versions.bump(user_id)
+    return FastJSONResponse({"status": "scheduled", "reminders": out})
 
 
 # Endpoint to fetch due reminders (persistent)
 @app.get("/reminders")
-async def get_due_reminders(request: Request):
+@tracer.traced("GET /reminders")
+async def get_due_reminders(request: Request, wait: float = Query(0, ge=0)):
+    """Return due reminders and mark them delivered.
+
+    With wait=<seconds>, an answer that would be empty (or a 304) is held until one of
+    the user's reminders falls due or is scheduled, or the wait runs out.
+    """
     user_id = get_user_id(request)
+    wait = min(wait, LONGPOLL_MAX_WAIT_SECONDS) if not drainer.draining else 0.0
+    deadline = time.monotonic() + wait
+    # Only an empty answer gets an ETag: a non-empty one marks its reminders delivered
+    version = reminder_versions.get(user_id)
+    if etag_matches(request.headers.get("if-none-match"), make_etag("r", version)):
+        if not (wait and await reminder_waiters.wait(user_id, version, wait)):
+            return not_modified(make_etag("r", version), PRIVATE_CACHE_CONTROL)
+        version = reminder_versions.get(user_id)
+    while True:
+        etag = make_etag("r", version)
+        reminders_out = _take_due_reminders(user_id)
+        remaining = deadline - time.monotonic()
+        if reminders_out or remaining <= 0 or not await reminder_waiters.wait(user_id, version, remaining):
+            break
+        version = reminder_versions.get(user_id)
+    if not reminders_out:
+        return FastJSONResponse({"reminders": []}, headers={"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL})
+    return FastJSONResponse({"reminders": reminders_out}, headers={"Cache-Control": "no-store"})
+
+
+def _take_due_reminders(user_id: str) -> List[Dict[str, Any]]:
+    """Mark the user's due reminders delivered and return them; when none are due, register
+    when the next one falls due so the user's ETag (and any long poll) moves on then."""
     now = datetime.utcnow()
     db = next(get_db())
-    due = db.query(PersistentReminder).filter_by(user_id=user_id, delivered=False).filter(PersistentReminder.remind_at <= now).all()
+    with tracer.span("db.due_query"):
+        due = db.query(PersistentReminder).filter_by(user_id=user_id, delivered=False).filter(PersistentReminder.remind_at <= now).all()
+    if not due:
+        next_due = db.query(func.min(PersistentReminder.remind_at)).filter(
+            PersistentReminder.user_id == user_id, PersistentReminder.delivered == False).scalar()  # noqa: E712
+        if next_due is not None:
+            reminder_versions.expire_at(user_id, next_due.replace(tzinfo=timezone.utc).timestamp())
+        return []
     reminders_out = []
     for r in due:
-        reminders_out.append({
-            'id': r.id,
-            'message': r.message,
-            'remind_at': r.remind_at.isoformat(),
-            'delivered': r.delivered
-        })
-        r.delivered = True
-    db.commit()
-    cleanup_reminders_db(db, user_id)
-    return {"reminders": reminders_out}
+        reminders_out.append(reminder_out(r))
+        mark_reminder_delivered(r, now)
+    with tracer.span("db.commit"):
+        db.commit()
+        cleanup_reminders_db(db, user_id)
+    reminder_versions.bump(user_id)
+    return reminders_out
 
 
 @app.websocket("/ws/notify/{user_id}")
@@ -330,6 +874,9 @@ async def ws_notify(websocket: WebSocket, user_id: str):
     For now this accepts any connection and associates it with the path user_id. In the next step
     we'll require tokens or stronger auth.
     """
+    if drainer.draining:
+        await websocket.close(code=CLOSE_SERVICE_RESTART)
+        return
     # Basic auth: accept connections if one of these is true:
     #  - Authorization header with valid token whose subject matches user_id
     #  - query param token with valid token
@@ -361,8 +908,12 @@ async def ws_notify(websocket: WebSocket, user_id: str):
                 await websocket.close(code=403)
                 return
     try:
-        await manager.connect(user_id, websocket)
-        logger.info(f"WebSocket connected for user: {user_id}")
+        since = int(websocket.query_params["since"]) if "since" in websocket.query_params else None
+    except ValueError:
+        since = 0
+    try:
+        await manager.connect(user_id, websocket, since, websocket.query_params.get("epoch"))
+        request_logger.info("WebSocket connected", extra={"user_id": user_id})
         while True:
             # Keep the connection alive by echoing pings — we don't expect incoming messages in this simple notifier
             try:
@@ -375,47 +926,457 @@ async def ws_notify(websocket: WebSocket, user_id: str):
                 # Sleep briefly and continue; keep connection until client disconnects
                 await asyncio.sleep(0.1)
     finally:
-        await manager.disconnect(user_id)
-        logger.info(f"WebSocket disconnected for user: {user_id}")
+        await manager.disconnect(user_id, websocket)
+        request_logger.info("WebSocket disconnected", extra={"user_id": user_id})
+
+
+# Voice conversations over /ws/audio (see voice.py); "stub" backends need no model
+VOICE_SAMPLE_RATE = int(os.getenv("VIRGIL_VOICE_SAMPLE_RATE", "16000"))
+# Incoming audio is resampled to this rate, trimmed and normalized before STT (see audioprep.py)
+STT_SAMPLE_RATE = int(os.getenv("VIRGIL_STT_SAMPLE_RATE", "16000"))
+VAD_THRESHOLD_DB = float(os.getenv("VIRGIL_VAD_THRESHOLD_DB", "-40"))
+VAD_SILENCE_MS = int(os.getenv("VIRGIL_VAD_SILENCE_MS", "600"))
+# Send a partial transcript every this many ms of ongoing speech; 0 sends final transcripts only
+STT_PARTIAL_MS = int(os.getenv("VIRGIL_STT_PARTIAL_MS", "0"))
+VOICE_HTTP_CLIENT = httpx.AsyncClient(timeout=60.0)
+stt_backend = make_stt(os.getenv("VIRGIL_STT_BACKEND", "stub"), VOICE_HTTP_CLIENT,
+                       os.getenv("VIRGIL_STT_URL", "https://api-inference.huggingface.co/models/openai/whisper-large-v3"),
+                       os.getenv("HUGGINGFACE_API_KEY", ""))
+tts_backend = make_tts(os.getenv("VIRGIL_TTS_BACKEND", "stub"), VOICE_HTTP_CLIENT, os.getenv("VIRGIL_TTS_URL", ""),
+                       os.getenv("HUGGINGFACE_API_KEY", ""), sample_rate=VOICE_SAMPLE_RATE)
+# Synthesized sentences are cached on disk by text, voice and tone (see ttscache.py), and
+# every fallback reply is synthesized at startup so the common answers play back at once
+TTS_CACHE_ENABLED = os.getenv("VIRGIL_TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_DIR = os.getenv("VIRGIL_TTS_CACHE_DIR", "./virgil_tts_cache")
+TTS_CACHE_MB = float(os.getenv("VIRGIL_TTS_CACHE_MB", "256"))
+TTS_PREWARM = os.getenv("VIRGIL_TTS_PREWARM", "true").lower() == "true"
+if TTS_CACHE_ENABLED:
+    # Workers share the directory, and only the one holding the "tts-cache" lease deletes from it
+    tts_backend = CachedTTS(tts_backend, AudioCache(TTS_CACHE_DIR, int(TTS_CACHE_MB * 1024 * 1024),
+                                                    evict=WORKER_COUNT == 1))
+    METRICS.gauge("virgil_tts_cache_bytes", "Size of the synthesized-audio cache on disk.",
+                  lambda: tts_backend.cache.total_bytes)
+    METRICS.gauge("virgil_tts_cache_hits", "Sentences spoken from the audio cache since startup.",
+                  lambda: tts_backend.hits)
+    METRICS.gauge("virgil_tts_cache_misses", "Sentences synthesized because they were not cached.",
+                  lambda: tts_backend.misses)
+
+
+_voice_sockets: Set[WebSocket] = set()
+
+
+def new_speech_preprocessor(input_rate: int) -> SpeechPreprocessor:
+    return SpeechPreprocessor(input_rate, STT_SAMPLE_RATE, energy_threshold_db=VAD_THRESHOLD_DB,
+                              silence_ms=VAD_SILENCE_MS)
+
+
+@app.websocket("/ws/audio/{session_id}")
+async def ws_audio(websocket: WebSocket, session_id: str):
+    """Voice conversation: speech in, transcript, reply text and synthesized speech out.
+
+    Binary messages are audio frames (see audioframes.py), bare 16-bit mono PCM at the
+    session's sample rate, or a whole WAV file, taken as one utterance. PCM is cut into
+    utterances by voice activity detection. Text messages are JSON:
+    {"type": "start", "sample_rate": 48000, "tone": "friendly", "binary": true}
+    configures the session, {"type": "end"} closes the current utterance and
+    {"command": "ping"} is answered with a pong.
+
+    Each utterance gets "status" (processing), "transcript", "response" (transcription
+    and reply text), then the reply audio one sentence at a time, and "audio_end". The
+    audio is sent as WAV frames once the client has sent a frame or asked for
+    "binary", and as "audio" messages with base64 WAV otherwise.
+    """
+    if drainer.draining:
+        await websocket.close(code=CLOSE_SERVICE_RESTART)
+        return
+    await websocket.accept()
+    _voice_sockets.add(websocket)
+    tone = "default"
+    binary_replies = False
+    speech = new_speech_preprocessor(VOICE_SAMPLE_RATE)
+    next_partial_ms = STT_PARTIAL_MS
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            utterance = None
+            if message.get("bytes") is not None:
+                data, end = message["bytes"], False
+                if is_frame(data):
+                    try:
+                        frame = parse_frame(data)
+                    except FrameError as e:
+                        await websocket.send_text(json.dumps({"type": "error", "error": str(e)}))
+                        continue
+                    if frame.session_id and frame.session_id != session_id:
+                        await websocket.send_text(json.dumps({"type": "error", "error": "Frame is for another session"}))
+                        continue
+                    binary_replies = True
+                    data, end = frame.payload, frame.end
+                    if frame.codec == CODEC_PCM16 and frame.sample_rate != speech.input_rate:
+                        speech = new_speech_preprocessor(frame.sample_rate)
+                if is_wav(data):
+                    try:
+                        pcm, rate = wav_to_pcm(data)
+                        check_sample_rate(rate)
+                    except (ValueError, EOFError, wave.Error) as e:
+                        await websocket.send_text(json.dumps({"type": "error", "error": f"Unreadable WAV: {e}"}))
+                        continue
+                    # A whole recording can be long; keep its preprocessing off the event loop
+                    pcm = await asyncio.to_thread(preprocess_utterance, pcm, rate, STT_SAMPLE_RATE,
+                                                  energy_threshold_db=VAD_THRESHOLD_DB)
+                    if pcm is None:
+                        await websocket.send_text(json.dumps({"type": "error", "error": "No speech detected"}))
+                        continue
+                    utterance = (pcm, STT_SAMPLE_RATE)
+                else:
+                    if len(data) % 2:
+                        # Frames are checked in parse_frame; bare PCM has to be checked here
+                        await websocket.send_text(json.dumps(
+                            {"type": "error", "error": "PCM16 audio must have an even number of bytes"}))
+                        continue
+                    pcm = speech.feed(data) or (speech.flush() if end else None)
+                    if pcm:
+                        utterance = (pcm, speech.sample_rate)
+                    elif STT_PARTIAL_MS and speech.in_speech and speech.speech_ms >= next_partial_ms:
+                        next_partial_ms += STT_PARTIAL_MS
+                        try:
+                            partial = await stt_backend.transcribe(speech.speech(), speech.sample_rate)
+                        except httpx.HTTPError as e:
+                            # The final transcript is still attempted when the utterance ends
+                            logger.warning(f"Partial transcription failed: {type(e).__name__}: {e}")
+                            continue
+                        await websocket.send_text(json.dumps({"type": "transcript", "text": partial, "final": False}))
+            else:
+                try:
+                    command = json.loads(message.get("text") or "{}")
+                except json.JSONDecodeError:
+                    command = None
+                if not isinstance(command, dict):
+                    await websocket.send_text(json.dumps({"type": "error", "error": "Text frames must be JSON objects"}))
+                    continue
+                if command.get("command") == "ping":
+                    await websocket.send_text(json.dumps({"type": "pong", "session_id": session_id}))
+                elif command.get("type") == "start":
+                    rate = command.get("sample_rate", VOICE_SAMPLE_RATE)
+                    if not isinstance(rate, int) or isinstance(rate, bool):
+                        await websocket.send_text(json.dumps({"type": "error", "error": "sample_rate must be an integer"}))
+                        continue
+                    try:
+                        check_sample_rate(rate)
+                    except ValueError as e:
+                        await websocket.send_text(json.dumps({"type": "error", "error": str(e)}))
+                        continue
+                    if not isinstance(command.get("tone", tone), str):
+                        await websocket.send_text(json.dumps({"type": "error", "error": "tone must be a string"}))
+                        continue
+                    tone = command.get("tone", tone)
+                    binary_replies = bool(command.get("binary", binary_replies))
+                    speech = new_speech_preprocessor(rate)
+                    await websocket.send_text(json.dumps({"type": "status", "status": "listening"}))
+                elif command.get("type") == "end":
+                    pcm = speech.flush()
+                    if pcm:
+                        utterance = (pcm, speech.sample_rate)
+            if utterance is not None:
+                next_partial_ms = STT_PARTIAL_MS
+                with drainer.track():
+                    await _voice_turn(websocket, session_id, tone, *utterance, binary=binary_replies)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _voice_sockets.discard(websocket)
+
+
+@tracer.traced("WS /ws/audio")
+async def _voice_turn(websocket: WebSocket, session_id: str, tone: str, pcm: bytes, sample_rate: int,
+                      binary: bool = False):
+    """Transcribe one utterance, run it through the /guide pipeline and stream the spoken reply."""
+    started = time.perf_counter()
+    await websocket.send_text(json.dumps({"type": "status", "status": "processing"}))
+    # Voice turns cost an inference call like /guide and share its bucket
+    if RATE_LIMIT_ENABLED and "/guide" in rate_limiter.route_limits:
+        wait = await rate_limiter.check("/guide", rate_limit_identity(websocket.scope))
+        if wait:
+            RATE_LIMITED_TOTAL.labels("/ws/audio").inc()
+            await websocket.send_text(json.dumps(
+                {"type": "error", "error": "Rate limit exceeded", "retry_after": max(1, math.ceil(wait))}))
+            return
+    with tracer.span("voice.stt", audio_ms=len(pcm) * 500 // sample_rate):
+        try:
+            transcript = await stt_backend.transcribe(pcm, sample_rate)
+        except httpx.HTTPError as e:
+            logger.error(f"Speech recognition failed: {type(e).__name__}: {e}")
+            await websocket.send_text(json.dumps({"type": "error", "error": "Speech recognition is unavailable"}))
+            return
+    stt_done = time.perf_counter()
+    VOICE_STAGE_DURATION.labels("stt").observe(stt_done - started)
+    await websocket.send_text(json.dumps({"type": "transcript", "text": transcript, "final": True}))
+    if not transcript:
+        await websocket.send_text(json.dumps({"type": "error", "error": "No speech recognized"}))
+        return
+    reply = await run_guide(transcript, session_id, tone)
+    guide_done = time.perf_counter()
+    VOICE_STAGE_DURATION.labels("guide").observe(guide_done - stt_done)
+    await websocket.send_text(json.dumps({
+        "type": "response",
+        "transcription": transcript,
+        "response": reply,
+        "processing_time": {"stt": stt_done - started, "guide": guide_done - stt_done},
+    }))
+
+    sent = 0
+
+    async def send_audio(seq: int, sentence: str, audio: bytes, last: bool):
+        nonlocal sent
+        sent += 1
+        if seq == 0:
+            VOICE_STAGE_DURATION.labels("first_audio").observe(time.perf_counter() - started)
+        if binary:
+            await websocket.send_bytes(encode_frame(session_id, seq, audio, wav_sample_rate(audio),
+                                                    CODEC_WAV, FLAG_END if last else 0))
+            return
+        await websocket.send_text(json.dumps({
+            "type": "audio", "seq": seq, "text": sentence,
+            "audio": base64.b64encode(audio).decode("ascii"), "sample_rate": wav_sample_rate(audio),
+        }))
+
+    with tracer.span("voice.tts") as span:
+        try:
+            await stream_speech(tts_backend, reply, send_audio, tone)
+        except httpx.HTTPError as e:
+            # The reply text is already out; end the turn with whatever audio was sent
+            logger.error(f"Speech synthesis failed: {type(e).__name__}: {e}")
+            await websocket.send_text(json.dumps({"type": "error", "error": "Speech synthesis is unavailable"}))
+        span.set("chunks", sent)
+    await websocket.send_text(json.dumps({"type": "audio_end", "chunks": sent}))
+    VOICE_STAGE_DURATION.labels("total").observe(time.perf_counter() - started)
+
+
+@tracer.traced("reminder.push")
+async def _push_due_reminders():
+    """One scheduler tick: push due reminders to connected clients and mark them delivered.
+
+    Only users connected to this worker are considered; the rest are left for GET
+    /reminders, or for the worker their socket is on when there are several.
+    """
+    connected = list(manager.active_connections)
+    if not connected:
+        return
+    db = next(get_db())
+    now = datetime.utcnow()
+    with tracer.span("db.due_query") as span:
+        due_query = db.query(PersistentReminder).filter_by(delivered=False).filter(PersistentReminder.remind_at <= now)
+        if len(connected) <= PUSH_USER_FILTER_MAX:
+            due_query = due_query.filter(PersistentReminder.user_id.in_(connected))
+        due = [r for r in due_query.all() if r.user_id in manager.active_connections]
+        if not due:
+            # Idle ticks every few seconds would drown out real traces
+            span.drop()
+            return
+    for r in due:
+        if r.user_id in _USERS_BEING_DELETED:
+            continue
+        payload = {
+            "type": "reminder",
+            "id": r.id,
+            "message": r.message,
+            "remind_at": r.remind_at.isoformat(),
+            "recurrence": r.recurrence
+        }
+        with tracer.span("ws.send", reminder_id=r.id) as span:
+            sent = await manager.notify(r.user_id, payload)
+            span.set("sent", sent)
+        # mark delivered if we sent it; otherwise leave pending so client can query
+        if sent:
+            REMINDER_DELIVERY_LAG.observe(max(0.0, (datetime.utcnow() - r.remind_at).total_seconds()))
+            mark_reminder_delivered(r, now)
+            reminder_versions.bump(r.user_id)
+    with tracer.span("db.commit"):
+        db.commit()
+    # Optional cleanup to remove delivered reminders
+    # (cleanup_reminders_db is safe here but will be done when a client fetches reminders)
+
+
+REMINDER_PUSH_INTERVAL = 3.0
+# Past this many connected users the due query scans every user's due reminders instead
+PUSH_USER_FILTER_MAX = 5000
+_reminder_pusher_beat = 0.0  # time.time() of the pusher's last tick, read by the scheduler health probe
+_reminder_pusher_task: Optional[asyncio.Task] = None
+_reminder_pusher_stop: Optional[asyncio.Event] = None
+
+
+async def _reminder_pusher_loop(stop: asyncio.Event, interval: float = REMINDER_PUSH_INTERVAL):
+    """Background loop to check DB for due reminders and push notifications to connected clients.
+
+    Stops between ticks once stop is set, never between a push and its delivered=True commit.
+    """
+    global _reminder_pusher_beat
+    while not stop.is_set():
+        _reminder_pusher_beat = time.time()
+        try:
+            await _push_due_reminders()
+        except Exception as e:
+            logger.exception(f"Error in reminder pusher loop: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def run_archive_maintenance() -> int:
+    """Archive turns past the retention age, then compact the hot database."""
+    cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    moved = conversation_archive.archive_before(engine, cutoff)
+    compact_database(engine, ARCHIVE_VACUUM_PAGES)
+    if moved:
+        history_versions.bump_all()
+        # Other workers drop their history ETags when they see the generation move
+        global _history_generation
+        _history_generation = str(local_store.incr("generation:history"))
+        logger.info(f"Archived {moved} conversation turns older than {cutoff.isoformat()}")
+    return moved
 
 
-async def _reminder_pusher_loop(interval: float = 3.0):
-    """Background loop to check DB for due reminders and push notifications to connected clients."""
+async def _archive_maintenance_loop(interval: float = ARCHIVE_INTERVAL_SECONDS):
+    """Background loop running archival and incremental VACUUM/ANALYZE off the event loop.
+
+    With several workers only the one holding the "archive" lease does the work.
+    """
     while True:
         try:
-            db = next(get_db())
-            now = datetime.utcnow()
-            due = db.query(PersistentReminder).filter_by(delivered=False).filter(PersistentReminder.remind_at <= now).all()
-            for r in due:
-                payload = json.dumps({
-                    "type": "reminder",
-                    "id": r.id,
-                    "message": r.message,
-                    "remind_at": r.remind_at.isoformat()
-                })
-                sent = await manager.send_personal_message(r.user_id, payload)
-                # mark delivered if we sent it; otherwise leave pending so client can query
-                if sent:
-                    r.delivered = True
-            db.commit()
-            # Optional cleanup to remove delivered reminders
-            # (cleanup_reminders_db is safe here but will be done when a client fetches reminders)
+            if await asyncio.to_thread(hold_lease, "archive", interval * 2):
+                await asyncio.to_thread(run_archive_maintenance)
         except Exception as e:
-            logger.exception(f"Error in reminder pusher loop: {e}")
+            logger.exception(f"Error in archive maintenance loop: {e}")
+        await asyncio.sleep(interval)
+
+
+TTS_CACHE_SWEEP_SECONDS = 300.0
+
+
+async def _tts_cache_sweep_loop(interval: float = TTS_CACHE_SWEEP_SECONDS):
+    """With several workers, bound the shared TTS cache directory from one of them."""
+    while True:
+        try:
+            if await asyncio.to_thread(hold_lease, "tts-cache", interval * 2):
+                deleted = await asyncio.to_thread(tts_backend.cache.sweep)
+                if deleted:
+                    logger.info(f"TTS cache sweep deleted {deleted} entries")
+        except Exception as e:
+            logger.exception(f"Error sweeping the TTS cache: {e}")
+        await asyncio.sleep(interval)
+
+
+GENERATION_CHECK_SECONDS = 5.0
+_history_generation: Optional[str] = None
+
+
+async def _generation_watch_loop(interval: float = GENERATION_CHECK_SECONDS):
+    """With several workers, invalidate history ETags after another worker archives."""
+    global _history_generation
+    while True:
+        try:
+            generation = await asyncio.to_thread(local_store.get, "generation:history")
+            if generation != _history_generation:
+                if _history_generation is not None:
+                    history_versions.bump_all()
+                _history_generation = generation
+        except Exception as e:
+            logger.exception(f"Error checking shared generations: {e}")
         await asyncio.sleep(interval)
 
 
 @app.on_event("startup")
 async def startup_tasks():
-    # start background reminder pusher task
-    task = asyncio.create_task(_reminder_pusher_loop())
-    _background_tasks.append(task)
+    global _reminder_pusher_task, _reminder_pusher_stop
+    # start background reminder pusher task; it is stopped, not cancelled, at shutdown
+    _reminder_pusher_stop = asyncio.Event()
+    _reminder_pusher_task = asyncio.create_task(_reminder_pusher_loop(_reminder_pusher_stop))
+    if retrieval_index is not None:
+        _background_tasks.append(asyncio.create_task(retrieval_index.run()))
+    if conversation_archive is not None:
+        _background_tasks.append(asyncio.create_task(_archive_maintenance_loop()))
+    if loop_watchdog is not None:
+        loop_watchdog.start()
+    if TTS_CACHE_ENABLED and TTS_PREWARM:
+        _background_tasks.append(asyncio.create_task(_prewarm_tts_cache()))
+    if WORKER_COUNT > 1:
+        _background_tasks.append(asyncio.create_task(_generation_watch_loop()))
+        if TTS_CACHE_ENABLED:
+            _background_tasks.append(asyncio.create_task(_tts_cache_sweep_loop()))
+    _background_tasks.append(asyncio.create_task(health_monitor.run()))
+
+
+async def _prewarm_tts_cache():
+    """Synthesize every fallback sentence in every tone that is not cached yet.
+
+    Workers share the cache directory, so only one of them pre-warms it.
+    """
+    if not await asyncio.to_thread(hold_lease, "tts-prewarm", 600):
+        return
+    started = time.perf_counter()
+    added = await tts_backend.prewarm(fallback_sentences(), PROMPTS.names())
+    if added:
+        logger.info(f"TTS cache pre-warmed with {added} sentences in {time.perf_counter() - started:.1f}s")
+
+
+async def drain(timeout: float = DRAIN_TIMEOUT_SECONDS):
+    """Take this worker out of rotation and let in-flight work finish, then close WebSockets.
+
+    Runs on SIGTERM before the server stops listening (under serve.py), from POST
+    /admin/drain, and at shutdown; only the first call does anything.
+    """
+    if drainer.draining:
+        return
+    drainer.draining = health_monitor.draining = True
+    # Parked long polls answer now rather than holding the drain for their full wait
+    reminder_waiters.close()
+    async with manager.lock:
+        sockets = list(manager.active_connections.values())
+    sockets += list(_voice_sockets)
+    logger.info(f"Draining: {drainer.inflight} requests in flight, {len(sockets)} WebSockets open")
+    for ws in sockets:
+        try:
+            await ws.send_text(json.dumps(reconnect_hint(RECONNECT_JITTER_SECONDS)))
+        except Exception:
+            pass
+    if not await drainer.wait_idle(timeout):
+        logger.warning(f"Drain deadline of {timeout:g}s passed with {drainer.inflight} requests in flight")
+    for ws in sockets:
+        try:
+            await ws.close(code=CLOSE_SERVICE_RESTART)
+        except Exception:
+            pass
+
+
+@app.post("/admin/drain")
+async def admin_drain(request: Request):
+    """Start draining this worker, e.g. from a pre-stop hook; returns without waiting."""
+    require_admin(request)
+    if not drainer.draining:
+        _background_tasks.append(asyncio.create_task(drain()))
+    return {"draining": True, "in_flight": drainer.inflight - 1}  # not counting this request
 
 
 @app.on_event("shutdown")
 async def shutdown_tasks():
+    await drain()
+    # Let the pusher finish its tick so no reminder is pushed without being marked delivered
+    if _reminder_pusher_task is not None:
+        _reminder_pusher_stop.set()
+        try:
+            await asyncio.wait_for(_reminder_pusher_task, DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Reminder pusher did not stop in time")
     for t in _background_tasks:
         t.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    if retrieval_index is not None:
+        await retrieval_index.flush()
+    if loop_watchdog is not None:
+        loop_watchdog.stop()
     # close any open websockets
     async with manager.lock:
         for uid, ws in list(manager.active_connections.items()):
@@ -424,30 +1385,153 @@ async def shutdown_tasks():
             except Exception:
                 pass
         manager.active_connections.clear()
+    for client in (HTTP_CLIENT, VOICE_HTTP_CLIENT):
+        await client.aclose()
+    await asyncio.to_thread(checkpoint_database, engine)
+    logger.info("Shutdown complete")
 
 
 # --- USER DATA ENDPOINTS ---
-@app.get("/history")
-async def get_conversation_history(request: Request):
+def get_history_user_id(request: Request) -> str:
     # Prefer JWT-based user id, fall back to X-User-Id or client IP
     try:
-        user_id = get_current_user_from_request(request)
+        return get_current_user_from_request(request)
     except HTTPException:
         # Fallback behavior (maintain compatibility with existing frontend):
-        user_id = request.headers.get('X-User-Id') or request.client.host or 'guest'
+        return request.headers.get('X-User-Id') or request.client.host or 'guest'
+
+
+@app.get("/history")
+async def get_conversation_history(request: Request):
+    user_id = get_history_user_id(request)
+    etag = make_etag("h", history_versions.get(user_id))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, PRIVATE_CACHE_CONTROL)
     db = next(get_db())
-    history_db = db.query(Conversation).filter_by(user_id=user_id).order_by(Conversation.timestamp.asc()).all()
+    # Plain column rows rather than ORM objects; FastJSONResponse serializes the datetimes
+    history_db = db.query(Conversation.id, Conversation.message, Conversation.response, Conversation.timestamp).filter(
+        Conversation.user_id == user_id).order_by(Conversation.timestamp.asc()).all()
     history = [
+        {"id": h.id, "user_id": user_id, "message": h.message, "response": h.response, "timestamp": h.timestamp}
+        for h in history_db
+    ]
+    if conversation_archive is not None:
+        # Archived turns are all older than the hot table's, so they go first
+        history = await asyncio.to_thread(conversation_archive.read_user, user_id) + history
+    return FastJSONResponse({"history": history}, headers={"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL})
+
+
+HISTORY_SEARCH_MAX_LIMIT = 100
+
+
+def build_fts_query(raw: str, user_id: Optional[str] = None) -> str:
+    """Turn free text into a safe FTS5 query: every term quoted and ANDed, a trailing * kept as a prefix match.
+
+    With user_id the query is also scoped to that user's owner token.
+    """
+    terms = []
+    for term in raw.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    if not terms or user_id is None:
+        return " ".join(terms)
+    owner = "u" + user_id.encode("utf-8").hex()
+    return f'owner : "{owner}" AND ({" ".join(terms)})'
+
+
+def archive_search_patterns(raw: str) -> List["re.Pattern"]:
+    """build_fts_query's terms as regexes, for the archives, which have no FTS index."""
+    patterns = []
+    for term in raw.split():
+        words = re.findall(r"\w+", term.rstrip("*"))
+        if words:
+            boundary = "" if term.endswith("*") else r"\b"
+            patterns.append(re.compile(r"\b" + r"\W+".join(map(re.escape, words)) + boundary, re.IGNORECASE))
+    return patterns
+
+
+def mark_snippet(text: str, patterns: List["re.Pattern"], context_chars: int = 60) -> str:
+    """Like FTS5 snippet(): the text around the first match, with matches in <mark>."""
+    text = text or ""
+    combined = re.compile("|".join(p.pattern for p in patterns), re.IGNORECASE) if patterns else None
+    first = combined.search(text) if combined else None
+    start = max(0, first.start() - context_chars) if first else 0
+    end = min(len(text), first.end() + context_chars if first else 2 * context_chars)
+    window = text[start:end]
+    if combined:
+        window = combined.sub(lambda m: f"<mark>{m.group(0)}</mark>", window)
+    return ("…" if start else "") + window + ("…" if end < len(text) else "")
+
+
+@app.get("/history/search")
+async def search_conversation_history(request: Request, q: str = "", limit: int = 20, offset: int = 0):
+    """Ranked full-text search over the caller's past messages and replies.
+
+    Archived turns (see archive.py) are older than every hot one and have no FTS index: they
+    follow the ranked results, newest first, with rank null.
+    """
+    if not FTS_ENABLED:
+        raise HTTPException(status_code=503, detail="Full-text search is not available")
+    user_id = get_history_user_id(request)
+    match = build_fts_query(q, user_id)
+    if not match:
+        raise HTTPException(status_code=400, detail="Missing search query")
+    limit = max(1, min(limit, HISTORY_SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+    db = next(get_db())
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    rows = db.execute(text(
+        """SELECT c.id, c.message, c.response, c.timestamp AS timestamp,
+                  snippet(conversations_fts, 0, '<mark>', '</mark>', '…', 16) AS message_snippet,
+                  snippet(conversations_fts, 1, '<mark>', '</mark>', '…', 16) AS response_snippet,
+                  bm25(conversations_fts, 1.0, 1.0, 0.0) AS rank
+           FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+           WHERE conversations_fts MATCH :match AND c.user_id = :user_id
+           ORDER BY rank LIMIT :limit OFFSET :offset"""
+    ).columns(timestamp=DateTime), {"match": match, "user_id": user_id, "limit": limit + 1, "offset": offset}).all()
+    results = [
         {
-            "id": h.id,
-            "user_id": h.user_id,
-            "message": h.message,
-            "response": h.response,
-            "timestamp": h.timestamp.isoformat()
+            "id": r.id,
+            "message": r.message,
+            "response": r.response,
+            "timestamp": r.timestamp,
+            "message_snippet": r.message_snippet,
+            "response_snippet": r.response_snippet,
+            "rank": r.rank,
         }
-        for h in history_db
+        for r in rows[:limit]
     ]
-    return {"history": history}
+    has_more = len(rows) > limit
+    patterns = archive_search_patterns(q)
+    if conversation_archive is not None and not has_more and patterns:
+        if rows:
+            hot_total = offset + len(rows)
+        else:
+            hot_total = db.execute(text(
+                """SELECT count(*) FROM conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid
+                   WHERE conversations_fts MATCH :match AND c.user_id = :user_id"""
+            ), {"match": match, "user_id": user_id}).scalar()
+        wanted = limit - len(results)
+        archived = await asyncio.to_thread(
+            conversation_archive.search_user, user_id,
+            lambda message, response: all(p.search(message) or p.search(response) for p in patterns),
+            max(0, offset - hot_total), wanted + 1)
+        results += [
+            {
+                "id": a["id"],
+                "message": a["message"],
+                "response": a["response"],
+                "timestamp": a["timestamp"],
+                "message_snippet": mark_snippet(a["message"], patterns),
+                "response_snippet": mark_snippet(a["response"], patterns),
+                "rank": None,
+            }
+            for a in archived[:wanted]
+        ]
+        has_more = len(archived) > wanted
+    return {"query": q, "results": results, "limit": limit, "offset": offset, "has_more": has_more}
 
 
 @app.post("/auth/token")
@@ -475,8 +1559,75 @@ async def auth_token(request: Request):
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+# User data deletion runs as a background job in bounded chunks so a heavy user's
+# history never holds the SQLite write lock for more than one short transaction.
+DELETE_CHUNK_ROWS = int(os.getenv("VIRGIL_DELETE_CHUNK_ROWS", "500"))
+MAX_DELETION_JOBS = 1000
+DELETION_JOBS: Dict[str, Dict[str, Any]] = {}
+_USERS_BEING_DELETED: set = set()
+
+
+def _delete_user_rows_chunk(model, user_id: str, limit: int) -> int:
+    """Delete up to limit rows of model for user_id in one transaction; runs on a worker thread."""
+    db = SessionLocal()
+    try:
+        ids = db.query(model.id).filter(model.user_id == user_id).limit(limit)
+        deleted = db.query(model).filter(model.id.in_(ids.scalar_subquery())).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def _register_deletion_job(user_id: str) -> Dict[str, Any]:
+    # Keep the registry bounded by forgetting the oldest finished jobs
+    if len(DELETION_JOBS) >= MAX_DELETION_JOBS:
+        finished = [jid for jid, j in DELETION_JOBS.items() if j["finished_at"]]
+        for old_id in finished[:len(DELETION_JOBS) - MAX_DELETION_JOBS + 1]:
+            del DELETION_JOBS[old_id]
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "status": "pending",
+        "reminders_deleted": 0,
+        "conversations_deleted": 0,
+        "archived_deleted": 0,
+        "created_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+        "error": None,
+    }
+    DELETION_JOBS[job["job_id"]] = job
+    return job
+
+
+async def run_user_data_deletion(job: Dict[str, Any]):
+    """Delete a user's reminders, then conversations, chunk by chunk, recording progress on job."""
+    user_id = job["user_id"]
+    job["status"] = "running"
+    try:
+        # Reminders first so nothing more gets pushed to the user while conversations are removed
+        for model, counter in ((PersistentReminder, "reminders_deleted"), (Conversation, "conversations_deleted")):
+            while True:
+                deleted = await asyncio.to_thread(_delete_user_rows_chunk, model, user_id, DELETE_CHUNK_ROWS)
+                job[counter] += deleted
+                (reminder_versions if model is PersistentReminder else history_versions).bump(user_id)
+                if deleted < DELETE_CHUNK_ROWS:
+                    break
+        if conversation_archive is not None:
+            job["archived_deleted"] = await asyncio.to_thread(conversation_archive.delete_user, user_id)
+            history_versions.bump(user_id)
+        job["status"] = "completed"
+    except Exception as e:
+        logger.exception(f"Error deleting data for user {user_id}: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.utcnow().isoformat()
+        _USERS_BEING_DELETED.discard(user_id)
+
+
 @app.delete("/user-data")
-async def delete_user_data(request: Request):
+async def delete_user_data(request: Request, background_tasks: BackgroundTasks):
     # Require JWT auth for destructive operations
     try:
         explicit_user = get_current_user_from_request(request)
@@ -492,13 +1643,34 @@ async def delete_user_data(request: Request):
         }, status_code=400)
 
     user_id = explicit_user
-    db = next(get_db())
-    # Delete conversations
-    db.query(Conversation).filter_by(user_id=user_id).delete()
-    # Delete reminders
-    db.query(PersistentReminder).filter_by(user_id=user_id).delete()
-    db.commit()
-    return JSONResponse({"status": "deleted", "user_id": user_id})
+    running = next((j for j in DELETION_JOBS.values() if j["user_id"] == user_id and not j["finished_at"]), None)
+    if running:
+        job = running
+    else:
+        # In-memory state goes right away; the database rows follow in the background
+        _USERS_BEING_DELETED.add(user_id)
+        CONVERSATION_HISTORY.pop(user_id, None)
+        PROMPT_PREFIXES.drop(user_id)
+        if retrieval_index is not None:
+            retrieval_index.drop(user_id)
+        job = _register_deletion_job(user_id)
+        background_tasks.add_task(run_user_data_deletion, job)
+    return JSONResponse({
+        "status": "accepted",
+        "job_id": job["job_id"],
+        "user_id": user_id,
+        "status_url": f"/user-data/jobs/{job['job_id']}",
+    }, status_code=202)
+
+
+@app.get("/user-data/jobs/{job_id}")
+async def get_user_data_job(job_id: str, request: Request):
+    """Progress of a /user-data deletion job; only visible to the user it belongs to."""
+    user_id = get_current_user_from_request(request)
+    job = DELETION_JOBS.get(job_id)
+    if not job or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 # Pre-defined responses for fallback
@@ -512,53 +1684,179 @@ FALLBACK_RESPONSES = [
 
 def get_system_prompt(tone: str = "default") -> str:
     """Get the system prompt based on the selected tone"""
-    base_prompt = "You are Virgil, a helpful and knowledgeable AI assistant."
-    
-    if tone == "friendly":
-        return f"{base_prompt} Respond in a warm, approachable, and conversational manner, using simple language and occasionally adding personal touches to build rapport."
-    elif tone == "professional":
-        return f"{base_prompt} Respond in a formal, precise, and structured manner, using professional language and focusing on delivering accurate and comprehensive information."
-    else:  # default
-        return f"{base_prompt} Provide helpful, accurate, and concise responses while balancing friendliness with professionalism."
+    return PROMPTS.get(tone).system_prompt
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/admin/traces")
+async def admin_traces(request: Request, limit: int = 20):
+    """Recent traces slower than VIRGIL_TRACE_SLOW_MS, newest first, with their spans."""
+    require_admin(request)
+    return {"slow_threshold_ms": tracer.slow_threshold_ms, "traces": tracer.recent_slow(max(1, min(limit, 100)))}
+
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10, interval_ms: float = 5, threads: str = "all"):
+    """Sample this worker's stacks for `seconds` and return collapsed stacks for a flame graph.
+
+    threads=loop samples only the event loop thread; threads=all includes worker threads.
+    """
+    require_admin(request)
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if threads not in ("all", "loop"):
+        raise HTTPException(status_code=400, detail="threads must be 'all' or 'loop'")
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    thread_ids = {threading.get_ident()} if threads == "loop" else None
+    try:
+        counts = await asyncio.to_thread(profiler.profile, seconds, max(interval_ms, 1) / 1000, thread_ids)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=format_collapsed(counts), media_type="text/plain")
+
+
+# --- HEALTH ---
+# /health/live and /health/ready answer from probes run in the background (see health.py),
+# so load balancer polling never reaches the database or the upstream APIs. The database
+# and the reminder scheduler are critical; inference and translation have fallbacks, so
+# their failure only reports "degraded".
+HEALTH_INTERVAL_SECONDS = float(os.getenv("VIRGIL_HEALTH_INTERVAL_SECONDS", "10"))
+HEALTH_TIMEOUT_SECONDS = float(os.getenv("VIRGIL_HEALTH_TIMEOUT_SECONDS", "3"))
+HEALTH_MAX_LAG_MS = float(os.getenv("VIRGIL_HEALTH_MAX_LAG_MS", "1000"))
+HEALTH_PROBE_UPSTREAM = os.getenv("VIRGIL_HEALTH_PROBE_UPSTREAM", "true").lower() == "true"
+health_monitor = HealthMonitor(HEALTH_INTERVAL_SECONDS, HEALTH_TIMEOUT_SECONDS, max_lag_ms=HEALTH_MAX_LAG_MS)
+
+
+def _check_database():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def _probe_database():
+    await asyncio.to_thread(_check_database)
+
+
+async def _probe_scheduler():
+    age = time.time() - _reminder_pusher_beat
+    if age > 10 * REMINDER_PUSH_INTERVAL:
+        raise RuntimeError(f"Reminder pusher last ran {age:.0f}s ago")
+    return {"last_tick_seconds_ago": round(age, 1)}
+
+
+async def _probe_url(url: str, headers: Optional[Dict[str, str]] = None):
+    """Reachability only: a GET that costs the upstream no inference."""
+    response = await HTTP_CLIENT.get(url, headers=headers)
+    if response.status_code >= 500:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return {"http_status": response.status_code}
+
+
+async def _probe_inference():
+    return await _probe_url(HUGGINGFACE_API_URL,
+                            {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"} if HUGGINGFACE_API_KEY else None)
+
+
+async def _probe_translation():
+    return await _probe_url(LIBRETRANSLATE_URL.rsplit("/translate", 1)[0] + "/languages")
+
+
+health_monitor.add("database", _probe_database)
+health_monitor.add("scheduler", _probe_scheduler)
+if HEALTH_PROBE_UPSTREAM:
+    health_monitor.add("inference", _probe_inference, critical=False)
+    if LIBRETRANSLATE_URL:
+        health_monitor.add("translation", _probe_translation, critical=False)
+health_monitor.report("connections", lambda: {
+    "notifications": len(manager.active_connections), "voice": len(_voice_sockets)})
+
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: 503 only when the event loop has recently stalled past VIRGIL_HEALTH_MAX_LAG_MS."""
+    report = health_monitor.live()
+    return FastJSONResponse(report, status_code=200 if report["status"] == "ok" else 503,
+                            headers={"Cache-Control": "no-store"})
+
+
+@app.get("/health")
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness from the latest background probe results; 503 unless "ok" or "degraded"."""
+    report = health_monitor.ready()
+    return FastJSONResponse(report, status_code=200 if HealthMonitor.is_ready(report) else 503,
+                            headers={"Cache-Control": "no-store"})
+
+
+ROOT_RESPONSE = static_json({
+    "status": "ok",
+    "name": "Virgil AI Assistant API",
+    "version": "1.0.0",
+    "endpoints": {
+        "/health": "Readiness with dependency status (same as /health/ready)",
+        "/health/live": "Liveness: process up and event loop responsive",
+        "/health/ready": "Readiness: database and scheduler healthy, from cached background probes",
+        "/tones": "Available conversation tones",
+        "/metrics": "Prometheus metrics",
+        "/admin/traces": "Recent slow request traces (admin only)",
+        "/admin/profile": "Sampling profile of this worker as collapsed stacks (admin only)",
+        "/admin/drain": "Take this worker out of rotation before a restart (admin only)",
+        "/guide": "Main conversation endpoint with context",
+        "/quick-guide": "Quick response endpoint",
+        "/ws/audio/{session_id}": "Voice conversation over WebSocket (PCM or WAV in, transcript and speech out)"
+    },
+    "huggingface_status": "Testing API connectivity with DistilBERT model. Please make request to verify token.",
+    "docs": "/docs"
+})
+
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint with API status information"""
-    return {
-        "status": "ok",
-        "name": "Virgil AI Assistant API",
-        "version": "1.0.0",
-        "endpoints": {
-            "/health": "Health check",
-            "/tones": "Available conversation tones",
-            "/guide": "Main conversation endpoint with context",
-            "/quick-guide": "Quick response endpoint"
-        },
-        "huggingface_status": "Testing API connectivity with DistilBERT model. Please make request to verify token.",
-        "docs": "/docs"
-    }
+    return static_json_response(request, ROOT_RESPONSE)
 
 
-@app.post("/guide")
-async def guide(request: Request):
-    data = await request.json()
-    message = data.get("message")
-    session_id = data.get("session_id", "default")
-    tone = data.get("tone", "default")
-    username = data.get("username", "guest")
-    if not message:
-        raise HTTPException(status_code=400, detail="Missing message")
+async def run_guide(message: str, session_id: str, tone: str = "default") -> str:
+    """One conversation turn: prompt from the session's history, completion, stored turn.
+
+    Shared by POST /guide and the voice WebSocket; call inside a trace.
+    """
     # Retrieve conversation history for context (from DB)
     db = next(get_db())
-    history_db = db.query(Conversation).filter_by(user_id=session_id).order_by(Conversation.timestamp.desc()).limit(MAX_HISTORY_LENGTH).all()
-    history = [{"user": h.message, "assistant": h.response} for h in reversed(history_db)]
-    # Compose prompt
-    prompt = get_system_prompt(tone)
-    # Add history to prompt
-    context = "\n".join([f"User: {h['user']}\nVirgil: {h['assistant']}" for h in history])
-    full_prompt = f"{prompt}\n{context}\nUser: {message}\nVirgil:"
-    # Call LLM (simulate with fallback if needed)
-    reply = await call_llm(full_prompt, message)
+    template = PROMPTS.get(tone)
+    with tracer.span("db.history_query") as span:
+        latest_id = db.query(func.max(Conversation.id)).filter(Conversation.user_id == session_id).scalar() or 0
+        prefix = PROMPT_PREFIXES.get(session_id, template, latest_id)
+        span.set("prefix_cached", prefix is not None)
+        if prefix is None:
+            history_db = db.query(Conversation).filter_by(user_id=session_id).order_by(Conversation.id.desc()).limit(MAX_HISTORY_LENGTH).all()
+            prefix = PROMPT_PREFIXES.build(session_id, template, [(h.id, h.message, h.response) for h in reversed(history_db)])
+            span.set("rows", len(history_db))
+            PROMPT_PREFIX_TOTAL.labels("rebuilt").inc()
+        else:
+            PROMPT_PREFIX_TOTAL.labels("reused").inc()
+    related_db = []
+    if retrieval_index is not None:
+        # Older turns that match this message go after the cached prefix, in what the prefix leaves
+        # of the prompt budget (at least RETRIEVAL_BUDGET_CHARS)
+        with tracer.span("retrieval.select") as span:
+            retrieval_index.ensure_backfill(session_id, load_turns_for_index)
+            related_ids = await asyncio.to_thread(retrieval_index.search, session_id, message, RETRIEVAL_TOP_K,
+                                                  exclude_ids=prefix.turn_ids)
+            if related_ids:
+                rows = {r.id: r for r in db.query(Conversation).filter(Conversation.id.in_(related_ids)).all()}
+                related_db = select_context_turns([], [rows[i] for i in related_ids if i in rows],
+                                                  max(0, PROMPT_HISTORY_BUDGET_CHARS - prefix.chars), keep_recent=0)
+            span.set("related", len(related_db))
+    with tracer.span("prompt.build") as span:
+        full_prompt = prefix.render(message, [(h.message, h.response) for h in related_db])
+        span.set("prompt_chars", len(full_prompt))
+        span.set("prefix_chars", prefix.chars)
+    # Call LLM (falls back to a canned reply if the API is unavailable)
+    reply = await _complete(full_prompt, message, prefix_hash=prefix.hash)
     # Save to history (in-memory for fast access)
     history_mem = CONVERSATION_HISTORY.get(session_id, [])
     history_mem.append({"user": message, "assistant": reply})
@@ -566,63 +1864,95 @@ async def guide(request: Request):
         history_mem = history_mem[-MAX_HISTORY_LENGTH:]
     CONVERSATION_HISTORY[session_id] = history_mem
     # Save to persistent DB
-    db.add(Conversation(user_id=session_id, message=message, response=reply))
-    db.commit()
-    return {"reply": reply, "session_id": session_id, "response_time": 0.5}
+    with tracer.span("db.commit"):
+        turn = Conversation(user_id=session_id, message=message, response=reply)
+        db.add(turn)
+        db.flush()
+        turn_id = turn.id
+        db.commit()
+    PROMPT_PREFIXES.append(session_id, turn_id, message, reply)
+    history_versions.bump(session_id)
+    if retrieval_index is not None:
+        retrieval_index.enqueue(session_id, turn_id, f"{message}\n{reply}")
+    return reply
+
+
+@app.post("/guide")
+@tracer.traced("POST /guide")
+async def guide(request: Request):
+    data = await request.json()
+    message = data.get("message")
+    session_id = data.get("session_id", "default")
+    tone = data.get("tone", "default")
+    username = data.get("username", "guest")
+    if not message:
+        raise HTTPException(status_code=400, detail="Missing message")
+    start_time = time.perf_counter()
+    reply = await run_guide(message, session_id, tone)
+    return {"reply": reply, "session_id": session_id, "response_time": time.perf_counter() - start_time}
     if len(CONVERSATION_HISTORY[session_id]) > MAX_HISTORY_LENGTH * 2:  # * 2 for user + assistant pairs
         CONVERSATION_HISTORY[session_id] = CONVERSATION_HISTORY[session_id][-MAX_HISTORY_LENGTH * 2:]
 
+# Fallback replies by topic and by tone; FALLBACK_RESPONSES covers everything else
+FALLBACK_TOPIC_RESPONSES = {
+    "water": "Staying hydrated is important! The recommended daily water intake varies by individual, but a general guideline is about 8 glasses (64 ounces) per day.",
+    "identity": "I'm Virgil, an AI assistant designed to be helpful, harmless, and honest. I'm here to assist with information and tasks to the best of my abilities.",
+}
+TONE_FALLBACK_RESPONSES = {
+    "friendly": [
+        "I'd love to help with that! Let me know if you need more information.",
+        "Great question! I'm here to assist you with whatever you need.",
+        "I'm excited to help you with this! What else would you like to know?"
+    ],
+    "professional": [
+        "I'd be pleased to assist with your inquiry. Please let me know if you require additional information.",
+        "Thank you for your question. I'm available to provide further assistance as needed.",
+        "I'm here to provide the information you're seeking. Please don't hesitate to ask for clarification."
+    ],
+}
+
+
 def get_fallback_response(message, tone=None):
     """Get a fallback response based on the message content."""
     message = message.lower()
     
     # Check for specific topics in the message
     if "water" in message or "drink" in message:
-        return "Staying hydrated is important! The recommended daily water intake varies by individual, but a general guideline is about 8 glasses (64 ounces) per day."
+        return FALLBACK_TOPIC_RESPONSES["water"]
     
     if "who are you" in message or "what are you" in message or "your name" in message:
-        return "I'm Virgil, an AI assistant designed to be helpful, harmless, and honest. I'm here to assist with information and tasks to the best of my abilities."
+        return FALLBACK_TOPIC_RESPONSES["identity"]
     
     # Default responses based on tone
-    if tone == "friendly":
-        return random.choice([
-            "I'd love to help with that! Let me know if you need more information.",
-            "Great question! I'm here to assist you with whatever you need.",
-            "I'm excited to help you with this! What else would you like to know?"
-        ])
-    elif tone == "professional":
-        return random.choice([
-            "I'd be pleased to assist with your inquiry. Please let me know if you require additional information.",
-            "Thank you for your question. I'm available to provide further assistance as needed.",
-            "I'm here to provide the information you're seeking. Please don't hesitate to ask for clarification."
-        ])
-    else:
-        return random.choice(FALLBACK_RESPONSES)
+    return random.choice(TONE_FALLBACK_RESPONSES.get(tone, FALLBACK_RESPONSES))
+
+
+def fallback_sentences() -> List[str]:
+    """Every sentence a fallback reply can contain, split the way stream_speech splits replies."""
+    replies = list(FALLBACK_TOPIC_RESPONSES.values()) + FALLBACK_RESPONSES
+    for responses in TONE_FALLBACK_RESPONSES.values():
+        replies += responses
+    return [sentence for reply in replies for sentence in split_sentences(reply)]
 
 async def generate_response(message, tone=None, previous_messages=None):
     """Generate a response using the Hugging Face API."""
-    logging.info(f"Testing API key with user message: {message}")
+    request_logger.info("Generating response", extra={"tone": tone, "user_message": message})
     
     try:
-        # Format messages for Mixtral model
-        formatted_prompt = ""
-        if previous_messages:
-            for msg in previous_messages:
-                if msg["role"] == "user":
-                    formatted_prompt += f"<s>[INST] {msg['content']} [/INST]"
-                else:  # assistant
-                    formatted_prompt += f" {msg['content']} </s>"
-        
-        # Add current message
-        if formatted_prompt:
-            formatted_prompt += f"<s>[INST] {message} [/INST]"
-        else:
-            formatted_prompt = f"<s>[INST] {message} [/INST]"
-        
-        # Add tone instruction if provided
-        if tone and tone != "default":
-            formatted_prompt = f"<s>[INST] Please respond in a {tone} tone to the following: {message} [/INST]"
-        
+        # Mixtral chat template: the tone's system prompt, then history as [INST] turns
+        formatted_prompt = PROMPTS.render(tone, pairs_from_messages(previous_messages), message)
+    except Exception as e:
+        logger.exception(f"Error generating response: {str(e)}")
+        return get_fallback_response(message)
+    return await _complete(formatted_prompt, message)
+
+async def _complete(formatted_prompt, message, prefix_hash=None):
+    """Send a formatted Mixtral prompt to the Hugging Face API and return the generated text.
+
+    prefix_hash identifies the session's cached prompt prefix; it is passed upstream so
+    backends with prefix/KV caching (or a router in front of them) can reuse that work.
+    """
+    try:
         payload = {
             "inputs": formatted_prompt,
             "parameters": {
@@ -634,13 +1964,24 @@ async def generate_response(message, tone=None, previous_messages=None):
         }
         
         headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
+        if prefix_hash:
+            headers["X-Prefix-Hash"] = prefix_hash
+        INFERENCE_PROMPT_BYTES.observe(len(formatted_prompt.encode("utf-8")))
         
-        logging.info("Sending request to Hugging Face API")
-        response = await HTTP_CLIENT.post(
-            HUGGINGFACE_API_URL,
-            json=payload,
-            headers=headers
-        )
+        request_logger.info("Sending request to Hugging Face API")
+        started = time.perf_counter()
+        with tracer.span("inference.http", prompt_chars=len(formatted_prompt)) as span:
+            try:
+                response = await HTTP_CLIENT.post(
+                    HUGGINGFACE_API_URL,
+                    json=payload,
+                    headers=headers
+                )
+            except Exception:
+                INFERENCE_DURATION.labels("error").observe(time.perf_counter() - started)
+                raise
+            INFERENCE_DURATION.labels(response.status_code).observe(time.perf_counter() - started)
+            span.set("http.status_code", response.status_code)
         
         if response.status_code == 200:
             result = response.json()
@@ -652,14 +1993,15 @@ async def generate_response(message, tone=None, previous_messages=None):
                     generated_text = generated_text[len(formatted_prompt):].strip()
                 return generated_text
             else:
-                logging.error(f"Unexpected response format: {result}")
+                logger.error("Unexpected response format from Hugging Face API", extra={"reply": result})
                 return get_fallback_response(message)
         else:
-            logging.error(f"HTTP error {response.status_code} from Hugging Face API: {response.text}")
+            # The error body can echo the prompt, so it goes in a redacted field
+            logger.error(f"HTTP error {response.status_code} from Hugging Face API", extra={"reply": response.text[:200]})
             return get_fallback_response(message)
             
     except Exception as e:
-        logging.exception(f"Error generating response: {str(e)}")
+        logger.exception(f"Error generating response: {str(e)}")
         return get_fallback_response(message)
 
 @app.post("/guide")
@@ -672,7 +2014,7 @@ async def guide(request: Request):
         session_id = data.get("session_id", str(uuid.uuid4()))
         tone = data.get("tone", "default")
         
-        logging.info(f"Processing guide request with tone {tone}")
+        request_logger.info("Processing guide request", extra={"tone": tone})
         
         # Get previous messages
         previous_messages = get_previous_messages(session_id)
@@ -694,10 +2036,11 @@ async def guide(request: Request):
             "response_time": end_time - start_time
         }
     except Exception as e:
-        logging.exception(f"Error in guide: {str(e)}")
+        logger.exception(f"Error in guide: {str(e)}")
         return {"reply": "I apologize, but I encountered an error. Please try again.", "error": str(e)}
 
 @app.post("/quick-guide")
+@tracer.traced("POST /quick-guide")
 async def quick_guide(request: Request):
     """Endpoint for one-off responses without maintaining conversation history."""
     try:
@@ -706,7 +2049,7 @@ async def quick_guide(request: Request):
         message = data.get("message", "")
         tone = data.get("tone", "default")
         
-        logging.info(f"Processing quick-guide request with tone {tone}")
+        request_logger.info("Processing quick-guide request", extra={"tone": tone})
         
         start_time = time.time()
         
@@ -721,5 +2064,5 @@ async def quick_guide(request: Request):
             "response_time": end_time - start_time
         }
     except Exception as e:
-        logging.exception(f"Error in quick-guide: {str(e)}")
+        logger.exception(f"Error in quick-guide: {str(e)}")
         return {"reply": "I apologize, but I encountered an error. Please try again.", "error": str(e)} 
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Replay log for WebSocket notifications.
+
+Every notification sent to a user carries a sequence number and the process epoch. A
+client that reconnects with ?since=<seq>&epoch=<epoch> gets what it missed replayed from
+a bounded per-user log before anything new, so a dropped socket costs nothing and the
+client has no reason to poll /reminders.
+
+Sequence numbers come from one process-wide counter, so each user's are increasing but
+not contiguous. That keeps them increasing even after a user's log has been evicted
+and started again (the same trick as conditional.VersionCounter). The epoch is random per
+process. A since= from another epoch, or one older than what the log still holds,
+yields the whole log with complete=False, telling the client it may have missed
+something and should reconcile once through /reminders. Clients should ignore a seq
+they have already seen; a notification can arrive both by replay and live.
+"""
+
+import itertools
+import secrets
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastjson import dumps
+
+
+class NotificationLog:
+    """The last per_user notifications for each of up to max_users users."""
+
+    def __init__(self, per_user: int = 100, max_users: int = 10000):
+        self.per_user = per_user
+        self.max_users = max_users
+        self.epoch = secrets.token_hex(4)
+        self._logs: "OrderedDict[str, deque[Tuple[int, str]]]" = OrderedDict()
+        self._truncated: Dict[str, int] = {}  # highest seq that fell off a user's log
+        self._evicted = 0  # highest seq of any evicted user's log
+        self._sequence = itertools.count(1)
+
+    def next_message(self, payload: Dict[str, Any]) -> Tuple[int, str]:
+        """Number a notification; the message is not logged until record() is called."""
+        seq = next(self._sequence)
+        return seq, dumps(dict(payload, seq=seq, epoch=self.epoch)).decode("utf-8")
+
+    def record(self, user_id: str, seq: int, message: str) -> None:
+        log = self._logs.get(user_id)
+        if log is None:
+            log = self._logs[user_id] = deque()
+        self._logs.move_to_end(user_id)
+        log.append((seq, message))
+        if len(log) > self.per_user:
+            self._truncated[user_id] = log.popleft()[0]
+        while len(self._logs) > self.max_users:
+            evicted_user, evicted = self._logs.popitem(last=False)
+            self._truncated.pop(evicted_user, None)
+            self._evicted = max(self._evicted, evicted[-1][0])
+
+    def latest(self, user_id: str) -> int:
+        log = self._logs.get(user_id)
+        return log[-1][0] if log else 0
+
+    def replay(self, user_id: str, since: int, epoch: Optional[str] = None) -> Tuple[List[str], bool]:
+        """Messages after since, oldest first, and whether that is everything the client missed."""
+        log = self._logs.get(user_id, ())
+        if epoch is not None and epoch != self.epoch:
+            return [message for _, message in log], False
+        complete = since >= self._truncated.get(user_id, 0) and (user_id in self._logs or since >= self._evicted)
+        return [message for seq, message in log if seq > since], complete
@@ -0,0 +1,127 @@
+"""
+Live-process profiling without restarting the worker.
+
+SamplingProfiler walks the stacks of running threads from a background thread every few
+milliseconds (``sys._current_frames``), so the profiled code pays nothing beyond the
+GIL hand-offs. Results are in the collapsed-stack format (``frame;frame;frame count``)
+read by flamegraph.pl, speedscope and inferno.
+
+LoopWatchdog reports event loop stalls. A heartbeat task on the loop records when it
+last ran; a watcher thread notices when the heartbeat is late and captures the loop
+thread's stack while it is still blocked, so the report names the blocking code.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def collapse_stack(frame, max_depth: int = 128) -> str:
+    """Render a frame and its callers root-first, joined by semicolons."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005,
+                thread_ids: Optional[set] = None) -> Dict[str, int]:
+        """Sample stacks for `seconds`; returns {collapsed_stack: samples}.
+
+        thread_ids limits sampling to those threads; by default every thread except the
+        sampler itself is included, with the thread name as the root frame.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            counts: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me or (thread_ids is not None and ident not in thread_ids):
+                        continue
+                    if ident not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    root = names.get(ident, f"thread-{ident}").replace(";", ",")
+                    counts[f"{root};{collapse_stack(frame)}"] += 1
+                time.sleep(interval)
+            return dict(counts)
+        finally:
+            self._lock.release()
+
+
+def format_collapsed(counts: Dict[str, int]) -> str:
+    """Collapsed-stack text, heaviest stacks first."""
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items(), key=lambda item: -item[1]))
+
+
+class LoopWatchdog:
+    """Logs (and reports through on_block) any stretch where the event loop is blocked
+    longer than threshold_ms."""
+
+    def __init__(self, threshold_ms: float = 100.0,
+                 on_block: Optional[Callable[[float, str], None]] = None):
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 2
+        self.on_block = on_block
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stall_stack: Optional[str] = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Attach to the running event loop; call from inside it."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            self._beat = expected
+            await asyncio.sleep(self.interval)
+            blocked = time.monotonic() - expected
+            stack, self._stall_stack = self._stall_stack or "unknown", None
+            if blocked >= self.threshold:
+                logger.warning(f"Event loop blocked for {blocked * 1000:.0f} ms in: {stack}")
+                if self.on_block is not None:
+                    self.on_block(blocked, stack)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self._stall_stack is None and time.monotonic() - self._beat >= self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stall_stack = collapse_stack(frame)
+                del frame
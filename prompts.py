@@ -0,0 +1,250 @@
+"""
+Prompt templates for the Mixtral chat format.
+
+Each tone is compiled once into the constant text that opens every prompt (the system
+prompt inside the first [INST]), so building a prompt is a single join over the history:
+
+    <s>[INST] {system}\n\n{user 1} [/INST] {assistant 1}</s>[INST] {user 2} [/INST] ... [INST] {message} [/INST]
+
+Built-in tones can be extended or overridden from a YAML or JSON file (VIRGIL_TONES_FILE):
+
+    tones:
+      socratic:
+        description: Guides with questions instead of answers
+        instruction: Answer with one or two guiding questions that help the user reason it out.
+
+``instruction`` is appended to the base prompt; ``system`` replaces it entirely.
+
+PrefixCache keeps each session's rendered prompt prefix (head plus past turns) between
+requests. A new turn is appended, not re-rendered, so consecutive prompts share a
+byte-identical prefix that upstream prefix/KV caches can reuse. When the prefix outgrows
+its budget it is cut back to half in one step rather than sliding a turn at a time, which
+would change the prefix on every request.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+BASE_PROMPT = "You are Virgil, a helpful and knowledgeable AI assistant."
+
+BUILTIN_TONES = {
+    "default": {
+        "description": "Balanced and concise",
+        "instruction": "Provide helpful, accurate, and concise responses while balancing friendliness with professionalism.",
+    },
+    "friendly": {
+        "description": "Warm and conversational",
+        "instruction": "Respond in a warm, approachable, and conversational manner, using simple language and occasionally adding personal touches to build rapport.",
+    },
+    "professional": {
+        "description": "Formal and structured",
+        "instruction": "Respond in a formal, precise, and structured manner, using professional language and focusing on delivering accurate and comprehensive information.",
+    },
+}
+
+_TURN_SEPARATOR = "</s>[INST] "
+_END_USER = " [/INST] "
+_END_PROMPT = " [/INST]"
+_RELATED_HEADER = "Earlier in our conversation:\n"
+
+
+class ToneTemplate:
+    """One tone's system prompt and the prompt head compiled from it."""
+
+    __slots__ = ("name", "description", "system_prompt", "head")
+
+    def __init__(self, name: str, description: str, system_prompt: str):
+        self.name = name
+        self.description = description
+        self.system_prompt = system_prompt
+        self.head = f"<s>[INST] {system_prompt}\n\n"
+
+    def render(self, history: Iterable[Tuple[str, str]], message: str) -> str:
+        """Full prompt for history ((user, assistant) pairs, oldest first) plus the new message."""
+        parts = [self.head]
+        for user, assistant in history:
+            parts += (user or "", _END_USER, assistant or "", _TURN_SEPARATOR)
+        parts += (message, _END_PROMPT)
+        return "".join(parts)
+
+    @staticmethod
+    def render_turn(user: str, assistant: str) -> str:
+        return "".join((user or "", _END_USER, assistant or "", _TURN_SEPARATOR))
+
+    @staticmethod
+    def render_suffix(message: str, related: Iterable[Tuple[str, str]] = ()) -> str:
+        """The part after a cached prefix: retrieved older turns (quoted) and the new message."""
+        parts = []
+        for user, assistant in related:
+            if not parts:
+                parts.append(_RELATED_HEADER)
+            parts += ("User: ", user or "", "\nVirgil: ", assistant or "", "\n")
+        if parts:
+            parts.append("\n")
+        parts += (message, _END_PROMPT)
+        return "".join(parts)
+
+
+class PromptTemplates:
+    """Registry of compiled tones; unknown tone names fall back to "default"."""
+
+    def __init__(self, tones: Dict[str, dict]):
+        self._tones: Dict[str, ToneTemplate] = {}
+        for name, spec in tones.items():
+            if not isinstance(spec, dict) or not (spec.get("system") or spec.get("instruction")):
+                raise ValueError(f"Tone {name!r} needs a 'system' or 'instruction' string")
+            system_prompt = spec.get("system") or f"{BASE_PROMPT} {spec['instruction']}"
+            self._tones[name] = ToneTemplate(name, spec.get("description", ""), system_prompt)
+        if "default" not in self._tones:
+            raise ValueError("A 'default' tone is required")
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "PromptTemplates":
+        """Built-in tones plus any defined in the YAML/JSON file at path."""
+        tones = {name: dict(spec) for name, spec in BUILTIN_TONES.items()}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                if os.path.splitext(path)[1].lower() == ".json":
+                    config = json.load(f)
+                else:
+                    import yaml
+                    config = yaml.safe_load(f)
+            custom = (config or {}).get("tones")
+            if not isinstance(custom, dict):
+                raise ValueError(f"{path}: expected a 'tones' mapping")
+            tones.update(custom)
+        return cls(tones)
+
+    def get(self, tone: Optional[str]) -> ToneTemplate:
+        return self._tones.get(tone or "default") or self._tones["default"]
+
+    def names(self) -> List[str]:
+        return list(self._tones)
+
+    def descriptions(self) -> Dict[str, str]:
+        return {name: t.description for name, t in self._tones.items()}
+
+    def render(self, tone: Optional[str], history: Iterable[Tuple[str, str]], message: str) -> str:
+        return self.get(tone).render(history, message)
+
+
+def pairs_from_messages(messages: Sequence[dict]) -> List[Tuple[str, str]]:
+    """Turn a [{"role", "content"}, ...] list into (user, assistant) pairs, dropping unanswered turns."""
+    pairs = []
+    pending = None
+    for msg in messages or ():
+        if msg.get("role") == "user":
+            pending = msg.get("content", "")
+        elif pending is not None:
+            pairs.append((pending, msg.get("content", "")))
+            pending = None
+    return pairs
+
+
+class SessionPrefix:
+    """A session's rendered prompt prefix with a running hash of its text."""
+
+    __slots__ = ("tone", "turns", "parts", "chars", "through_id", "_hasher")
+
+    def __init__(self, tone: ToneTemplate, turns: Iterable[Tuple[int, str, str]] = (), through_id: int = 0):
+        """through_id is the newest turn the prefix accounts for, even if it did not fit."""
+        self.tone = tone
+        self.through_id = through_id
+        self.turns: List[Tuple[int, str, str]] = []
+        self.parts: List[str] = []
+        self.chars = 0
+        self._hasher = hashlib.sha256()
+        self._extend(tone.head)
+        for turn in turns:
+            self.append(*turn)
+
+    def _extend(self, piece: str) -> None:
+        self.parts.append(piece)
+        self.chars += len(piece)
+        self._hasher.update(piece.encode("utf-8"))
+
+    def append(self, turn_id: int, user: str, assistant: str) -> None:
+        self.turns.append((turn_id, user, assistant))
+        self._extend(ToneTemplate.render_turn(user, assistant))
+
+    @property
+    def last_id(self) -> int:
+        return max(self.turns[-1][0] if self.turns else 0, self.through_id)
+
+    @property
+    def turn_ids(self) -> List[int]:
+        return [turn_id for turn_id, _, _ in self.turns]
+
+    @property
+    def text(self) -> str:
+        if len(self.parts) > 1:
+            self.parts[:] = ["".join(self.parts)]
+        return self.parts[0]
+
+    @property
+    def hash(self) -> str:
+        return self._hasher.copy().hexdigest()
+
+    def render(self, message: str, related: Iterable[Tuple[str, str]] = ()) -> str:
+        return self.text + ToneTemplate.render_suffix(message, related)
+
+
+class PrefixCache:
+    """Per-session SessionPrefix objects, least recently used evicted beyond max_sessions.
+
+    A cached prefix is only used while its last turn is the session's newest stored turn,
+    so turns written by another worker or deleted in the meantime force a rebuild.
+    """
+
+    def __init__(self, budget_chars: int, max_turns: int, max_sessions: int = 10000):
+        self.budget_chars = budget_chars
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionPrefix]" = OrderedDict()
+
+    def get(self, session_id: str, tone: ToneTemplate, latest_turn_id: int) -> Optional[SessionPrefix]:
+        prefix = self._sessions.get(session_id)
+        if prefix is None or prefix.tone is not tone or prefix.last_id != latest_turn_id:
+            return None
+        self._sessions.move_to_end(session_id)
+        return prefix
+
+    def build(self, session_id: str, tone: ToneTemplate, turns: Sequence[Tuple[int, str, str]]) -> SessionPrefix:
+        """Start a prefix from stored turns (oldest first), keeping the newest that fit half the budget."""
+        # A turn too long to keep still counts as seen, so the next get() for it is a hit
+        prefix = SessionPrefix(tone, self._fit(tone, turns), turns[-1][0] if turns else 0)
+        self._sessions[session_id] = prefix
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return prefix
+
+    def append(self, session_id: str, turn_id: int, user: str, assistant: str) -> Optional[SessionPrefix]:
+        """Add a completed turn to the session's prefix, cutting it back once it is over budget."""
+        prefix = self._sessions.get(session_id)
+        if prefix is None or turn_id <= prefix.last_id:
+            return None
+        prefix.append(turn_id, user, assistant)
+        if prefix.chars > self.budget_chars or len(prefix.turns) > self.max_turns:
+            prefix = self.build(session_id, prefix.tone, prefix.turns)
+        return prefix
+
+    def drop(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def _fit(self, tone: ToneTemplate, turns: Sequence[Tuple[int, str, str]]) -> List[Tuple[int, str, str]]:
+        if len(tone.head) + sum(len(u or "") + len(a or "") + 16 for _, u, a in turns) <= self.budget_chars // 2 \
+                and len(turns) <= self.max_turns // 2:
+            return list(turns)
+        kept = []
+        used = len(tone.head)
+        for turn in reversed(turns):
+            cost = len(turn[1] or "") + len(turn[2] or "") + 16  # [INST] markers
+            if used + cost > self.budget_chars // 2 or len(kept) >= max(1, self.max_turns // 2):
+                break
+            kept.append(turn)
+            used += cost
+        return kept[::-1]
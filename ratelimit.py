@@ -0,0 +1,225 @@
+"""
+Token-bucket rate limiting for expensive endpoints.
+
+Each limited route has a bucket per caller, and every caller also has one bucket shared
+by all limited routes (their overall quota). A request takes one token from both, and
+only when both have one; an empty bucket gets a 429 with Retry-After set to when the
+next token arrives.
+
+Buckets live in a BucketStore. MemoryBucketStore is per process. SQLiteBucketStore
+shares buckets between the workers of one host through a small SQLite file.
+"""
+
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class Limit:
+    """`requests` per `seconds`, allowing bursts of up to `burst` (default: requests)."""
+
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, requests: float, seconds: float, burst: Optional[float] = None):
+        if requests <= 0 or seconds <= 0:
+            raise ValueError("A limit needs positive requests and seconds")
+        self.rate = requests / seconds
+        self.burst = float(burst if burst is not None else requests)
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        """Parse "requests/seconds" or "requests/seconds:burst", e.g. "20/60:5"."""
+        window, _, burst = spec.strip().partition(":")
+        requests, _, seconds = window.partition("/")
+        return cls(float(requests), float(seconds or 1), float(burst) if burst else None)
+
+
+def parse_route_limits(spec: str) -> Dict[str, Limit]:
+    """Parse "/guide=20/60:5,/calculate=120/60" into {path: Limit}."""
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            path, limit = item.split("=", 1)
+            limits[path.strip()] = Limit.parse(limit)
+    return limits
+
+
+def _refill(tokens: float, updated: float, now: float, limit: Limit) -> float:
+    return min(limit.burst, tokens + (now - updated) * limit.rate)
+
+
+def _take_tokens(levels: List[float], limits: Sequence[Limit]) -> Tuple[bool, float]:
+    """Take one token from every bucket if each has one, in place; else take none."""
+    waits = [(1.0 - tokens) / limit.rate for tokens, limit in zip(levels, limits) if tokens < 1.0]
+    if waits:
+        return False, max(waits)
+    levels[:] = [tokens - 1.0 for tokens in levels]
+    return True, 0.0
+
+
+class MemoryBucketStore:
+    """Per-process buckets in an LRU map.
+
+    An idle bucket refills completely after burst / rate seconds, so dropping it loses
+    nothing; the least recently used buckets are evicted once idle_seconds have passed or
+    the map holds max_keys. Every operation is O(1) amortized.
+    """
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100000, idle_seconds: float = 3600.0):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, limit: Limit, now: Optional[float] = None) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until a token is available if not)."""
+        return self.take_all([(key, limit)], now)
+
+    def take_all(self, buckets: Sequence[Tuple[str, Limit]], now: Optional[float] = None) -> Tuple[bool, float]:
+        """Take one token from each bucket, or from none of them if any is empty."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            levels = []
+            for key, limit in buckets:
+                state = self._buckets.pop(key, None)
+                levels.append(limit.burst if state is None else _refill(state[0], state[1], now, limit))
+            allowed, wait = _take_tokens(levels, [limit for _, limit in buckets])
+            for (key, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens, now)
+            self._evict(now)
+        return allowed, wait
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - updated < self.idle_seconds:
+                return
+            del self._buckets[key]
+
+
+class SQLiteBucketStore:
+    """Buckets shared by every worker on a host through one SQLite file.
+
+    Each take is a short IMMEDIATE transaction, so it blocks: callers on the event loop
+    should run it in a thread (see RateLimiter.check).
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, idle_seconds: float = 3600.0, sweep_every: int = 1000):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._takes = 0
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS rate_buckets "
+                     "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing a few token updates in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, limit: Limit, now: Optional[float] = None) -> Tuple[bool, float]:
+        return self.take_all([(key, limit)], now)
+
+    def take_all(self, buckets: Sequence[Tuple[str, Limit]], now: Optional[float] = None) -> Tuple[bool, float]:
+        # Wall-clock time, since monotonic clocks are not comparable across processes
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, limit in buckets:
+                row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                levels.append(limit.burst if row is None else _refill(row[0], row[1], now, limit))
+            allowed, wait = _take_tokens(levels, [limit for _, limit in buckets])
+            conn.executemany("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                             [(key, tokens, now) for (key, _), tokens in zip(buckets, levels)])
+            self._takes += 1
+            if self._takes % self.sweep_every == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_seconds,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, wait
+
+
+class RateLimiter:
+    def __init__(self, store, route_limits: Dict[str, Limit], user_limit: Optional[Limit] = None,
+                 methods: Tuple[str, ...] = ("POST",)):
+        self.store = store
+        self.route_limits = route_limits
+        self.user_limit = user_limit
+        self.methods = methods
+
+    def _take_all(self, path: str, identity: str) -> float:
+        """Returns 0 if allowed, else the Retry-After delay in seconds."""
+        buckets = [(f"{path}|{identity}", self.route_limits[path])]
+        if self.user_limit is not None:
+            buckets.append((f"*|{identity}", self.user_limit))
+        return self.store.take_all(buckets)[1]
+
+    async def check(self, path: str, identity: str) -> float:
+        if self.store.blocking:
+            return await asyncio.to_thread(self._take_all, path, identity)
+        return self._take_all(path, identity)
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 + Retry-After when a caller's bucket is empty.
+
+    identify(scope) returns the caller key (e.g. the JWT subject or client IP);
+    on_limited(path) is called for every rejected request.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, identify: Callable[[dict], str],
+                 on_limited: Optional[Callable[[str], None]] = None):
+        self.app = app
+        self.limiter = limiter
+        self.identify = identify
+        self.on_limited = on_limited
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["path"] not in self.limiter.route_limits
+                or scope["method"] not in self.limiter.methods):
+            return await self.app(scope, receive, send)
+        wait = await self.limiter.check(scope["path"], self.identify(scope))
+        if not wait:
+            return await self.app(scope, receive, send)
+        if self.on_limited is not None:
+            self.on_limited(scope["path"])
+        retry_after = max(1, math.ceil(wait))
+        body = json.dumps({"detail": "Rate limit exceeded", "retry_after": retry_after}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def make_store(backend: str, path: str = "", idle_seconds: float = 3600.0):
+    if backend == "memory":
+        return MemoryBucketStore(idle_seconds=idle_seconds)
+    if backend == "sqlite":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteBucketStore(path, idle_seconds=idle_seconds)
+    raise ValueError(f"Unknown rate limit backend: {backend!r} (expected 'memory' or 'sqlite')")
@@ -0,0 +1,125 @@
+"""
+Recurrence rules for reminders.
+
+A recurring reminder is stored as a single row: its next occurrence in remind_at and the
+rule as a short string in recurrence. When an occurrence is delivered the row moves on
+to the following one (Rule.next_after) instead of being marked delivered, so a routine
+costs one row however long it runs, and nothing is materialized ahead of time.
+
+Rules, all evaluated in UTC like remind_at itself:
+
+    hourly, daily, weekly           every 1h, every 1d, every 1w
+    every <n><m|h|d|w>              a fixed interval, e.g. "every 90m", "every 2w"
+    <min> <hour> <dom> <mon> <dow>  five-field cron: *, lists, ranges and steps
+                                    ("30 7 * * 1-5"); dow 0 and 7 are Sunday
+
+Intervals keep the phase of the first occurrence: after downtime, the missed occurrences
+are skipped rather than delivered in a burst.
+"""
+
+import abc
+import functools
+import re
+from datetime import datetime, timedelta
+from typing import FrozenSet, Optional
+
+ALIASES = {"hourly": "every 1h", "daily": "every 1d", "weekly": "every 1w"}
+UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+INTERVAL = re.compile(r"every\s+(\d+)\s*([mhdw])")
+MIN_INTERVAL = timedelta(minutes=1)
+MAX_INTERVAL = timedelta(weeks=520)
+# A cron rule that matches no date this far ahead (e.g. "0 0 31 2 *") never fires
+CRON_HORIZON_DAYS = 5 * 366
+MAX_RULE_LENGTH = 100
+
+
+class Rule(abc.ABC):
+    @abc.abstractmethod
+    def next_after(self, previous: datetime, now: datetime) -> Optional[datetime]:
+        """The first occurrence after now, given the previous one; None if there is none."""
+
+
+class IntervalRule(Rule):
+    def __init__(self, step: timedelta):
+        self.step = step
+
+    def next_after(self, previous: datetime, now: datetime) -> Optional[datetime]:
+        missed = max(0, (now - previous) // self.step)
+        return previous + (missed + 1) * self.step
+
+
+class CronRule(Rule):
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31), ("month", 1, 12), ("day of week", 0, 7))
+
+    def __init__(self, fields):
+        minutes, hours, days, months, weekdays = (
+            _cron_field(text, name, low, high) for text, (name, low, high) in zip(fields, self.FIELDS))
+        self.minutes, self.hours = sorted(minutes), sorted(hours)
+        self.days, self.months = days, months
+        self.weekdays = frozenset(d % 7 for d in weekdays)
+        # As in cron, a restricted day of month and day of week match either, not both
+        self.any_day = fields[2] == "*" or fields[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, previous: datetime, now: datetime) -> Optional[datetime]:
+        after = max(previous, now).replace(second=0, microsecond=0)
+        day = after.replace(hour=0, minute=0)
+        for _ in range(CRON_HORIZON_DAYS):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate > after:
+                            return candidate
+            day += timedelta(days=1)
+        return None
+
+
+def _cron_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        body, _, step = part.partition("/")
+        if body == "*":
+            start, end = low, high
+        elif "-" in body:
+            start, end = (int(v) for v in body.split("-", 1))
+        else:
+            start = end = int(body)
+            if step:
+                end = high
+        step = int(step) if step else 1
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"{name} out of range in {text!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_rule(rule: str) -> Rule:
+    """Parse a recurrence rule, raising ValueError if it is not one of the forms above."""
+    text = " ".join(rule.lower().split())
+    if not text or len(text) > MAX_RULE_LENGTH:
+        raise ValueError("Recurrence rule is empty or too long")
+    text = ALIASES.get(text, text)
+    match = INTERVAL.fullmatch(text)
+    if match:
+        count, unit = int(match.group(1)), UNITS[match.group(2)]
+        if not MIN_INTERVAL <= timedelta(**{unit: min(count, 10 ** 6)}) <= MAX_INTERVAL:
+            raise ValueError("Recurrence interval must be between a minute and ten years")
+        step = timedelta(**{unit: count})
+        return IntervalRule(step)
+    fields = text.split(" ")
+    if len(fields) == 5:
+        try:
+            return CronRule(fields)
+        except ValueError as e:
+            raise ValueError(f"Invalid cron rule {rule!r}: {e}") from None
+    raise ValueError(f"Unrecognized recurrence rule {rule!r}")
@@ -0,0 +1,260 @@
+"""
+Semantic retrieval of past conversation turns for /guide.
+
+Turns are embedded with a hashing-trick bag of words and bigrams, so there is no model
+to download and embedding a turn costs microseconds. Each user's vectors live in two
+append-only files (float32 rows and int64 turn ids) that are read back through a memory
+map, so a search never loads a whole history into the Python heap.
+
+Indexing happens on a background task: the request path only enqueues the new turn.
+Only the most recently used users' indexes are kept open; the maps of the others are
+released and reopened on their next search.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from have how i if in is it me my of on or "
+    "so that the this to was we what when with you your".split()
+)
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Return a unit-length float32 vector for text using signed feature hashing."""
+    tokens = [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+    # Bigrams add a little word-order signal but weigh less than the words themselves
+    features = [(t, 1.0) for t in tokens] + [(f"{a} {b}", 0.5) for a, b in zip(tokens, tokens[1:])]
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    # Damp repeated terms so one word said ten times does not dominate
+    np.copysign(np.sqrt(np.abs(vector)), vector, out=vector)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class TurnIndex:
+    """Append-only vectors for one user's turns, persisted as raw rows and read through a memory map."""
+
+    def __init__(self, directory: str, key: str, dim: int = EMBEDDING_DIM):
+        self.vectors_path = os.path.join(directory, f"{key}.f32")
+        self.ids_path = os.path.join(directory, f"{key}.ids")
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._ids: Optional[np.ndarray] = None
+        self._vectors: Optional[np.ndarray] = None
+
+    def _rows_on_disk(self) -> int:
+        if not os.path.exists(self.ids_path) or not os.path.exists(self.vectors_path):
+            return 0
+        # A crash between the two appends leaves one file longer; only whole pairs count
+        return min(os.path.getsize(self.ids_path) // 8, os.path.getsize(self.vectors_path) // (4 * self.dim))
+
+    def _load(self) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self._rows_on_disk()
+        # Another TurnIndex for the same files (one reopened after eviction) may have appended
+        if self._ids is None or len(self._ids) != rows:
+            if rows:
+                self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            else:
+                self._ids = np.empty(0, dtype=np.int64)
+                self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        return self._ids, self._vectors
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load()[0])
+
+    @property
+    def last_id(self) -> int:
+        with self._lock:
+            ids = self._load()[0]
+            return int(ids[-1]) if len(ids) else 0
+
+    def append(self, turn_ids: Sequence[int], vectors: np.ndarray) -> None:
+        if not len(turn_ids):
+            return
+        with self._lock:
+            rows = self._rows_on_disk()
+            self._ids = self._vectors = None
+            for path, row_bytes in ((self.ids_path, 8), (self.vectors_path, 4 * self.dim)):
+                with open(path, "ab") as f:
+                    f.truncate(rows * row_bytes)
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(np.asarray(turn_ids, dtype=np.int64).tobytes())
+
+    def search(self, query: np.ndarray, k: int, exclude_ids: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Return up to k (turn_id, score) pairs by cosine similarity, best first."""
+        with self._lock:
+            ids, vectors = self._load()
+            if not len(ids) or k <= 0:
+                return []
+            scores = vectors @ query
+            exclude = np.fromiter(exclude_ids, dtype=np.int64)
+            if len(exclude):
+                scores = np.where(np.isin(ids, exclude), -np.inf, scores)
+            k = min(k, len(ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i]) and scores[i] > 0]
+
+    def close(self) -> None:
+        """Release the memory maps; the index reopens them when next used."""
+        with self._lock:
+            self._ids = self._vectors = None
+
+    def delete(self) -> None:
+        with self._lock:
+            self._ids = self._vectors = None
+            for path in (self.ids_path, self.vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class RetrievalIndex:
+    """Per-user TurnIndex registry fed by a background indexing task.
+
+    At most max_open indexes are kept, least recently used closed first.
+    """
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM, max_pending: int = 10000, max_open: int = 1000):
+        self.directory = directory
+        self.dim = dim
+        self.max_open = max_open
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._indexes: "OrderedDict[str, TurnIndex]" = OrderedDict()
+        self._indexes_lock = threading.Lock()  # index_for runs on the loop and the indexing thread
+        # Bumped by drop(); jobs queued before it carry the old value and are skipped
+        self._generations: Dict[str, int] = {}
+        self._write_lock = threading.Lock()  # a generation check and its append, or a drop
+        self._backfilled: set = set()
+        self._batch: Optional[asyncio.Future] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def index_for(self, user_id: str) -> TurnIndex:
+        with self._indexes_lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                key = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+                index = self._indexes[user_id] = TurnIndex(self.directory, key, self.dim)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_open:
+                # Closed before the user can be looked up again, so it is not still in use when
+                # a new TurnIndex opens the same files
+                self._indexes.popitem(last=False)[1].close()
+        return index
+
+    def _put(self, job) -> bool:
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Retrieval index queue full; turn will be picked up by the next backfill")
+            return False
+
+    def enqueue(self, user_id: str, turn_id: int, text: str) -> bool:
+        """Queue one new turn for indexing; never blocks the caller."""
+        return self._put((user_id, [(turn_id, text)], None, self._generations.get(user_id, 0)))
+
+    def ensure_backfill(self, user_id: str, loader: Callable[[str, int], List[Tuple[int, str]]]) -> None:
+        """Once per process per user, queue a catch-up of turns newer than the last indexed id.
+
+        loader(user_id, after_id) runs on a worker thread and returns (turn_id, text) pairs.
+        """
+        if user_id in self._backfilled:
+            return
+        if self._put((user_id, None, loader, self._generations.get(user_id, 0))):
+            self._backfilled.add(user_id)
+
+    def search(self, user_id: str, text: str, k: int, exclude_ids: Iterable[int] = ()) -> List[int]:
+        """Return ids of the k indexed turns most similar to text, best first; blocking."""
+        index = self.index_for(user_id)
+        return [turn_id for turn_id, _ in index.search(embed_text(text, self.dim), k, exclude_ids)]
+
+    def drop(self, user_id: str) -> None:
+        """Delete the user's vectors; turns queued for them before now are never written."""
+        with self._write_lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self.index_for(user_id).delete()
+        self._backfilled.discard(user_id)
+
+    def index_batch(self, jobs) -> int:
+        """Embed and append a batch of queued jobs; returns the number of turns indexed."""
+        indexed = 0
+        for user_id, turns, loader, generation in jobs:
+            if self._generations.get(user_id, 0) != generation:
+                continue
+            index = self.index_for(user_id)
+            last_id = index.last_id
+            if loader is not None:
+                turns = loader(user_id, last_id)
+            turns = [(turn_id, text) for turn_id, text in turns if turn_id > last_id]
+            if not turns:
+                continue
+            vectors = np.stack([embed_text(text, self.dim) for _, text in turns])
+            with self._write_lock:
+                if self._generations.get(user_id, 0) != generation:
+                    continue  # dropped while this batch was embedding
+                index.append([turn_id for turn_id, _ in turns], vectors)
+            indexed += len(turns)
+        return indexed
+
+    async def run(self, max_batch: int = 256):
+        """Background loop draining the queue in batches on a worker thread."""
+        while True:
+            jobs = [await self.queue.get()]
+            while len(jobs) < max_batch and not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+            # Shielded so cancelling the loop leaves the batch to finish; flush() waits for it
+            self._batch = asyncio.ensure_future(asyncio.to_thread(self.index_batch, jobs))
+            try:
+                await asyncio.shield(self._batch)
+            except Exception as e:
+                logger.exception(f"Error indexing turns: {e}")
+
+    async def flush(self) -> int:
+        """Index everything still queued, after any batch in progress; for shutdown once run() is cancelled."""
+        if self._batch is not None:
+            await asyncio.gather(self._batch, return_exceptions=True)
+        jobs = []
+        while not self.queue.empty():
+            jobs.append(self.queue.get_nowait())
+        return await asyncio.to_thread(self.index_batch, jobs) if jobs else 0
+
+
+def select_context_turns(recent: Sequence, related: Sequence, budget_chars: int, keep_recent: int = 2) -> List:
+    """Pick the turns to put in the prompt without exceeding budget_chars.
+
+    recent is newest first and related is best match first; both hold rows with id,
+    message and response. The newest keep_recent turns go in first, then related turns,
+    then the rest of recent. The result is in chronological order.
+    """
+    chosen = {}
+    used = 0
+    for turn in list(recent[:keep_recent]) + list(related) + list(recent[keep_recent:]):
+        if turn.id in chosen:
+            continue
+        cost = len(turn.message or "") + len(turn.response or "") + 16  # role labels and newlines
+        if used + cost > budget_chars:
+            continue
+        chosen[turn.id] = turn
+        used += cost
+    return [chosen[turn_id] for turn_id in sorted(chosen)]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Production entry point: uvicorn with graceful draining on SIGTERM.
+
+On SIGTERM, plain uvicorn stops listening and closes WebSockets straight away, and only
+then runs the app's shutdown handlers. DrainingServer instead runs main.drain() first
+(see drain.py): readiness turns 503, WebSocket clients get a jittered reconnect hint,
+and in-flight requests get up to VIRGIL_DRAIN_TIMEOUT_SECONDS. After that uvicorn's normal
+shutdown runs. A second signal skips the wait.
+
+With --workers N (or VIRGIL_WORKERS) it instead starts N such servers on private Unix
+sockets behind a router that keeps each user on one worker; see cluster.py.
+
+Usage:
+    python serve.py --host 0.0.0.0 --port 8000
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import shutil
+import signal
+import sys
+import tempfile
+
+import uvicorn
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server that awaits the app's drain coroutine before shutting down."""
+
+    def __init__(self, config: uvicorn.Config, drain_target="main:drain"):
+        """drain_target is a coroutine function, or "module:name" of one imported when needed."""
+        super().__init__(config)
+        self.drain_target = drain_target
+        self._drain_task = None
+
+    def handle_exit(self, sig, frame) -> None:
+        if self._drain_task is not None or self.should_exit or sig not in (signal.SIGTERM, signal.SIGINT):
+            return super().handle_exit(sig, frame)
+        self._drain_task = asyncio.get_event_loop().create_task(self._drain_then_exit(sig, frame))
+
+    async def _drain_then_exit(self, sig, frame) -> None:
+        drain = self.drain_target
+        if isinstance(drain, str):
+            module, name = drain.split(":")
+            drain = getattr(importlib.import_module(module), name)
+        try:
+            await drain()
+        finally:
+            super().handle_exit(sig, frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("VIRGIL_WORKERS", "1")))
+    # Used by the router to start each worker on its own socket
+    parser.add_argument("--uds", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    drain_timeout = float(os.getenv("VIRGIL_DRAIN_TIMEOUT_SECONDS", "20"))
+    if args.workers > 1 and not args.uds:
+        return run_cluster(args, drain_timeout)
+    if args.uds:
+        # Only the router can reach the socket, so trust the client address it forwards
+        config = uvicorn.Config("main:app", uds=args.uds, log_level=args.log_level, access_log=args.access_log,
+                                proxy_headers=True, forwarded_allow_ips="*", timeout_graceful_shutdown=drain_timeout)
+    else:
+        config = uvicorn.Config("main:app", host=args.host, port=args.port, log_level=args.log_level,
+                                access_log=args.access_log, proxy_headers=True,
+                                timeout_graceful_shutdown=drain_timeout)
+    DrainingServer(config).run()
+
+
+def run_cluster(args, drain_timeout: float) -> None:
+    """Router on host:port in this process, args.workers app processes behind it."""
+    from cluster import Backend, Router, WorkerPool
+
+    socket_dir = tempfile.mkdtemp(prefix="virgil-workers-")  # mode 0700
+    socket_paths = [os.path.join(socket_dir, f"worker-{i}.sock") for i in range(args.workers)]
+    # Host-wide state has to be shared between the workers rather than kept in each
+    env = dict(os.environ)
+    env.setdefault("VIRGIL_RATE_LIMIT_BACKEND", "sqlite")
+    env.setdefault("VIRGIL_LOCAL_STORE", "sqlite")
+    command = [sys.executable, os.path.abspath(__file__), "--log-level", args.log_level]
+    if not args.access_log:
+        command.append("--no-access-log")
+    pool = WorkerPool(command, socket_paths, env)
+    router = Router([Backend(i, path) for i, path in enumerate(socket_paths)], pool, drain_timeout)
+    config = uvicorn.Config(router, host=args.host, port=args.port, log_level=args.log_level,
+                            access_log=False, proxy_headers=True, timeout_graceful_shutdown=drain_timeout)
+    try:
+        DrainingServer(config, drain_target=router.drain).run()
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
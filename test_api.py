@@ -5,12 +5,15 @@ Tests authentication, authorization, conversation management, and real-time feat
 
 import pytest
 import json
+import math
+import time
 from fastapi.testclient import TestClient
 from datetime import datetime, timedelta
 from jose import jwt
 
 # Import the FastAPI app from main
 from main import app, SECRET_KEY, ALGORITHM, get_db, engine, Base, Conversation, PersistentReminder
+from main import create_db_engine, sqlite_pragmas
 
 # Create test database
 DATABASE_URL = "sqlite:///./test.db"
@@ -123,6 +126,123 @@ class TestHistoryEndpoint:
         response = client.get("/history")
         assert response.status_code == 401
 
+    def test_history_reads_archived_turns(self, client, tmp_path, monkeypatch):
+        """Test that /history returns archived turns before hot ones."""
+        import main
+        from archive import ConversationArchive
+        archive = ConversationArchive(str(tmp_path))
+        monkeypatch.setattr(main, "conversation_archive", archive)
+        db = next(get_db())
+        db.add(Conversation(user_id="archived-user", message="old turn", response="old reply",
+                            timestamp=datetime.utcnow() - timedelta(days=400)))
+        db.add(Conversation(user_id="archived-user", message="new turn", response="new reply"))
+        db.commit()
+        assert archive.archive_before(engine, datetime.utcnow() - timedelta(days=90)) == 1
+        response = client.get("/history", headers={"X-User-Id": "archived-user"})
+        assert [h["message"] for h in response.json()["history"]] == ["old turn", "new turn"]
+
+    def test_large_history_is_compressed(self, client):
+        """Test that a large /history body is gzip-encoded with ISO timestamps."""
+        db = next(get_db())
+        db.add_all(Conversation(user_id="long-history", message=f"question {i}", response="answer " * 20)
+                   for i in range(50))
+        db.commit()
+        response = client.get("/history", headers={"X-User-Id": "long-history", "Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        history = response.json()["history"]
+        assert len(history) == 50
+        datetime.fromisoformat(history[0]["timestamp"])
+
+    def test_history_etag_until_a_new_turn(self, client, monkeypatch):
+        """Test If-None-Match on /history gets 304 until the user adds a turn."""
+        import main
+
+        async def fake_complete(prompt, message, prefix_hash=None):
+            return "reply"
+
+        monkeypatch.setattr(main, "_complete", fake_complete)
+        headers = {"X-User-Id": "etag-user"}
+        first = client.get("/history", headers=headers)
+        etag = first.headers["etag"]
+        assert client.get("/history", headers={**headers, "If-None-Match": etag}).status_code == 304
+        client.post("/guide", json={"message": "hi", "session_id": "etag-user"})
+        second = client.get("/history", headers={**headers, "If-None-Match": etag})
+        assert second.status_code == 200
+        assert second.headers["etag"] != etag
+        assert len(second.json()["history"]) == 1
+
+# ==================== History Search Tests ====================
+
+class TestHistorySearch:
+    """Test full-text search over conversation history."""
+
+    def _add_turn(self, user_id, message, response):
+        db = next(get_db())
+        db.add(Conversation(user_id=user_id, message=message, response=response))
+        db.commit()
+
+    def test_search_ranks_and_highlights(self, client):
+        """Test that matching turns come back ranked with highlighted snippets."""
+        self._add_turn("searcher", "How do I bake sourdough bread?", "Start with an active starter.")
+        self._add_turn("searcher", "What about rye?", "Rye bread needs more water than sourdough bread.")
+        self._add_turn("someone-else", "sourdough tips", "Keep it warm.")
+        response = client.get("/history/search", params={"q": "sourdough"}, headers={"X-User-Id": "searcher"})
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["results"]) == 2
+        assert all("<mark>" in (r["message_snippet"] + r["response_snippet"]) for r in data["results"])
+
+    def test_search_pagination(self, client):
+        """Test limit/offset paging and the has_more flag."""
+        for i in range(5):
+            self._add_turn("pager", f"kettlebell workout {i}", "Sounds good.")
+        first = client.get("/history/search", params={"q": "kettlebell", "limit": 3},
+                           headers={"X-User-Id": "pager"}).json()
+        second = client.get("/history/search", params={"q": "kettlebell", "limit": 3, "offset": 3},
+                            headers={"X-User-Id": "pager"}).json()
+        assert first["has_more"] is True and len(first["results"]) == 3
+        assert second["has_more"] is False and len(second["results"]) == 2
+
+    def test_search_continues_into_archived_turns(self, client, tmp_path, monkeypatch):
+        """Test that archived turns are found after the ranked hot results."""
+        import main
+        from archive import ConversationArchive
+        archive = ConversationArchive(str(tmp_path))
+        monkeypatch.setattr(main, "conversation_archive", archive)
+        db = next(get_db())
+        for days in (400, 300):
+            db.add(Conversation(user_id="archive-searcher", message=f"Paella recipe from {days} days ago",
+                                response="Saffron first.", timestamp=datetime.utcnow() - timedelta(days=days)))
+        db.add(Conversation(user_id="archive-searcher", message="paella again", response="Sure."))
+        db.commit()
+        assert archive.archive_before(engine, datetime.utcnow() - timedelta(days=90)) == 2
+        headers = {"X-User-Id": "archive-searcher"}
+        first = client.get("/history/search", params={"q": "paella", "limit": 2}, headers=headers).json()
+        assert [r["message"] for r in first["results"]] == ["paella again", "Paella recipe from 300 days ago"]
+        assert first["results"][1]["rank"] is None and "<mark>Paella</mark>" in first["results"][1]["message_snippet"]
+        assert first["has_more"] is True
+        second = client.get("/history/search", params={"q": "paella", "limit": 2, "offset": 2}, headers=headers).json()
+        assert [r["message"] for r in second["results"]] == ["Paella recipe from 400 days ago"]
+        assert second["has_more"] is False
+
+    def test_search_index_follows_user_data_delete(self, client, auth_token):
+        """Test that deleted turns drop out of the index."""
+        self._add_turn("testuser", "my secret zanzibar plan", "Noted.")
+        client.delete("/user-data", headers={"Authorization": f"Bearer {auth_token}", "X-Confirm-Delete": "true"})
+        response = client.get("/history/search", params={"q": "zanzibar"}, headers={"X-User-Id": "testuser"})
+        assert response.json()["results"] == []
+
+    def test_search_query_syntax_is_escaped(self, client):
+        """Test that FTS operators in user input do not cause errors."""
+        response = client.get("/history/search", params={"q": 'NEAR( "unbalanced'}, headers={"X-User-Id": "searcher"})
+        assert response.status_code == 200
+
+    def test_search_missing_query(self, client):
+        """Test that an empty query is rejected."""
+        response = client.get("/history/search", headers={"X-User-Id": "searcher"})
+        assert response.status_code == 400
+
 # ==================== User Data Endpoint Tests ====================
 
 class TestUserDataEndpoint:
@@ -137,9 +257,10 @@ class TestUserDataEndpoint:
                 "X-Confirm-Delete": "true"
             }
         )
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert "message" in data or "status" in data
+        assert "job_id" in data
 
     def test_delete_user_data_without_auth(self, client):
         """Test DELETE /user-data without authentication."""
@@ -170,6 +291,32 @@ class TestUserDataEndpoint:
         # Should fail with invalid confirmation
         assert response.status_code in [400, 403]
 
+    def test_delete_job_progress(self, client, auth_token, monkeypatch):
+        """Test that deletion runs in chunks and reports progress on the job endpoint."""
+        import main
+        monkeypatch.setattr(main, "DELETE_CHUNK_ROWS", 2)
+        db = next(get_db())
+        for i in range(5):
+            db.add(Conversation(user_id="testuser", message=f"turn {i}", response="ok"))
+        db.add(PersistentReminder(user_id="testuser", message="soon", remind_at=datetime.utcnow(), delivered=False))
+        db.commit()
+        main.CONVERSATION_HISTORY["testuser"] = [{"user": "hi", "assistant": "hello"}]
+        headers = {"Authorization": f"Bearer {auth_token}"}
+
+        response = client.delete("/user-data", headers={**headers, "X-Confirm-Delete": "true"})
+        assert "testuser" not in main.CONVERSATION_HISTORY
+        job = client.get(response.json()["status_url"], headers=headers).json()
+        assert job["status"] == "completed"
+        assert job["conversations_deleted"] >= 5 and job["reminders_deleted"] >= 1
+        assert db.query(Conversation).filter_by(user_id="testuser").count() == 0
+
+    def test_delete_job_hidden_from_other_users(self, client, auth_token):
+        """Test that a job's status is only visible to its owner."""
+        response = client.delete("/user-data", headers={"Authorization": f"Bearer {auth_token}", "X-Confirm-Delete": "true"})
+        other = jwt.encode({"sub": "someone-else", "exp": datetime.utcnow() + timedelta(hours=1)}, SECRET_KEY, algorithm=ALGORITHM)
+        status = client.get(response.json()["status_url"], headers={"Authorization": f"Bearer {other}"})
+        assert status.status_code == 404
+
 # ==================== Reminders Endpoint Tests ====================
 
 class TestRemindersEndpoint:
@@ -200,6 +347,97 @@ class TestRemindersEndpoint:
         # Should accept reminder
         assert response.status_code in [200, 201]
 
+    def test_empty_reminders_are_revalidated(self, client):
+        """Test that an empty /reminders answer gets 304 until a reminder falls due."""
+        headers = {"X-User-Id": "etag-reminders"}
+        etag = client.get("/reminders", headers=headers).headers["etag"]
+        assert client.get("/reminders", headers={**headers, "If-None-Match": etag}).status_code == 304
+        client.post("/reminder", json={"message": "stretch", "remind_at": datetime.utcnow().isoformat()},
+                    headers=headers)
+        response = client.get("/reminders", headers={**headers, "If-None-Match": etag})
+        assert [r["message"] for r in response.json()["reminders"]] == ["stretch"]
+        assert "etag" not in response.headers
+
+    def test_bulk_schedule_is_all_or_nothing(self, client):
+        """Test POST /reminders stores every reminder in one go, or none if one is invalid."""
+        headers = {"X-User-Id": "bulk-reminders"}
+        later = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+        response = client.post("/reminders", headers=headers, json={"reminders": [
+            {"message": "stretch", "remind_at": later},
+            {"message": "stand up", "remind_at": later, "recurrence": "every 1h"},
+        ]})
+        assert response.status_code == 200
+        scheduled = response.json()["reminders"]
+        assert [r["recurrence"] for r in scheduled] == [None, "every 1h"]
+        assert len({r["id"] for r in scheduled}) == 2
+        response = client.post("/reminders", headers=headers, json={"reminders": [
+            {"message": "fine", "remind_at": later},
+            {"message": "broken", "remind_at": later, "recurrence": "fortnightly"},
+        ]})
+        assert response.status_code == 400
+        assert "reminders[1]" in response.json()["detail"]
+        db = next(get_db())
+        assert db.query(PersistentReminder).filter_by(user_id="bulk-reminders").count() == 2
+
+    def test_recurring_reminder_moves_to_next_occurrence(self, client):
+        """Test that delivering a recurring reminder reschedules the same row."""
+        headers = {"X-User-Id": "recurring-reminder"}
+        first = datetime.utcnow() - timedelta(minutes=1)
+        client.post("/reminder", headers=headers, json={
+            "message": "drink water", "remind_at": first.isoformat(), "recurrence": "daily"})
+        delivered = client.get("/reminders", headers=headers).json()["reminders"]
+        assert [r["message"] for r in delivered] == ["drink water"]
+        assert client.get("/reminders", headers=headers).json()["reminders"] == []
+        db = next(get_db())
+        row = db.query(PersistentReminder).filter_by(user_id="recurring-reminder").one()
+        assert not row.delivered
+        assert row.remind_at == first + timedelta(days=1)
+
+    def test_recurrence_ends_at_until(self, client):
+        """Test that a recurring reminder past its until date is delivered for the last time."""
+        headers = {"X-User-Id": "recurring-until"}
+        first = datetime.utcnow() - timedelta(minutes=1)
+        client.post("/reminder", headers=headers, json={
+            "message": "last one", "remind_at": first.isoformat(), "recurrence": "daily",
+            "until": (first + timedelta(hours=1)).isoformat()})
+        assert len(client.get("/reminders", headers=headers).json()["reminders"]) == 1
+        db = next(get_db())
+        assert db.query(PersistentReminder).filter_by(user_id="recurring-until").count() == 0
+
+    def test_until_before_remind_at_is_rejected(self, client):
+        """Test that a recurrence ending before its first occurrence is a 400."""
+        later = datetime.utcnow() + timedelta(days=1)
+        response = client.post("/reminder", headers={"X-User-Id": "recurring-backwards"}, json={
+            "message": "never", "remind_at": later.isoformat(), "recurrence": "daily",
+            "until": (later - timedelta(hours=1)).isoformat()})
+        assert response.status_code == 400
+        assert "until" in response.json()["detail"]
+
+    def test_long_poll_returns_when_a_reminder_falls_due(self, client):
+        """Test that GET /reminders?wait= holds an empty answer until a reminder is due."""
+        headers = {"X-User-Id": "long-poll"}
+        remind_at = (datetime.utcnow() + timedelta(seconds=0.5)).isoformat()
+        client.post("/reminder", json={"message": "drink water", "remind_at": remind_at}, headers=headers)
+        started = time.monotonic()
+        response = client.get("/reminders?wait=5", headers=headers)
+        assert [r["message"] for r in response.json()["reminders"]] == ["drink water"]
+        assert time.monotonic() - started < 3
+
+    def test_long_poll_times_out_with_not_modified(self, client):
+        """Test that a long poll with a current ETag answers 304 once the wait runs out."""
+        headers = {"X-User-Id": "long-poll-idle"}
+        etag = client.get("/reminders", headers=headers).headers["etag"]
+        started = time.monotonic()
+        response = client.get("/reminders?wait=0.3", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert time.monotonic() - started >= 0.3
+
+    @pytest.mark.parametrize("wait", ["nan", "-1"])
+    def test_long_poll_rejects_bad_wait(self, client, wait):
+        """Test that a negative or NaN wait is a 422 rather than an endless poll (inf is capped)."""
+        response = client.get(f"/reminders?wait={wait}", headers={"X-User-Id": "long-poll-bad"})
+        assert response.status_code == 422
+
 # ==================== Tools Endpoint Tests ====================
 
 class TestToolsEndpoints:
@@ -216,6 +454,23 @@ class TestToolsEndpoints:
         assert "result" in data
         assert data["result"] == 4
 
+    def test_calculate_big_integer(self, client):
+        """Integers wider than 64 bits are returned exactly."""
+        response = client.post("/calculate", json={"expression": "2**70"})
+        assert response.status_code == 200
+        assert response.content == b'{"result":1180591620717411303424}'
+        assert client.post("/calculate", json={"expression": "factorial(25)"}).json()["result"] == math.factorial(25)
+
+    @pytest.mark.parametrize("with_orjson", [True, False])
+    def test_calculate_overflow_is_null(self, client, monkeypatch, with_orjson):
+        """An infinite result is null whichever JSON encoder is installed."""
+        import fastjson
+        if not with_orjson:
+            monkeypatch.setattr(fastjson, "orjson", None)
+        response = client.post("/calculate", json={"expression": "1e308*10"})
+        assert response.status_code == 200
+        assert response.json() == {"result": None}
+
     def test_calculate_invalid_expression(self, client):
         """Test POST /calculate with invalid expression."""
         response = client.post(
@@ -265,6 +520,23 @@ class TestConversationEndpoints:
         data = response.json()
         assert "response" in data or "message" in data
 
+    def test_guide_prompts_share_a_cached_prefix(self, client, monkeypatch):
+        """Test that each /guide turn extends the previous prompt and sends its prefix hash."""
+        import main
+        sent = []
+
+        async def fake_complete(formatted_prompt, message, prefix_hash=None):
+            sent.append((formatted_prompt, prefix_hash))
+            return f"reply to {message}"
+
+        monkeypatch.setattr(main, "_complete", fake_complete)
+        for message in ("first question", "second question", "third question"):
+            client.post("/guide", json={"message": message, "session_id": "prefix-session"})
+        (first, _), (second, second_hash), (third, third_hash) = sent
+        assert third.startswith(second[:-len("second question [/INST]")])
+        assert "second question [/INST] reply to second question" in third
+        assert second_hash and third_hash and second_hash != third_hash
+
 # ==================== Metadata Endpoint Tests ====================
 
 class TestMetadataEndpoints:
@@ -279,6 +551,228 @@ class TestMetadataEndpoints:
         assert isinstance(data["tones"], list)
         assert "default" in data["tones"]
 
+    def test_get_tones_includes_custom_tones(self, client, monkeypatch, tmp_path):
+        """Test that tones from VIRGIL_TONES_FILE are listed with descriptions."""
+        import main
+        from prompts import PromptTemplates
+        path = tmp_path / "tones.yaml"
+        path.write_text("tones:\n  socratic:\n    description: Asks questions\n    instruction: Ask.\n")
+        monkeypatch.setattr(main, "PROMPTS", PromptTemplates.load(str(path)))
+        data = client.get("/tones").json()
+        assert "socratic" in data["tones"]
+        assert data["descriptions"]["socratic"] == "Asks questions"
+
+    def test_static_responses_are_cacheable(self, client):
+        """Test ETag and Cache-Control on /tones and /."""
+        for path in ("/tones", "/"):
+            response = client.get(path)
+            assert "max-age" in response.headers["cache-control"]
+            cached = client.get(path, headers={"If-None-Match": response.headers["etag"]})
+            assert cached.status_code == 304
+            assert cached.content == b""
+
+# ==================== Health Tests ====================
+
+class TestHealthEndpoints:
+    """Test liveness and readiness served from cached probe results."""
+
+    def test_ready_reports_probes_and_connections(self, client, monkeypatch):
+        """Test that readiness reflects the last probe run without probing on request."""
+        import asyncio
+        import time
+        import main
+        monkeypatch.setattr(main.health_monitor, "probes", [p for p in main.health_monitor.probes if p.critical])
+        monkeypatch.setattr(main, "_reminder_pusher_beat", time.time())
+        asyncio.run(main.health_monitor.check_all())
+        for path in ("/health/ready", "/health"):
+            response = client.get(path)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "ok"
+            assert data["checks"]["database"]["status"] == "ok"
+            assert data["connections"] == {"notifications": 0, "voice": 0}
+            assert response.headers["cache-control"] == "no-store"
+
+    def test_stalled_scheduler_is_not_ready(self, client, monkeypatch):
+        """Test that a critical probe failure answers 503."""
+        import asyncio
+        import main
+        monkeypatch.setattr(main.health_monitor, "probes", [p for p in main.health_monitor.probes if p.critical])
+        monkeypatch.setattr(main, "_reminder_pusher_beat", 0.0)
+        asyncio.run(main.health_monitor.check_all())
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["checks"]["scheduler"]["status"] == "fail"
+
+    def test_live(self, client):
+        """Test that liveness only needs a responsive process."""
+        response = client.get("/health/live")
+        assert response.status_code == 200
+        assert "event_loop_lag" in response.json()
+
+# ==================== Draining Tests ====================
+
+class TestDraining:
+    """Test taking a worker out of rotation before a restart."""
+
+    def test_drain_requires_admin(self, client, auth_token):
+        """Test that non-admin users cannot drain the worker."""
+        response = client.post("/admin/drain", headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 403
+
+    def test_drain_hints_clients_and_refuses_new_sockets(self, client, auth_token, monkeypatch):
+        """Test the reconnect hint, the 1012 close, readiness and refused WebSockets."""
+        import main
+        from starlette.websockets import WebSocketDisconnect
+        monkeypatch.setattr(main, "ADMIN_USERS", {"testuser"})
+        monkeypatch.setattr(main.drainer, "draining", False)
+        monkeypatch.setattr(main.health_monitor, "draining", False)
+        monkeypatch.setattr(main.reminder_waiters, "closed", False)
+        with client.websocket_connect("/ws/notify/guest") as ws:
+            response = client.post("/admin/drain", headers={"Authorization": f"Bearer {auth_token}"})
+            assert response.json()["draining"] is True
+            hint = json.loads(ws.receive_text())
+            assert hint["type"] == "reconnect"
+            assert 0 <= hint["retry_after_ms"] <= main.RECONNECT_JITTER_SECONDS * 1000
+            with pytest.raises(WebSocketDisconnect) as closed:
+                ws.receive_text()
+            assert closed.value.code == 1012
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "draining"
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/ws/notify/guest"):
+                pass
+
+# ==================== Metrics Tests ====================
+
+class TestMetricsEndpoint:
+    """Test the Prometheus scrape endpoint."""
+
+    def test_metrics_report_route_templates(self, client):
+        """Test that requests are labelled by route template and DB timings are recorded."""
+        client.get("/tones")
+        client.get("/history", headers={"X-User-Id": "metrics-user"})
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'virgil_http_requests_total{route="/tones",method="GET",status="200"}' in body
+        assert 'virgil_db_query_duration_seconds_count{operation="SELECT"}' in body
+        assert "virgil_websocket_connections " in body
+
+# ==================== Admin Tracing Tests ====================
+
+class TestAdminTraces:
+    """Test the slow-trace admin endpoint."""
+
+    def test_traces_require_admin(self, client, auth_token):
+        """Test that non-admin users are refused."""
+        response = client.get("/admin/traces", headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 403
+
+    def test_guide_trace_is_recorded(self, client, auth_token, monkeypatch):
+        """Test that a /guide call shows up with its stage spans."""
+        import main
+        monkeypatch.setattr(main, "ADMIN_USERS", {"testuser"})
+        monkeypatch.setattr(main.tracer, "slow_threshold_ms", 0)
+        client.post("/guide", json={"message": "trace me", "session_id": "trace-session"})
+        response = client.get("/admin/traces", headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 200
+        trace = next(t for t in response.json()["traces"] if t["name"] == "POST /guide")
+        names = [s["name"] for s in trace["spans"]]
+        for stage in ("db.history_query", "prompt.build", "inference.http", "db.commit"):
+            assert stage in names
+
+# ==================== Admin Profiling Tests ====================
+
+class TestAdminProfile:
+    """Test the sampling profiler admin endpoint."""
+
+    def test_profile_requires_admin(self, client, auth_token):
+        """Test that non-admin users are refused."""
+        response = client.get("/admin/profile", headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 403
+
+    def test_profile_disabled_by_default(self, client, auth_token, monkeypatch):
+        """Test that the profiler is opt-in."""
+        import main
+        monkeypatch.setattr(main, "ADMIN_USERS", {"testuser"})
+        response = client.get("/admin/profile", headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 404
+
+    def test_profile_returns_collapsed_stacks(self, client, auth_token, monkeypatch):
+        """Test that an enabled profile returns flame graph input."""
+        import main
+        monkeypatch.setattr(main, "ADMIN_USERS", {"testuser"})
+        monkeypatch.setattr(main, "PROFILING_ENABLED", True)
+        response = client.get("/admin/profile?seconds=0.2&threads=loop",
+                              headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        stack, count = response.text.splitlines()[0].rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+
+# ==================== Rate Limiting Tests ====================
+
+class TestRateLimiting:
+    """Test per-route and per-user token buckets."""
+
+    def test_limited_route_returns_429_with_retry_after(self, client, auth_token, monkeypatch):
+        """Test that a caller over its bucket gets 429 while others are unaffected."""
+        import main
+        from ratelimit import Limit, MemoryBucketStore
+        monkeypatch.setattr(main.rate_limiter, "store", MemoryBucketStore())
+        monkeypatch.setattr(main.rate_limiter, "route_limits", {"/calculate": Limit(2, 60)})
+        for _ in range(2):
+            assert client.post("/calculate", json={"expression": "1 + 1"}).status_code == 200
+        response = client.post("/calculate", json={"expression": "1 + 1"})
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        # A signed-in user has their own bucket
+        response = client.post("/calculate", json={"expression": "1 + 1"},
+                               headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 200
+
+    def test_user_quota_spans_routes(self, client, monkeypatch):
+        """Test that the per-user quota is shared by all limited routes."""
+        import main
+        from ratelimit import Limit, MemoryBucketStore
+        monkeypatch.setattr(main.rate_limiter, "store", MemoryBucketStore())
+        monkeypatch.setattr(main.rate_limiter, "user_limit", Limit(1, 60))
+        assert client.post("/calculate", json={"expression": "2"}).status_code == 200
+        assert client.post("/quick-guide", json={"message": "hi"}).status_code == 429
+
+# ==================== Database Profile Tests ====================
+
+class TestSQLiteProfile:
+    """Test the SQLite pragmas applied on connect."""
+
+    def test_wal_profile_applied_on_connect(self, tmp_path):
+        """Test that the wal profile switches the journal mode for new connections."""
+        wal_engine = create_db_engine(f"sqlite:///{tmp_path}/wal.db", profile="wal")
+        with wal_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        wal_engine.dispose()
+
+    def test_default_profile_leaves_settings(self, tmp_path):
+        """Test that the default profile does not change the journal mode."""
+        plain_engine = create_db_engine(f"sqlite:///{tmp_path}/plain.db", profile="default")
+        with plain_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() == "delete"
+        plain_engine.dispose()
+
+    def test_env_override(self, monkeypatch):
+        """Test that a single pragma can be overridden from the environment."""
+        monkeypatch.setenv("VIRGIL_SQLITE_SYNCHRONOUS", "FULL")
+        assert sqlite_pragmas("wal")["synchronous"] == "FULL"
+
+    def test_unknown_profile(self):
+        """Test that an unknown profile name is rejected."""
+        with pytest.raises(ValueError):
+            sqlite_pragmas("turbo")
+
 # ==================== WebSocket Tests ====================
 
 class TestWebSocket:
@@ -320,6 +814,58 @@ class TestWebSocket:
             # Guest should be allowed
             assert data is not None
 
+    def test_websocket_replays_missed_notifications(self, client):
+        """Test that reconnecting with since= replays the notifications after it."""
+        import main
+        log = main.manager.log
+        seqs = []
+        for n in range(3):
+            seq, message = log.next_message({"type": "reminder", "id": n, "message": f"r{n}"})
+            log.record("guest", seq, message)
+            seqs.append(seq)
+        with client.websocket_connect(f"/ws/notify/guest?since={seqs[0]}&epoch={log.epoch}") as websocket:
+            header = json.loads(websocket.receive_text())
+            assert header["type"] == "replay"
+            assert header["count"] == 2 and header["complete"] is True
+            assert header["seq"] == seqs[-1]
+            replayed = [json.loads(websocket.receive_text()) for _ in range(2)]
+            assert [m["seq"] for m in replayed] == seqs[1:]
+            assert replayed[0]["message"] == "r1"
+
+    def test_live_notifications_wait_for_replay_without_the_lock(self):
+        """Test that the replay is sent unlocked and a live notification follows it."""
+        import asyncio
+        from main import ConnectionManager
+        from notifications import NotificationLog
+
+        class SlowSocket:
+            def __init__(self):
+                self.sent = []
+                self.release = asyncio.Event()
+
+            async def accept(self):
+                pass
+
+            async def send_text(self, message):
+                if json.loads(message).get("message") == "missed":
+                    await self.release.wait()
+                self.sent.append(json.loads(message))
+
+        async def scenario():
+            manager = ConnectionManager(NotificationLog())
+            seq, message = manager.log.next_message({"message": "missed"})
+            manager.log.record("u", seq, message)
+            ws = SlowSocket()
+            connecting = asyncio.create_task(manager.connect("u", ws, since=0, epoch=manager.log.epoch))
+            await asyncio.sleep(0)
+            assert await manager.notify("u", {"message": "live"}) is True
+            ws.release.set()
+            await connecting
+            return ws.sent
+
+        sent = asyncio.run(scenario())
+        assert [m.get("type") or m["message"] for m in sent] == ["replay", "missed", "live"]
+
 # ==================== CORS Tests ====================
 
 class TestCORS:
@@ -414,7 +960,7 @@ class TestIntegrationFlows:
                 "X-Confirm-Delete": "true"
             }
         )
-        assert delete_response.status_code == 200
+        assert delete_response.status_code == 202
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,75 @@
+"""
+Tests for archival of old conversation turns and incremental compaction.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from archive import ConversationArchive, compact_database
+from main import Base, Conversation, create_db_engine
+
+
+def _engine_with_turns(tmp_path, turns):
+    engine = create_db_engine(f"sqlite:///{tmp_path}/hot.db", profile="default")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    for user_id, message, timestamp in turns:
+        db.add(Conversation(user_id=user_id, message=message, response=f"re: {message}", timestamp=timestamp))
+    db.commit()
+    db.close()
+    return engine
+
+
+class TestConversationArchive:
+    """Test moving turns to monthly archives and reading them back."""
+
+    def test_archive_moves_old_turns_by_month(self, tmp_path):
+        now = datetime(2026, 6, 15)
+        engine = _engine_with_turns(tmp_path, [
+            ("alice", "january", datetime(2026, 1, 10)),
+            ("alice", "february", datetime(2026, 2, 3)),
+            ("bob", "february too", datetime(2026, 2, 20)),
+            ("alice", "recent", now - timedelta(days=1)),
+        ])
+        archive = ConversationArchive(str(tmp_path / "archive"))
+
+        assert archive.archive_before(engine, now - timedelta(days=90), batch_size=2) == 3
+        assert [p.rsplit("_", 2)[-2:] for p in archive.month_paths()] == [["2026", "01.db"], ["2026", "02.db"]]
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT message FROM conversations")).scalars().all() == ["recent"]
+
+        history = archive.read_user("alice")
+        assert [h["message"] for h in history] == ["january", "february"]
+        assert history[0]["response"] == "re: january"
+        assert archive.archive_before(engine, now - timedelta(days=90)) == 0
+
+    def test_delete_user_purges_archives(self, tmp_path):
+        engine = _engine_with_turns(tmp_path, [("alice", "old", datetime(2025, 3, 1)),
+                                               ("bob", "old", datetime(2025, 3, 2))])
+        archive = ConversationArchive(str(tmp_path / "archive"))
+        archive.archive_before(engine, datetime(2026, 1, 1))
+        assert archive.delete_user("alice") == 1
+        assert archive.read_user("alice") == []
+        assert len(archive.read_user("bob")) == 1
+
+    def test_read_user_opens_archives_read_only(self, tmp_path, monkeypatch):
+        engine = _engine_with_turns(tmp_path, [("alice", "old", datetime(2025, 3, 1))])
+        archive = ConversationArchive(str(tmp_path / "archive #1 ?"))
+        archive.archive_before(engine, datetime(2026, 1, 1))
+        monkeypatch.setattr(archive, "_connect", None)  # the read path must not open for writing
+        assert [h["message"] for h in archive.read_user("alice")] == ["old"]
+
+
+class TestCompaction:
+    """Test the incremental VACUUM/ANALYZE pass."""
+
+    def test_compaction_enables_incremental_vacuum(self, tmp_path):
+        engine = _engine_with_turns(tmp_path, [("alice", "x" * 5000, datetime(2025, 1, 1))] * 50)
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM conversations"))
+        compact_database(engine, max_pages=10)
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+            assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
@@ -0,0 +1,50 @@
+"""
+Tests for the binary audio frame format.
+"""
+
+import json
+
+import pytest
+
+from audioframes import CODEC_WAV, FLAG_END, HEADER, FrameError, echo_reply, encode_frame, is_frame, parse_frame
+
+
+class TestAudioFrames:
+    """Test encoding, zero-copy parsing and malformed input."""
+
+    def test_round_trip(self):
+        wav = b"RIFF" + bytes(4) + b"WAVE"
+        data = encode_frame("séance", 7, wav, 16000, codec=CODEC_WAV, flags=FLAG_END)
+        assert is_frame(data)
+        frame = parse_frame(data)
+        assert (frame.session_id, frame.seq, frame.codec, frame.sample_rate) == ("séance", 7, CODEC_WAV, 16000)
+        assert frame.end
+        assert bytes(frame.payload) == wav
+
+    def test_payload_is_a_view_of_the_message(self):
+        data = encode_frame("s", 0, bytes(640), 16000)
+        payload = parse_frame(data).payload
+        assert isinstance(payload, memoryview)
+        assert payload.obj is data
+
+    @pytest.mark.parametrize("data", [
+        b"VA",
+        b"XX" + bytes(HEADER.size),
+        encode_frame("s", 0, b"\x00\x00", 16000)[:HEADER.size],  # session id cut off
+        encode_frame("s", 0, b"\x00", 16000),  # odd PCM16 payload
+        encode_frame("s", 0, b"\x00\x00", 0),  # no sample rate
+        encode_frame("s", 0, b"\x00\x00", 4_000_000_000),  # absurd sample rate
+        encode_frame("s", 0, b"\x00\x00" * 8, 16000, codec=CODEC_WAV),  # WAV codec, PCM payload
+        encode_frame("s", 0, b"", 16000).replace(b"s", b"\xff"),  # session id not UTF-8
+    ])
+    def test_malformed_frames_are_rejected(self, data):
+        with pytest.raises(FrameError):
+            parse_frame(data)
+
+    def test_echo_reply(self):
+        """Test that valid frames are echoed unchanged and bad ones answered with an error."""
+        data = encode_frame("s", 3, b"\x01\x00", 16000)
+        frame, reply = echo_reply(data)
+        assert frame.seq == 3 and reply == data
+        frame, reply = echo_reply(b"not a frame")
+        assert frame is None and json.loads(reply)["type"] == "error"
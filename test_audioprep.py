@@ -0,0 +1,97 @@
+"""
+Tests for the NumPy audio preprocessing stage.
+"""
+
+import numpy as np
+import pytest
+
+from audioprep import (Resampler, RingBuffer, SpeechPreprocessor, frame_features, normalize_loudness,
+                       pcm16_to_float, preprocess_utterance, resample, speech_frames)
+
+
+def tone(rate, ms, amplitude=0.3, frequency=220):
+    t = np.arange(rate * ms // 1000) / rate
+    return (amplitude * 32767 * np.sin(2 * np.pi * frequency * t)).astype("<i2").tobytes()
+
+
+def silence(rate, ms):
+    return bytes(rate * ms // 1000 * 2)
+
+
+def feed_in_chunks(preprocessor, audio, rate, chunk_ms=20):
+    step = rate * chunk_ms // 1000 * 2
+    return [u for u in (preprocessor.feed(audio[i:i + step]) for i in range(0, len(audio), step)) if u]
+
+
+class TestResampler:
+    """Test sample-rate conversion."""
+
+    @pytest.mark.parametrize("src", [48000, 44100, 8000])
+    def test_streaming_matches_one_shot_and_keeps_the_tone(self, src):
+        x = pcm16_to_float(tone(src, 1000))
+        one_shot = resample(x, src, 16000)
+        streaming = Resampler(src, 16000)
+        chunked = np.concatenate([streaming.process(x[i:i + 997]) for i in range(0, len(x), 997)])
+        assert abs(len(one_shot) - 16000) <= 1
+        np.testing.assert_allclose(chunked, one_shot, atol=1e-6)
+        # 220 Hz survives the low-pass: about the same RMS as the input
+        assert np.sqrt(np.mean(one_shot[200:-200] ** 2)) == pytest.approx(0.3 / np.sqrt(2), rel=0.02)
+
+    def test_content_above_the_new_nyquist_is_filtered(self):
+        x = pcm16_to_float(tone(48000, 500, frequency=12000))
+        assert np.max(np.abs(resample(x, 48000, 16000)[100:])) < 0.01
+
+
+class TestVoiceActivity:
+    """Test frame features and the speech decision."""
+
+    def test_quiet_noise_is_speech_but_quiet_hum_is_not(self):
+        noise = (np.random.default_rng(0).standard_normal(16000) * 0.005).astype(np.float32)  # ~ -46 dBFS
+        hum = pcm16_to_float(tone(16000, 1000, amplitude=0.007, frequency=60))
+        assert speech_frames(*frame_features(noise, 480)).all()
+        assert not speech_frames(*frame_features(hum, 480)).any()
+
+
+class TestSpeechPreprocessor:
+    """Test utterance cutting, pre-roll and trimming over streamed chunks."""
+
+    @pytest.mark.parametrize("rate", [16000, 48000])
+    def test_utterances_are_resampled_and_trimmed(self, rate):
+        audio = silence(rate, 1000) + tone(rate, 800) + silence(rate, 1000) + tone(rate, 500) + silence(rate, 900)
+        utterances = feed_in_chunks(SpeechPreprocessor(rate), audio, rate)
+        # 300 ms pre-roll + speech + 100 ms of trailing silence, at 16 kHz
+        assert [round(len(u) / 2 / 16000, 1) for u in utterances] == [1.2, 0.9]
+
+    def test_short_click_is_dropped_and_loudness_normalized(self):
+        preprocessor = SpeechPreprocessor(16000)
+        assert feed_in_chunks(preprocessor, tone(16000, 60) + silence(16000, 800), 16000) == []
+        utterance = feed_in_chunks(preprocessor, tone(16000, 600, amplitude=0.02) + silence(16000, 800), 16000)[0]
+        samples = pcm16_to_float(utterance)
+        speech_rms = np.sqrt(np.mean(samples ** 2))
+        assert 20 * np.log10(speech_rms) == pytest.approx(-20, abs=0.5)
+
+    def test_whole_recording(self):
+        assert preprocess_utterance(silence(8000, 500), 8000) is None
+        assert len(preprocess_utterance(silence(8000, 500) + tone(8000, 700), 8000)) // 2 == pytest.approx(
+            16000, abs=16000 * 0.05)
+
+    @pytest.mark.parametrize("rate", [0, 4000, 4_000_000_000])
+    def test_unsupported_input_rate_is_rejected(self, rate):
+        with pytest.raises(ValueError):
+            SpeechPreprocessor(rate)
+
+
+class TestHelpers:
+    """Test the ring buffer and loudness normalization."""
+
+    def test_ring_buffer_keeps_the_most_recent_samples(self):
+        ring = RingBuffer(5)
+        ring.write(np.arange(3, dtype=np.float32))
+        ring.write(np.arange(3, 7, dtype=np.float32))
+        assert ring.read().tolist() == [2, 3, 4, 5, 6]
+        ring.write(np.arange(10, dtype=np.float32))
+        assert ring.read().tolist() == [5, 6, 7, 8, 9]
+
+    def test_normalization_never_clips(self):
+        loud_peak = np.array([0.001] * 100 + [0.9], dtype=np.float32)
+        assert np.max(np.abs(normalize_loudness(loud_peak))) <= 0.99
@@ -0,0 +1,124 @@
+"""
+Tests for the multi-worker router (cluster.py).
+"""
+
+import asyncio
+from collections import Counter
+
+import httpx
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from cluster import Backend, HashRing, Router, routing_key
+
+
+def scope(path="/reminders", method="GET", headers=(), client=("203.0.113.7", 5000), kind="http"):
+    return {"type": kind, "path": path, "method": method, "client": client,
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers]}
+
+
+class TestHashRing:
+    """Test that keys spread evenly and mostly stay put when a worker is added."""
+
+    def test_balanced_and_stable(self):
+        keys = [f"user-{i}" for i in range(20000)]
+        three, four = HashRing(range(3)), HashRing(range(4))
+        counts = Counter(three.node_for(k) for k in keys)
+        assert all(abs(n - len(keys) / 3) < len(keys) / 3 * 0.2 for n in counts.values())
+        moved = sum(three.node_for(k) != four.node_for(k) for k in keys)
+        # Ideally a quarter of the keys move to the new worker, and no others
+        assert moved < len(keys) * 0.35
+        assert all(four.node_for(k) == 3 for k in keys if three.node_for(k) != four.node_for(k))
+
+
+class TestRoutingKey:
+    """Test that the key matches how the app identifies a caller."""
+
+    def test_websocket_path_ids(self):
+        assert routing_key(scope("/ws/notify/alice", kind="websocket")) == "alice"
+        assert routing_key(scope("/ws/audio/session-9", kind="websocket")) == "session-9"
+
+    def test_guide_session_from_body(self):
+        assert routing_key(scope("/guide", "POST"), b'{"message": "hi", "session_id": "s1"}') == "s1"
+        assert routing_key(scope("/guide", "POST"), b'{"message": "hi"}') == "default"
+
+    def test_jwt_subject_then_user_header_then_address(self):
+        token = jwt.encode({"sub": "alice"}, "any-secret", algorithm="HS256")
+        headers = [("Authorization", f"Bearer {token}"), ("X-User-Id", "bob")]
+        assert routing_key(scope(headers=headers)) == "alice"
+        assert routing_key(scope(headers=[("Authorization", "Bearer garbage"), ("X-User-Id", "bob")])) == "bob"
+        assert routing_key(scope()) == "203.0.113.7"
+
+
+def fake_worker(index, ready=True):
+    async def echo(request: Request):
+        return JSONResponse({"worker": index, "forwarded_for": request.headers.get("x-forwarded-for"),
+                             "client": request.client.host, "body": (await request.body()).decode()})
+
+    async def health(request: Request):
+        return JSONResponse({"status": "ok" if ready else "starting"}, status_code=200 if ready else 503)
+
+    app = Starlette(routes=[Route("/health/ready", health), Route("/{path:path}", echo, methods=["GET", "POST"])])
+    # Workers trust the router's forwarded headers from any peer, as serve.py --uds configures them
+    app = ProxyHeadersMiddleware(app, trusted_hosts="*")
+    return Backend(index, f"/nonexistent/worker-{index}.sock", transport=httpx.ASGITransport(app))
+
+
+class TestRouter:
+    """Test forwarding through the router to in-process stand-in workers."""
+
+    def run(self, router, requests):
+        async def go():
+            transport = httpx.ASGITransport(router, client=("198.51.100.4", 1234))
+            async with httpx.AsyncClient(transport=transport, base_url="http://router") as client:
+                return [await request(client) for request in requests]
+        return asyncio.run(go())
+
+    def test_same_user_same_worker(self):
+        router = Router([fake_worker(i) for i in range(4)])
+        responses = self.run(router, [lambda c, n=n: c.get("/reminders", headers={"X-User-Id": f"user-{n % 10}"})
+                                      for n in range(40)])
+        by_user = {}
+        for n, response in enumerate(responses):
+            assert response.json()["worker"] == int(response.headers["x-virgil-worker"])
+            by_user.setdefault(n % 10, set()).add(response.json()["worker"])
+        assert all(len(workers) == 1 for workers in by_user.values())
+        assert len(set.union(*by_user.values())) > 1
+        assert responses[0].json()["forwarded_for"] == "198.51.100.4"
+
+    def test_spoofed_forwarded_for_is_replaced(self):
+        router = Router([fake_worker(0)])
+        response, = self.run(router, [lambda c: c.get("/reminders", headers={"X-Forwarded-For": "6.6.6.6",
+                                                                             "X-Forwarded-Proto": "https"})])
+        assert response.json()["forwarded_for"] == "198.51.100.4"
+        assert response.json()["client"] == "198.51.100.4"
+
+    def test_pinned_worker_and_body_forwarded(self):
+        router = Router([fake_worker(i) for i in range(3)])
+        pinned, scraped, posted = self.run(router, [
+            lambda c: c.get("/history", headers={"X-Virgil-Worker": "2", "X-User-Id": "anyone"}),
+            lambda c: c.get("/metrics?worker=1"),
+            lambda c: c.post("/guide", json={"message": "hi", "session_id": "s1"}),
+        ])
+        assert pinned.json()["worker"] == 2 and scraped.json()["worker"] == 1
+        assert '"session_id": "s1"' in posted.json()["body"]
+        assert posted.json()["worker"] == router.ring.node_for("s1")
+
+    def test_readiness_needs_every_worker(self):
+        router = Router([fake_worker(0), fake_worker(1, ready=False)])
+        asyncio.run(router.health.check_all())
+        ready, pinned = self.run(router, [lambda c: c.get("/health/ready"),
+                                          lambda c: c.get("/health/ready", headers={"X-Virgil-Worker": "0"})])
+        assert ready.status_code == 503
+        assert ready.json()["checks"]["worker-1"]["status"] == "fail"
+        assert pinned.status_code == 200 and pinned.headers["x-virgil-worker"] == "0"
+
+    def test_unreachable_worker_is_503(self):
+        router = Router([Backend(0, "/nonexistent/worker-0.sock")])
+        response, = self.run(router, [lambda c: c.get("/reminders")])
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
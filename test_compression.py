@@ -0,0 +1,88 @@
+"""
+Tests for response compression and the fast JSON response class.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, brotli, choose_encoding
+from fastjson import FastJSONResponse, dumps
+
+BODY = "Virgil keeps the conversation going. " * 100
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse(BODY)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("short")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BODY.encode()] * 3), media_type="text/plain")
+
+    return TestClient(app)
+
+
+class TestChooseEncoding:
+    """Test Accept-Encoding negotiation."""
+
+    def test_gzip_and_identity(self):
+        assert choose_encoding("gzip, deflate") == "gzip"
+        assert choose_encoding("") is None
+        assert choose_encoding("gzip;q=0, identity") is None
+
+    @pytest.mark.skipif(brotli is None, reason="brotli not installed")
+    def test_brotli_preferred_when_available(self):
+        assert choose_encoding("gzip, br") == "br"
+        assert choose_encoding("br;q=0, gzip") == "gzip"
+
+
+class TestCompressionMiddleware:
+    """Test which responses get compressed and that they decode back."""
+
+    def test_large_body_is_gzipped(self, client):
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert int(response.headers["content-length"]) < len(BODY)
+        assert response.text == BODY
+
+    def test_small_body_and_identity_pass_through(self, client):
+        assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.text == BODY
+
+    def test_streaming_body_is_compressed(self, client):
+        response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text == BODY * 3
+
+    @pytest.mark.skipif(brotli is None, reason="brotli not installed")
+    def test_brotli_round_trip(self, client):
+        with client.stream("GET", "/large", headers={"Accept-Encoding": "br"}) as response:
+            raw = b"".join(response.iter_raw())
+        assert response.headers["content-encoding"] == "br"
+        assert brotli.decompress(raw).decode() == BODY
+
+
+class TestFastJSON:
+    """Test the JSON encoder used for API responses."""
+
+    def test_types_match_the_standard_encoder(self):
+        body = dumps({"when": datetime(2026, 1, 2, 3, 4, 5, 600), "price": Decimal("1.5"), "tags": {"a"}, 1: "x"})
+        assert body.startswith(b'{"when":"2026-01-02T03:04:05.000600"')
+        assert FastJSONResponse({"ok": True}).body == b'{"ok":true}'
+
@@ -0,0 +1,54 @@
+"""
+Tests for version counters and ETag matching.
+"""
+
+from conditional import VersionCounter, content_etag, etag_matches, make_etag
+
+
+class TestVersionCounter:
+    """Test that versions only ever move forward."""
+
+    def test_bump_changes_only_that_key(self):
+        versions = VersionCounter()
+        before = versions.get("alice")
+        assert versions.bump("alice") != before
+        assert versions.get("bob") == before
+
+    def test_eviction_never_reuses_a_version(self):
+        versions = VersionCounter(max_keys=2)
+        seen = versions.bump("alice")
+        versions.bump("bob")
+        versions.bump("carol")  # evicts alice
+        assert versions.get("alice") >= seen
+        assert versions.bump("alice") > seen
+
+    def test_expiry_moves_the_version_on(self):
+        versions = VersionCounter()
+        before = versions.get("alice")
+        versions.expire_at("alice", when=100.0)
+        assert versions.get("alice", now=99.0) == before
+        after = versions.get("alice", now=100.0)
+        assert after != before
+        assert versions.get("alice", now=200.0) == after
+
+    def test_bump_all(self):
+        versions = VersionCounter()
+        alice, bob = versions.bump("alice"), versions.get("bob")
+        versions.bump_all()
+        assert versions.get("alice") != alice and versions.get("bob") != bob
+
+
+class TestEtagMatching:
+    """Test If-None-Match parsing."""
+
+    def test_weak_comparison_and_lists(self):
+        etag = make_etag("h", 3)
+        assert etag.startswith('W/"')
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", {etag[2:]}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches(make_etag("h", 4), etag)
+        assert not etag_matches(None, etag)
+
+    def test_content_etag_follows_the_body(self):
+        assert content_etag(b"a") == content_etag(b"a") != content_etag(b"b")
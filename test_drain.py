@@ -0,0 +1,59 @@
+"""
+Tests for in-flight tracking used by graceful draining (drain.py).
+"""
+
+import asyncio
+
+from drain import Drainer, InFlightMiddleware, reconnect_hint
+
+
+class TestDrainer:
+    """Test counting and waiting for in-flight work."""
+
+    def test_wait_idle_returns_when_work_finishes(self):
+        drainer = Drainer()
+
+        async def work():
+            with drainer.track():
+                await asyncio.sleep(0.05)
+
+        async def run():
+            task = asyncio.ensure_future(work())
+            await asyncio.sleep(0)
+            assert drainer.inflight == 1
+            assert await drainer.wait_idle(1.0)
+            await task
+
+        asyncio.run(run())
+        assert drainer.inflight == 0
+
+    def test_wait_idle_gives_up_at_the_deadline(self):
+        drainer = Drainer()
+
+        async def run():
+            with drainer.track():
+                return await drainer.wait_idle(0.02)
+
+        assert asyncio.run(run()) is False
+
+    def test_middleware_counts_http_requests_only(self):
+        drainer = Drainer()
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append((scope["type"], drainer.inflight))
+
+        middleware = InFlightMiddleware(app, drainer)
+        asyncio.run(middleware({"type": "http"}, None, None))
+        asyncio.run(middleware({"type": "websocket"}, None, None))
+        assert seen == [("http", 1), ("websocket", 0)]
+        assert drainer.inflight == 0
+
+
+class TestReconnectHint:
+    """Test that reconnects are spread over the jitter window."""
+
+    def test_delays_are_spread(self):
+        delays = {reconnect_hint(10)["retry_after_ms"] for _ in range(50)}
+        assert all(0 <= d <= 10000 for d in delays)
+        assert len(delays) > 10
@@ -0,0 +1,83 @@
+"""
+Tests for the background health probes (health.py).
+"""
+
+import asyncio
+import time
+
+from health import HealthMonitor
+
+
+async def ok():
+    return {"detail": 1}
+
+
+async def broken():
+    raise ConnectionError("refused")
+
+
+async def hangs():
+    await asyncio.sleep(10)
+
+
+class TestReadiness:
+    """Test how probe results combine into a readiness status."""
+
+    def test_starting_until_critical_probes_have_run(self):
+        monitor = HealthMonitor()
+        monitor.add("database", ok)
+        assert monitor.ready()["status"] == "starting"
+        asyncio.run(monitor.check_all())
+        report = monitor.ready()
+        assert report["status"] == "ok" and HealthMonitor.is_ready(report)
+        assert report["checks"]["database"]["detail"] == 1
+
+    def test_non_critical_failure_is_degraded_but_ready(self):
+        monitor = HealthMonitor()
+        monitor.add("database", ok)
+        monitor.add("translation", broken, critical=False)
+        asyncio.run(monitor.check_all())
+        report = monitor.ready()
+        assert report["status"] == "degraded" and HealthMonitor.is_ready(report)
+        assert "refused" in report["checks"]["translation"]["error"]
+
+    def test_critical_failure_and_timeout_fail_readiness(self):
+        monitor = HealthMonitor(timeout=0.05)
+        monitor.add("database", hangs)
+        asyncio.run(monitor.check_all())
+        report = monitor.ready()
+        assert report["status"] == "fail" and not HealthMonitor.is_ready(report)
+        assert "timed out" in report["checks"]["database"]["error"]
+
+    def test_old_results_are_stale(self):
+        monitor = HealthMonitor(interval=1, timeout=1)
+        monitor.add("database", ok)
+        asyncio.run(monitor.check_all())
+        report = monitor.ready(now=time.time() + 60)
+        assert report["checks"]["database"]["status"] == "stale"
+        assert report["status"] == "fail"
+
+    def test_reported_values_are_included(self):
+        monitor = HealthMonitor()
+        monitor.report("connections", lambda: {"voice": 2})
+        assert monitor.ready()["connections"] == {"voice": 2}
+
+
+class TestLiveness:
+    """Test event-loop lag measurement."""
+
+    def test_blocked_loop_fails_liveness(self):
+        monitor = HealthMonitor(max_lag_ms=50, lag_interval=0.01)
+
+        async def run():
+            ticker = asyncio.ensure_future(monitor._measure_lag())
+            await asyncio.sleep(0.05)
+            assert monitor.live()["status"] == "ok"
+            time.sleep(0.2)  # block the loop
+            await asyncio.sleep(0.03)
+            ticker.cancel()
+
+        asyncio.run(run())
+        live = monitor.live()
+        assert live["status"] == "fail"
+        assert live["event_loop_lag"]["max_ms"] >= 150
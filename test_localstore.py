@@ -0,0 +1,46 @@
+"""
+Tests for the host-wide key-value store (localstore.py).
+"""
+
+import time
+
+import pytest
+
+from localstore import MemoryStore, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def stores(request, tmp_path):
+    """Two handles on one store, as two workers would have."""
+    if request.param == "memory":
+        store = MemoryStore()
+        return store, store
+    path = str(tmp_path / "local.db")
+    return SQLiteStore(path), SQLiteStore(path)
+
+
+class TestLocalStore:
+    """Test values, counters and leases on both backends."""
+
+    def test_values_expire(self, stores):
+        first, second = stores
+        first.set("k", "v")
+        first.set("short", "v", ttl=0.05)
+        assert second.get("k") == "v" and second.get("short") == "v"
+        time.sleep(0.1)
+        assert second.get("short") is None and second.get("missing") is None
+
+    def test_counters_are_shared(self, stores):
+        first, second = stores
+        assert first.incr("generation") == 1
+        assert second.incr("generation") == 2
+        assert first.get("generation") == "2"
+
+    def test_lease_has_one_holder_until_it_expires(self, stores):
+        first, second = stores
+        assert first.acquire("lease:job", "worker-a", ttl=0.1)
+        assert not second.acquire("lease:job", "worker-b", ttl=0.1)
+        assert first.acquire("lease:job", "worker-a", ttl=0.1)  # renewal
+        time.sleep(0.15)
+        assert second.acquire("lease:job", "worker-b", ttl=10)
+        assert not first.acquire("lease:job", "worker-a", ttl=10)
@@ -0,0 +1,87 @@
+"""
+Tests for the structured, queued and sampled logging pipeline.
+"""
+
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+import logsetup
+from logsetup import (JsonFormatter, NonBlockingQueueHandler, RedactingFilter, SamplingFilter,
+                      configure_logging, parse_sample_rates, shutdown_logging)
+
+
+def make_record(name="virgil.requests", level=logging.INFO, msg="Processing guide request", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestFilters:
+    """Test sampling and redaction."""
+
+    def test_parse_sample_rates(self):
+        assert parse_sample_rates("virgil.requests=0.1, httpx=2") == {"virgil.requests": 0.1, "httpx": 1.0}
+
+    def test_sampling_keeps_one_in_n_and_all_warnings(self):
+        sampler = SamplingFilter({"virgil.requests": 0.25})
+        kept = [sampler.filter(make_record()) for _ in range(100)]
+        assert sum(kept) == 25
+        assert all(sampler.filter(make_record(level=logging.WARNING)) for _ in range(10))
+        assert all(sampler.filter(make_record(name="main")) for _ in range(10))
+        assert sampler.filter(make_record(name="virgil.requests.ws"))
+
+    def test_redaction_replaces_content_with_length(self):
+        record = make_record(user_message="my secret plans", tone="friendly")
+        RedactingFilter().filter(record)
+        assert record.user_message == "<redacted 15 chars>"
+        assert record.tone == "friendly"
+
+
+class TestPipeline:
+    """Test JSON output through the queue."""
+
+    @pytest.fixture(autouse=True)
+    def restore_root_logger(self):
+        root = logging.getLogger()
+        handlers, level, listener = list(root.handlers), root.level, logsetup._listener
+        yield
+        shutdown_logging()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+        if listener is not None:
+            # configure_logging() stopped it; the restored queue handler needs it running
+            listener.start()
+            logsetup._listener = listener
+
+    def test_json_lines_with_extras_and_exceptions(self):
+        stream = io.StringIO()
+        configure_logging("INFO", stream=stream)
+        log = logging.getLogger("virgil.test")
+        log.info("Generating response", extra={"tone": "friendly", "user_message": "hello there"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            log.exception("Failed %s", "badly")
+        shutdown_logging()
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert first["msg"] == "Generating response"
+        assert first["logger"] == "virgil.test" and first["level"] == "INFO"
+        assert first["tone"] == "friendly"
+        assert first["user_message"] == "<redacted 11 chars>"
+        assert second["msg"] == "Failed badly"
+        assert "ValueError: boom" in second["exc"]
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+        for _ in range(5):
+            handler.handle(make_record())
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_formatter_output_is_one_line(self):
+        line = JsonFormatter().format(make_record(msg="multi\nline"))
+        assert "\n" not in line
@@ -0,0 +1,62 @@
+"""
+Tests for long-poll waiters (longpoll.py).
+"""
+
+import asyncio
+import time
+
+from conditional import VersionCounter
+from longpoll import VersionWaiters
+
+
+class TestVersionWaiters:
+    """Test when a parked wait is released."""
+
+    def test_bump_releases_only_that_key(self):
+        versions = VersionCounter()
+        waiters = VersionWaiters(versions)
+
+        async def run():
+            alice = asyncio.ensure_future(waiters.wait("alice", versions.get("alice"), 5))
+            bob = asyncio.ensure_future(waiters.wait("bob", versions.get("bob"), 0.2))
+            await asyncio.sleep(0.05)
+            assert waiters.waiting == 2
+            versions.bump("alice")
+            return await alice, await bob
+
+        started = time.monotonic()
+        assert asyncio.run(run()) == (True, False)
+        assert time.monotonic() - started < 1
+        assert waiters.waiting == 0
+
+    def test_expiry_releases_the_wait(self):
+        versions = VersionCounter()
+        waiters = VersionWaiters(versions)
+        version = versions.get("alice")
+        versions.expire_at("alice", time.time() + 0.1)
+        started = time.monotonic()
+        assert asyncio.run(waiters.wait("alice", version, 5))
+        assert time.monotonic() - started < 1
+
+    def test_already_moved_on_returns_at_once(self):
+        versions = VersionCounter()
+        waiters = VersionWaiters(versions)
+        version = versions.get("alice")
+        versions.bump("alice")
+        assert asyncio.run(waiters.wait("alice", version, 5))
+
+    def test_close_and_capacity_refuse_waits(self):
+        versions = VersionCounter()
+        waiters = VersionWaiters(versions, max_waiters=0)
+        started = time.monotonic()
+        assert not asyncio.run(waiters.wait("alice", versions.get("alice"), 5))
+        waiters = VersionWaiters(versions)
+
+        async def run():
+            parked = asyncio.ensure_future(waiters.wait("alice", versions.get("alice"), 5))
+            await asyncio.sleep(0.05)
+            waiters.close()
+            return await parked
+
+        assert not asyncio.run(run())
+        assert time.monotonic() - started < 1
@@ -0,0 +1,46 @@
+"""
+Tests for the lock-free metrics registry and its Prometheus text rendering.
+"""
+
+import threading
+
+from metrics import MetricsRegistry
+
+
+class TestMetricsRegistry:
+    """Test counters, histograms and gauges."""
+
+    def test_counter_sums_across_threads(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("jobs_total", "Jobs.", ("kind",))
+
+        def work():
+            for _ in range(10000):
+                counter.labels("a").inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert 'jobs_total{kind="a"} 40000' in registry.render()
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        lines = registry.render().splitlines()
+        assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+        assert 'latency_seconds_bucket{le="1"} 3' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+        assert "latency_seconds_count 4" in lines
+        assert "latency_seconds_sum 3.65" in lines
+
+    def test_gauge_and_label_escaping(self):
+        registry = MetricsRegistry()
+        registry.gauge("open_sockets", "Sockets.", lambda: 3)
+        registry.counter("odd_total", "Odd labels.", ("path",)).labels('a"b').inc()
+        text = registry.render()
+        assert "# TYPE open_sockets gauge\nopen_sockets 3" in text
+        assert 'odd_total{path="a\\"b"} 1' in text
@@ -0,0 +1,57 @@
+"""
+Tests for the notification replay log (notifications.py).
+"""
+
+import json
+
+from notifications import NotificationLog
+
+
+def send(log, user_id, n):
+    seq, message = log.next_message({"type": "reminder", "id": n})
+    log.record(user_id, seq, message)
+    return seq
+
+
+class TestNotificationLog:
+    """Test sequence numbers, replay and the completeness flag."""
+
+    def test_messages_carry_seq_and_epoch(self):
+        log = NotificationLog()
+        seq, message = log.next_message({"type": "reminder", "id": 7})
+        data = json.loads(message)
+        assert data == {"type": "reminder", "id": 7, "seq": seq, "epoch": log.epoch}
+        assert log.next_message({})[0] > seq
+
+    def test_replay_returns_messages_after_since(self):
+        log = NotificationLog()
+        seqs = [send(log, "alice", n) for n in range(4)]
+        send(log, "bob", 99)
+        missed, complete = log.replay("alice", seqs[1], log.epoch)
+        assert [json.loads(m)["id"] for m in missed] == [2, 3]
+        assert complete
+        assert log.latest("alice") == seqs[-1]
+        assert log.replay("alice", seqs[-1]) == ([], True)
+
+    def test_truncated_log_is_incomplete(self):
+        log = NotificationLog(per_user=2)
+        seqs = [send(log, "alice", n) for n in range(4)]
+        missed, complete = log.replay("alice", seqs[0])
+        assert len(missed) == 2 and not complete
+        assert log.replay("alice", seqs[1])[1]
+
+    def test_other_epoch_gets_whole_log_and_incomplete(self):
+        log = NotificationLog()
+        seqs = [send(log, "alice", n) for n in range(3)]
+        missed, complete = log.replay("alice", seqs[-1], epoch="restarted")
+        assert len(missed) == 3 and not complete
+
+    def test_evicted_user_is_incomplete(self):
+        log = NotificationLog(max_users=1)
+        first = send(log, "alice", 0)
+        send(log, "bob", 1)
+        assert log.latest("alice") == 0
+        assert log.replay("alice", 0) == ([], False)
+        assert log.replay("carol", 0) == ([], False)
+        assert log.replay("carol", log.latest("bob"))[1]
+        assert first < log.latest("bob")
@@ -0,0 +1,71 @@
+"""
+Tests for the sampling profiler and the event loop watchdog.
+"""
+
+import asyncio
+import threading
+import time
+
+from profiler import LoopWatchdog, ProfilerBusy, SamplingProfiler, format_collapsed
+
+
+def busy_until(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+class TestSamplingProfiler:
+    """Test collapsed-stack sampling of live threads."""
+
+    def test_profile_captures_running_function(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_until, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            counts = SamplingProfiler().profile(0.2, interval=0.002, thread_ids={worker.ident})
+        finally:
+            stop.set()
+            worker.join()
+        assert counts
+        assert all(stack.startswith("busy-worker;") for stack in counts)
+        assert any("busy_until (test_profiler.py:" in stack for stack in counts)
+        lines = format_collapsed(counts).splitlines()
+        assert lines[0].rsplit(" ", 1)[1].isdigit()
+
+    def test_concurrent_profiles_are_refused(self):
+        profiler = SamplingProfiler()
+        runner = threading.Thread(target=profiler.profile, args=(0.3,))
+        runner.start()
+        time.sleep(0.05)
+        try:
+            profiler.profile(0.1)
+            raise AssertionError("expected ProfilerBusy")
+        except ProfilerBusy:
+            pass
+        finally:
+            runner.join()
+
+
+class TestLoopWatchdog:
+    """Test detection of callbacks that block the event loop."""
+
+    def test_blocking_callback_is_reported_with_stack(self):
+        blocks = []
+
+        async def scenario():
+            watchdog = LoopWatchdog(threshold_ms=100, on_block=lambda seconds, stack: blocks.append((seconds, stack)))
+            watchdog.start()
+            await asyncio.sleep(0.1)
+            blocking_handler()
+            await asyncio.sleep(0.1)
+            watchdog.stop()
+
+        asyncio.run(scenario())
+        assert len(blocks) == 1
+        seconds, stack = blocks[0]
+        assert seconds >= 0.2
+        assert "blocking_handler (test_profiler.py:" in stack
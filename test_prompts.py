@@ -0,0 +1,106 @@
+"""
+Tests for the compiled tone prompt templates.
+"""
+
+import json
+
+import pytest
+
+from prompts import BASE_PROMPT, PrefixCache, PromptTemplates, SessionPrefix, pairs_from_messages
+
+
+class TestToneTemplates:
+    """Test rendering and tone selection."""
+
+    def test_render_uses_mixtral_chat_format(self):
+        templates = PromptTemplates.load()
+        prompt = templates.render("friendly", [("hi", "hello!"), ("how are you?", "great")], "bye")
+        system = templates.get("friendly").system_prompt
+        assert prompt == (f"<s>[INST] {system}\n\nhi [/INST] hello!</s>[INST] how are you? [/INST] great"
+                          "</s>[INST] bye [/INST]")
+
+    def test_render_without_history(self):
+        templates = PromptTemplates.load()
+        assert templates.render(None, [], "hello").endswith("\n\nhello [/INST]")
+
+    def test_unknown_tone_falls_back_to_default(self):
+        templates = PromptTemplates.load()
+        assert templates.get("pirate") is templates.get("default")
+
+    def test_pairs_from_messages_drops_unanswered_turns(self):
+        messages = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"},
+                    {"role": "user", "content": "c"}]
+        assert pairs_from_messages(messages) == [("a", "b")]
+
+
+class TestCustomTones:
+    """Test tones loaded from a config file."""
+
+    def test_yaml_tones_extend_builtins(self, tmp_path):
+        path = tmp_path / "tones.yaml"
+        path.write_text("tones:\n  socratic:\n    description: Asks questions\n"
+                        "    instruction: Answer with guiding questions.\n"
+                        "  default:\n    system: Be brief.\n")
+        templates = PromptTemplates.load(str(path))
+        assert templates.names() == ["default", "friendly", "professional", "socratic"]
+        assert templates.get("socratic").system_prompt == f"{BASE_PROMPT} Answer with guiding questions."
+        assert templates.get("default").system_prompt == "Be brief."
+        assert templates.descriptions()["socratic"] == "Asks questions"
+
+    def test_invalid_tone_is_rejected(self, tmp_path):
+        path = tmp_path / "tones.json"
+        path.write_text(json.dumps({"tones": {"empty": {"description": "no prompt"}}}))
+        with pytest.raises(ValueError):
+            PromptTemplates.load(str(path))
+
+
+class TestPrefixCache:
+    """Test per-session incremental prompt prefixes."""
+
+    def test_appended_turns_extend_the_previous_prompt(self):
+        templates = PromptTemplates.load()
+        cache = PrefixCache(budget_chars=10000, max_turns=10)
+        tone = templates.get("default")
+        prefix = cache.build("s1", tone, [(1, "hi", "hello")])
+        first = prefix.render("how are you?")
+        first_hash = prefix.hash
+        cache.append("s1", 2, "how are you?", "great")
+        second = cache.get("s1", tone, 2).render("bye")
+        assert second.startswith(first[:-len("how are you? [/INST]")])
+        assert second == templates.render("default", [("hi", "hello"), ("how are you?", "great")], "bye")
+        assert prefix.hash != first_hash
+
+    def test_stale_or_other_tone_prefix_is_not_reused(self):
+        templates = PromptTemplates.load()
+        cache = PrefixCache(budget_chars=10000, max_turns=10)
+        cache.build("s1", templates.get("default"), [(1, "hi", "hello")])
+        assert cache.get("s1", templates.get("default"), 1) is not None
+        assert cache.get("s1", templates.get("default"), 5) is None
+        assert cache.get("s1", templates.get("friendly"), 1) is None
+
+    def test_over_budget_prefix_is_cut_to_half(self):
+        templates = PromptTemplates.load()
+        cache = PrefixCache(budget_chars=10000, max_turns=4)
+        tone = templates.get("default")
+        cache.build("s1", tone, [])
+        for turn_id in range(1, 5):
+            cache.append("s1", turn_id, f"q{turn_id}", f"a{turn_id}")
+        assert cache.get("s1", tone, 4).turn_ids == [1, 2, 3, 4]
+        prefix = cache.append("s1", 5, "q5", "a5")
+        assert prefix.turn_ids == [4, 5]
+
+    def test_turn_over_half_the_budget_still_advances_the_prefix(self):
+        templates = PromptTemplates.load()
+        cache = PrefixCache(budget_chars=2000, max_turns=10)
+        tone = templates.get("default")
+        cache.build("s1", tone, [(1, "hi", "hello")])
+        prefix = cache.append("s1", 2, "x" * 2500, "long answer")
+        assert prefix.turn_ids == [] and prefix.last_id == 2
+        assert cache.get("s1", tone, 2) is prefix
+        assert cache.append("s1", 3, "short", "reply").turn_ids == [3]
+
+    def test_related_turns_go_after_the_prefix(self):
+        prefix = SessionPrefix(PromptTemplates.load().get("default"), [(3, "recent", "reply")])
+        prompt = prefix.render("now", [("old question", "old answer")])
+        assert prompt.startswith(prefix.text)
+        assert prompt.endswith("Earlier in our conversation:\nUser: old question\nVirgil: old answer\n\nnow [/INST]")
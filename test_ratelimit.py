@@ -0,0 +1,81 @@
+"""
+Tests for the token-bucket rate limiter and its bucket stores.
+"""
+
+import asyncio
+
+import pytest
+
+from ratelimit import Limit, MemoryBucketStore, RateLimiter, SQLiteBucketStore, parse_route_limits
+
+
+class TestLimits:
+    """Test limit parsing."""
+
+    def test_parse_route_limits(self):
+        limits = parse_route_limits("/guide=20/60:5, /calculate=10/1")
+        assert limits["/guide"].rate == pytest.approx(20 / 60)
+        assert limits["/guide"].burst == 5
+        assert limits["/calculate"].burst == 10
+
+    def test_invalid_limit_is_rejected(self):
+        with pytest.raises(ValueError):
+            Limit.parse("0/60")
+
+
+class TestMemoryBucketStore:
+    """Test bucket behaviour and eviction."""
+
+    def test_burst_then_retry_after_then_refill(self):
+        store = MemoryBucketStore()
+        limit = Limit(2, 10)  # one token every 5 seconds
+        assert store.take("u", limit, now=0)[0]
+        assert store.take("u", limit, now=0)[0]
+        allowed, wait = store.take("u", limit, now=1)
+        assert not allowed and wait == pytest.approx(4)
+        assert store.take("u", limit, now=5)[0]
+        assert store.take("other", limit, now=5)[0]
+
+    def test_idle_and_excess_buckets_are_evicted(self):
+        store = MemoryBucketStore(max_keys=3, idle_seconds=100)
+        limit = Limit(1, 1)
+        for i in range(5):
+            store.take(f"k{i}", limit, now=i)
+        assert len(store) == 3
+        store.take("late", limit, now=1000)
+        assert len(store) == 1
+
+
+class TestSQLiteBucketStore:
+    """Test buckets shared through a SQLite file."""
+
+    def test_workers_share_buckets(self, tmp_path):
+        path = str(tmp_path / "buckets.db")
+        worker_a, worker_b = SQLiteBucketStore(path), SQLiteBucketStore(path)
+        limit = Limit(2, 60)
+        assert worker_a.take("u", limit, now=100)[0]
+        assert worker_b.take("u", limit, now=100)[0]
+        assert not worker_a.take("u", limit, now=100)[0]
+
+
+class TestRateLimiter:
+    """Test the route bucket and the per-user quota together."""
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_rejected_requests_take_no_tokens(self, tmp_path, backend):
+        store = MemoryBucketStore() if backend == "memory" else SQLiteBucketStore(str(tmp_path / "buckets.db"))
+        route, quota = Limit(3, 6000), Limit(1, 60)
+        buckets = [("/guide|u", route), ("*|u", quota)]
+        assert store.take_all(buckets, now=0) == (True, 0.0)
+        for _ in range(5):
+            allowed, wait = store.take_all(buckets, now=0)
+            assert not allowed and wait == pytest.approx(60)
+        # The quota refilled; the route bucket still has the two tokens the rejections did not take
+        assert store.take_all(buckets, now=60)[0]
+        assert store.take("/guide|u", route, now=60)[0]
+        assert not store.take("/guide|u", route, now=60)[0]
+
+    def test_check_returns_retry_after(self):
+        limiter = RateLimiter(MemoryBucketStore(), {"/guide": Limit(5, 60)}, user_limit=Limit(1, 10))
+        assert asyncio.run(limiter.check("/guide", "u")) == 0
+        assert asyncio.run(limiter.check("/guide", "u")) == pytest.approx(10, abs=0.1)
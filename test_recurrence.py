@@ -0,0 +1,56 @@
+"""
+Tests for reminder recurrence rules (recurrence.py).
+"""
+
+from datetime import datetime
+
+import pytest
+
+from recurrence import parse_rule
+
+
+class TestIntervalRules:
+    """Test fixed-interval rules and their aliases."""
+
+    def test_next_occurrence_keeps_the_phase(self):
+        rule = parse_rule("every 90m")
+        first = datetime(2024, 1, 1, 9, 0)
+        assert rule.next_after(first, first) == datetime(2024, 1, 1, 10, 30)
+        # After downtime the missed occurrences are skipped, not replayed
+        assert rule.next_after(first, datetime(2024, 1, 1, 14, 0)) == datetime(2024, 1, 1, 15, 0)
+
+    def test_aliases(self):
+        start = datetime(2024, 1, 1, 8, 0)
+        assert parse_rule("Daily").next_after(start, start) == datetime(2024, 1, 2, 8, 0)
+        assert parse_rule("weekly").next_after(start, start) == datetime(2024, 1, 8, 8, 0)
+
+    @pytest.mark.parametrize("rule", ["", "every 0m", "every 30s", "every 999999999999d", "sometimes"])
+    def test_invalid_rules(self, rule):
+        with pytest.raises(ValueError):
+            parse_rule(rule)
+
+
+class TestCronRules:
+    """Test five-field cron rules."""
+
+    def test_weekdays_at_half_past_seven(self):
+        rule = parse_rule("30 7 * * 1-5")
+        friday = datetime(2024, 1, 5, 7, 30)
+        assert rule.next_after(friday, friday) == datetime(2024, 1, 8, 7, 30)
+
+    def test_steps_and_lists(self):
+        rule = parse_rule("*/20 9,17 * * *")
+        assert rule.next_after(datetime(2024, 1, 1), datetime(2024, 1, 1, 9, 45)) == datetime(2024, 1, 1, 17, 0)
+
+    def test_day_of_month_or_day_of_week(self):
+        # First of the month or any Sunday, as in cron
+        rule = parse_rule("0 12 1 * 0")
+        assert rule.next_after(datetime(2024, 1, 2), datetime(2024, 1, 2)) == datetime(2024, 1, 7, 12, 0)
+
+    def test_impossible_date_never_fires(self):
+        assert parse_rule("0 0 31 2 *").next_after(datetime(2024, 1, 1), datetime(2024, 1, 1)) is None
+
+    @pytest.mark.parametrize("rule", ["60 * * * *", "* * * 13 *", "* * * *", "a * * * *", "*/0 * * * *"])
+    def test_invalid_fields(self, rule):
+        with pytest.raises(ValueError):
+            parse_rule(rule)
@@ -0,0 +1,115 @@
+"""
+Tests for the /guide retrieval stage: embeddings, the memory-mapped turn index and
+prompt-budget selection.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from retrieval import RetrievalIndex, TurnIndex, embed_text, select_context_turns
+
+
+def _turn(turn_id, message, response=""):
+    return SimpleNamespace(id=turn_id, message=message, response=response)
+
+
+class TestEmbedding:
+    """Test the hashing-trick embeddings."""
+
+    def test_related_text_scores_higher(self):
+        query = embed_text("how much water should I drink")
+        related = embed_text("drink more water every day")
+        unrelated = embed_text("my guitar needs new strings")
+        assert float(query @ related) > float(query @ unrelated)
+
+    def test_unit_length_and_empty(self):
+        assert abs(np.linalg.norm(embed_text("sourdough starter feeding")) - 1.0) < 1e-5
+        assert not embed_text("").any()
+
+
+class TestTurnIndex:
+    """Test persistence and search of one user's vectors."""
+
+    def test_append_persists_and_searches(self, tmp_path):
+        index = TurnIndex(str(tmp_path), "user")
+        texts = {1: "marathon training plan", 2: "cheap flights to lisbon", 3: "interval running workouts"}
+        index.append(list(texts), np.stack([embed_text(t) for t in texts.values()]))
+
+        reopened = TurnIndex(str(tmp_path), "user")
+        assert len(reopened) == 3 and reopened.last_id == 3
+        hits = reopened.search(embed_text("running a marathon"), k=2)
+        assert [turn_id for turn_id, _ in hits][0] == 1
+        assert 2 not in [turn_id for turn_id, _ in hits]
+
+    def test_search_excludes_ids(self, tmp_path):
+        index = TurnIndex(str(tmp_path), "user")
+        index.append([1, 2], np.stack([embed_text("tax return deadline"), embed_text("tax deductions")]))
+        hits = index.search(embed_text("tax"), k=2, exclude_ids=[1])
+        assert [turn_id for turn_id, _ in hits] == [2]
+
+    def test_torn_append_is_ignored(self, tmp_path):
+        index = TurnIndex(str(tmp_path), "user")
+        index.append([1], embed_text("first")[None, :])
+        with open(index.vectors_path, "ab") as f:
+            f.write(b"\0" * 100)  # partial row left by a crash
+        assert len(TurnIndex(str(tmp_path), "user")) == 1
+        index.append([2], embed_text("second")[None, :])
+        assert len(TurnIndex(str(tmp_path), "user")) == 2
+
+
+class TestRetrievalIndex:
+    """Test batch indexing and backfill."""
+
+    def test_backfill_then_incremental(self, tmp_path):
+        retrieval = RetrievalIndex(str(tmp_path))
+        loader = lambda user_id, after_id: [(i, f"turn about topic {i}") for i in range(1, 4) if i > after_id]
+        assert retrieval.index_batch([("alice", None, loader, 0), ("alice", [(3, "duplicate")], None, 0)]) == 3
+        assert retrieval.index_batch([("alice", [(4, "gardening tomatoes")], None, 0)]) == 1
+        assert retrieval.search("alice", "tomatoes in the garden", k=1) == [4]
+
+    def test_drop_removes_vectors(self, tmp_path):
+        retrieval = RetrievalIndex(str(tmp_path))
+        retrieval.index_batch([("bob", [(1, "secret plans")], None, 0)])
+        retrieval.drop("bob")
+        assert retrieval.search("bob", "secret plans", k=1) == []
+
+    def test_turns_queued_before_a_drop_are_not_written(self, tmp_path):
+        retrieval = RetrievalIndex(str(tmp_path))
+        retrieval.enqueue("bob", 1, "secret plans")
+        retrieval.ensure_backfill("bob", lambda user_id, after_id: [(2, "more secret plans")])
+        retrieval.drop("bob")
+        retrieval.enqueue("bob", 3, "a fresh start")
+        jobs = [retrieval.queue.get_nowait() for _ in range(retrieval.queue.qsize())]
+        assert retrieval.index_batch(jobs) == 1
+        assert retrieval.search("bob", "secret plans fresh start", k=5) == [3]
+
+    def test_least_recently_used_indexes_are_closed(self, tmp_path):
+        retrieval = RetrievalIndex(str(tmp_path), max_open=2)
+        retrieval.index_batch([(user, [(1, f"{user} likes tomatoes")], None, 0) for user in ("a", "b", "c")])
+        assert list(retrieval._indexes) == ["b", "c"]
+        assert retrieval.search("a", "tomatoes", k=1) == [1]
+        assert list(retrieval._indexes) == ["c", "a"]
+
+    def test_reopened_index_sees_appends_through_the_evicted_one(self, tmp_path):
+        retrieval = RetrievalIndex(str(tmp_path), max_open=1)
+        stale = retrieval.index_for("a")  # e.g. held by the indexing thread while "a" is evicted
+        retrieval.index_for("b")
+        fresh = retrieval.index_for("a")
+        assert len(fresh) == 0
+        stale.append([1], embed_text("tomatoes")[None, :])
+        assert fresh.search(embed_text("tomatoes"), 1)[0][0] == 1
+
+
+class TestSelectContextTurns:
+    """Test prompt-budget selection of history turns."""
+
+    def test_keeps_recent_then_related_in_order(self):
+        recent = [_turn(10, "latest"), _turn(9, "previous"), _turn(8, "x" * 200)]
+        related = [_turn(3, "relevant older turn")]
+        chosen = select_context_turns(recent, related, budget_chars=120, keep_recent=2)
+        assert [t.id for t in chosen] == [3, 9, 10]
+
+    def test_without_related_matches_recent_history(self):
+        recent = [_turn(i, f"turn {i}") for i in range(5, 0, -1)]
+        assert [t.id for t in select_context_turns(recent, [], budget_chars=10000)] == [1, 2, 3, 4, 5]
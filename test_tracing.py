@@ -0,0 +1,73 @@
+"""
+Tests for span tracing, the slow-trace ring buffer and the OTLP file exporter.
+"""
+
+import asyncio
+import json
+
+from tracing import OTLPFileExporter, Tracer
+
+
+class TestTracer:
+    """Test span nesting and slow-trace capture."""
+
+    def test_spans_nest_across_awaits(self):
+        tracer = Tracer(slow_threshold_ms=0)
+
+        @tracer.traced("POST /guide")
+        async def handler():
+            with tracer.span("db.history_query", rows=3):
+                await asyncio.sleep(0)
+            with tracer.span("inference.http") as span:
+                await asyncio.sleep(0.01)
+                span.set("http.status_code", 200)
+
+        asyncio.run(handler())
+        trace = tracer.recent_slow()[0]
+        root, query, inference = trace["spans"]
+        assert trace["name"] == "POST /guide"
+        assert query["parent_id"] == inference["parent_id"] == root["span_id"]
+        assert query["attributes"] == {"rows": 3}
+        assert inference["duration_ms"] >= 10
+
+    def test_fast_and_dropped_traces_are_not_kept(self):
+        tracer = Tracer(slow_threshold_ms=1000)
+        with tracer.trace("fast"):
+            pass
+        slow = Tracer(slow_threshold_ms=0)
+        with slow.trace("idle tick") as span:
+            span.drop()
+        assert tracer.recent_slow() == [] and slow.recent_slow() == []
+
+    def test_span_outside_trace_is_noop(self):
+        tracer = Tracer(slow_threshold_ms=0)
+        with tracer.span("orphan") as span:
+            span.set("ignored", True)
+        assert tracer.recent_slow() == []
+
+    def test_errors_are_recorded(self):
+        tracer = Tracer(slow_threshold_ms=0)
+        try:
+            with tracer.trace("failing"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        assert "boom" in tracer.recent_slow()[0]["error"]
+
+
+class TestOTLPFileExporter:
+    """Test the OTLP/JSON lines export."""
+
+    def test_export_writes_resource_spans(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        exporter = OTLPFileExporter(str(path))
+        tracer = Tracer(exporter=exporter)
+        with tracer.trace("POST /translate"):
+            with tracer.span("translate.http", target="es"):
+                pass
+        exporter.close()
+        document = json.loads(path.read_text().splitlines()[0])
+        spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert [s["name"] for s in spans] == ["POST /translate", "translate.http"]
+        assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+        assert spans[1]["attributes"] == [{"key": "target", "value": {"stringValue": "es"}}]
@@ -0,0 +1,175 @@
+"""
+Tests for the synthesized-audio cache (ttscache.py).
+"""
+
+import asyncio
+import os
+
+from ttscache import AudioCache, CachedTTS, cache_key
+from voice import StubTTS, is_wav
+
+
+class CountingTTS(StubTTS):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def synthesize(self, text, tone="default"):
+        self.calls.append((text, tone))
+        await asyncio.sleep(0.01)
+        return await super().synthesize(text, tone)
+
+
+class TestCacheKey:
+    """Test the content address of a sentence."""
+
+    def test_voice_and_tone_are_part_of_the_key(self):
+        key = cache_key("Take a breath.", "stub", "default")
+        assert key == cache_key("  Take a\nbreath. ", "stub", "default")
+        assert key != cache_key("Take a breath.", "other", "default")
+        assert key != cache_key("Take a breath.", "stub", "friendly")
+
+
+class TestAudioCache:
+    """Test storage, mmap reads and LRU eviction by size."""
+
+    def test_round_trip_is_memory_mapped(self, tmp_path):
+        cache = AudioCache(str(tmp_path), 1000)
+        assert cache.get("ab" * 32) is None
+        assert cache.put("ab" * 32, b"RIFF1234WAVE")
+        audio = cache.get("ab" * 32)
+        assert isinstance(audio, memoryview) and audio.readonly
+        assert bytes(audio) == b"RIFF1234WAVE"
+        assert os.path.exists(tmp_path / "ab" / ("ab" * 32 + ".wav"))
+
+    def test_least_recently_used_is_evicted(self, tmp_path):
+        cache = AudioCache(str(tmp_path), 300)
+        for key in ("a1", "b2", "c3"):
+            cache.put(key, b"x" * 100)
+        cache.get("a1")
+        cache.put("d4", b"x" * 100)
+        assert "b2" not in cache
+        assert all(key in cache for key in ("a1", "c3", "d4"))
+        assert cache.total_bytes == 300
+        assert not os.path.exists(cache.path("b2"))
+
+    def test_entry_larger_than_the_cache_is_not_stored(self, tmp_path):
+        cache = AudioCache(str(tmp_path), 10)
+        assert not cache.put("a1", b"x" * 11)
+        assert len(cache) == 0
+
+    def test_index_is_rebuilt_from_disk(self, tmp_path):
+        cache = AudioCache(str(tmp_path), 1000)
+        cache.put("a1", b"old")
+        cache.put("b2", b"new")
+        os.utime(cache.path("a1"), (1, 1))
+        (tmp_path / "b2" / "leftover.tmp").write_bytes(b"partial")
+        os.utime(tmp_path / "b2" / "leftover.tmp", (1, 1))
+        (tmp_path / "b2" / "in-progress.tmp").write_bytes(b"partial")
+        reopened = AudioCache(str(tmp_path), 5)
+        # Only the most recently used entry fits the smaller budget
+        assert "a1" not in reopened and bytes(reopened.get("b2")) == b"new"
+        assert not (tmp_path / "b2" / "leftover.tmp").exists()
+        # A fresh temporary file may be another worker's write
+        assert (tmp_path / "b2" / "in-progress.tmp").exists()
+
+    def test_entries_written_by_another_process_are_found(self, tmp_path):
+        first, second = AudioCache(str(tmp_path), 1000), AudioCache(str(tmp_path), 1000)
+        first.put("a1", b"shared")
+        assert bytes(second.get("a1")) == b"shared"
+        assert "a1" in second and second.total_bytes == 6
+
+    def test_shared_directory_is_bounded_only_by_sweep(self, tmp_path):
+        first, second = AudioCache(str(tmp_path), 8, evict=False), AudioCache(str(tmp_path), 8, evict=False)
+        first.put("a1", b"first")
+        second.put("b2", b"second")
+        first.put("c3", b"third")
+        os.utime(first.path("a1"), (1, 1))
+        os.utime(first.path("b2"), (2, 2))
+        # Over budget each forgets entries but deletes nothing, not even at startup
+        assert "a1" not in first and os.path.exists(first.path("a1"))
+        AudioCache(str(tmp_path), 8, evict=False)
+        assert all(os.path.exists(first.path(key)) for key in ("a1", "b2", "c3"))
+        # The sweep sees every worker's files and keeps the most recently used that fit
+        assert second.sweep() == 2
+        assert [os.path.exists(first.path(key)) for key in ("a1", "b2", "c3")] == [False, False, True]
+        assert "c3" in second and second.total_bytes == 5
+
+    def test_file_removed_behind_the_cache_is_a_miss(self, tmp_path):
+        cache = AudioCache(str(tmp_path), 1000)
+        cache.put("a1", b"data")
+        os.unlink(cache.path("a1"))
+        assert cache.get("a1") is None
+        assert cache.total_bytes == 0
+
+
+class TestCachedTTS:
+    """Test the caching wrapper around a TTS backend."""
+
+    def test_second_synthesis_is_served_from_cache(self, tmp_path):
+        backend = CountingTTS()
+        tts = CachedTTS(backend, AudioCache(str(tmp_path), 10 ** 7))
+
+        async def run():
+            first = await tts.synthesize("Hello there.", "friendly")
+            second = await tts.synthesize("Hello there.", "friendly")
+            other_tone = await tts.synthesize("Hello there.", "professional")
+            return first, second, other_tone
+
+        first, second, other_tone = asyncio.run(run())
+        assert bytes(first) == bytes(second) and is_wav(second)
+        assert backend.calls == [("Hello there.", "friendly"), ("Hello there.", "professional")]
+        assert (tts.hits, tts.misses) == (1, 2)
+
+    def test_concurrent_misses_share_one_synthesis(self, tmp_path):
+        backend = CountingTTS()
+        tts = CachedTTS(backend, AudioCache(str(tmp_path), 10 ** 7))
+
+        async def run():
+            return await asyncio.gather(*(tts.synthesize("Same words.") for _ in range(5)))
+
+        results = asyncio.run(run())
+        assert len(backend.calls) == 1
+        assert len({bytes(r) for r in results}) == 1
+
+    def test_backend_failure_reaches_every_waiter_and_is_not_cached(self, tmp_path):
+        class FailingTTS:
+            voice = "failing"
+
+            async def synthesize(self, text, tone="default"):
+                await asyncio.sleep(0.01)
+                raise RuntimeError("endpoint down")
+
+        tts = CachedTTS(FailingTTS(), AudioCache(str(tmp_path), 10 ** 7))
+
+        async def run():
+            return await asyncio.gather(tts.synthesize("Hi."), tts.synthesize("Hi."), return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+        assert len(tts.cache) == 0
+
+    def test_prewarm_synthesizes_only_what_is_missing(self, tmp_path):
+        backend = CountingTTS()
+        tts = CachedTTS(backend, AudioCache(str(tmp_path), 10 ** 7))
+        assert asyncio.run(tts.prewarm(["One.", "Two.", "One."], ["default", "friendly"])) == 4
+        assert asyncio.run(tts.prewarm(["One.", "Two.", "Three."], ["default"])) == 1
+        assert len(backend.calls) == 5
+
+
+class TestFallbackPrewarm:
+    """Test that every fallback reply is covered by the startup pre-warm."""
+
+    def test_fallback_replies_are_all_prewarmed(self, tmp_path):
+        import main
+        from voice import split_sentences
+
+        sentences = set(main.fallback_sentences())
+        for message in ("water please", "who are you", "anything else"):
+            for tone in main.PROMPTS.names():
+                for _ in range(10):
+                    reply = main.get_fallback_response(message, tone)
+                    assert set(split_sentences(reply)) <= sentences
+
+        tts = CachedTTS(StubTTS(), AudioCache(str(tmp_path), 10 ** 8))
+        added = asyncio.run(tts.prewarm(sentences, main.PROMPTS.names()))
+        assert added == len(sentences) * len(main.PROMPTS.names())
@@ -0,0 +1,152 @@
+"""
+Tests for the voice pipeline (voice.py) and the /ws/audio endpoint.
+"""
+
+import asyncio
+import base64
+import json
+
+import httpx
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from voice import StubTTS, pcm_to_wav, split_sentences, stream_speech, wav_to_pcm
+
+RATE = 16000
+
+
+def tone(ms, amplitude=0.3):
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+
+
+class TestAudioHelpers:
+    """Test WAV conversion and sentence splitting."""
+
+    def test_stereo_wav_is_mixed_down(self):
+        import io
+        import wave
+        out = io.BytesIO()
+        with wave.open(out, "wb") as wf:
+            wf.setnchannels(2)
+            wf.setsampwidth(2)
+            wf.setframerate(8000)
+            wf.writeframes(np.array([100, 300] * 10, dtype="<i2").tobytes())
+        pcm, rate = wav_to_pcm(out.getvalue())
+        assert rate == 8000
+        assert np.frombuffer(pcm, dtype="<i2").tolist() == [200] * 10
+        assert wav_to_pcm(pcm_to_wav(pcm, 8000)) == (pcm, 8000)
+
+    def test_split_sentences(self):
+        assert split_sentences("One step. Then two! Ready? ") == ["One step.", "Then two!", "Ready?"]
+
+
+class TestStreamSpeech:
+    """Test that sentences are synthesized ahead of sending."""
+
+    def test_next_sentence_is_synthesized_while_sending(self):
+        events = []
+
+        class RecordingTTS(StubTTS):
+            async def synthesize(self, text, tone="default"):
+                events.append(f"synth {text}")
+                return await super().synthesize(text, tone)
+
+        async def send(seq, sentence, audio, last):
+            await asyncio.sleep(0)
+            events.append(f"send {sentence}")
+
+        assert asyncio.run(stream_speech(RecordingTTS(), "First. Second.", send)) == 2
+        assert events.index("synth Second.") < events.index("send First.")
+
+
+class TestAudioWebSocket:
+    """Test a full voice turn over /ws/audio with the stub backends."""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        import main
+
+        async def fake_complete(prompt, message, prefix_hash=None):
+            return "Take a breath. Start with the smallest step."
+
+        monkeypatch.setattr(main, "_complete", fake_complete)
+        return TestClient(main.app)
+
+    def test_streamed_pcm_gets_transcript_reply_and_audio(self, client):
+        with client.websocket_connect("/ws/audio/voice-session") as ws:
+            ws.send_text(json.dumps({"type": "start", "sample_rate": RATE, "tone": "friendly"}))
+            assert json.loads(ws.receive_text())["status"] == "listening"
+            ws.send_bytes(tone(600))
+            ws.send_text(json.dumps({"type": "end"}))
+            messages = []
+            while not messages or messages[-1]["type"] != "audio_end":
+                messages.append(json.loads(ws.receive_text()))
+        types = [m["type"] for m in messages]
+        assert types == ["status", "transcript", "response", "audio", "audio", "audio_end"]
+        assert messages[2]["response"] == "Take a breath. Start with the smallest step."
+        audio = messages[3]
+        assert audio["text"] == "Take a breath."
+        assert wav_to_pcm(base64.b64decode(audio["audio"]))[1] == audio["sample_rate"]
+
+    def test_frames_in_get_frames_out(self, client):
+        from audioframes import CODEC_WAV, encode_frame, parse_frame
+        with client.websocket_connect("/ws/audio/framed") as ws:
+            ws.send_bytes(encode_frame("framed", 0, tone(600), RATE))
+            ws.send_bytes(encode_frame("framed", 1, b"", RATE, flags=1))
+            replies = []
+            while True:
+                message = ws.receive()
+                if message.get("bytes") is not None:
+                    replies.append(parse_frame(message["bytes"]))
+                elif json.loads(message["text"])["type"] == "audio_end":
+                    break
+        assert [(f.seq, f.codec, f.end) for f in replies] == [(0, CODEC_WAV, False), (1, CODEC_WAV, True)]
+        assert wav_to_pcm(replies[0].payload)[1] == replies[0].sample_rate
+
+    def test_bad_text_frame_is_reported(self, client):
+        with client.websocket_connect("/ws/audio/voice-session") as ws:
+            ws.send_text("not json")
+            assert json.loads(ws.receive_text())["type"] == "error"
+            ws.send_text(json.dumps({"command": "ping"}))
+            assert json.loads(ws.receive_text())["type"] == "pong"
+
+    @pytest.mark.parametrize("text", ["[]", '"start"', '{"type": "start", "sample_rate": "x"}',
+                                      '{"type": "start", "sample_rate": 0}',
+                                      '{"type": "start", "sample_rate": 4000000000}', '{"type": "start", "tone": []}'])
+    def test_bad_commands_are_reported(self, client, text):
+        with client.websocket_connect("/ws/audio/voice-session") as ws:
+            ws.send_text(text)
+            assert json.loads(ws.receive_text())["type"] == "error"
+            ws.send_text(json.dumps({"command": "ping"}))
+            assert json.loads(ws.receive_text())["type"] == "pong"
+
+    def test_odd_length_pcm_is_reported(self, client):
+        with client.websocket_connect("/ws/audio/voice-session") as ws:
+            ws.send_bytes(b"\x00\x00\x00")
+            assert json.loads(ws.receive_text())["type"] == "error"
+            ws.send_text(json.dumps({"command": "ping"}))
+            assert json.loads(ws.receive_text())["type"] == "pong"
+
+    def test_backend_failures_are_reported(self, client, monkeypatch):
+        import main
+
+        async def unreachable(*args, **kwargs):
+            raise httpx.ConnectError("connection refused")
+
+        with client.websocket_connect("/ws/audio/voice-session") as ws:
+            monkeypatch.setattr(main.stt_backend, "transcribe", unreachable)
+            ws.send_bytes(tone(600))
+            ws.send_text(json.dumps({"type": "end"}))
+            assert [json.loads(ws.receive_text())["type"] for _ in range(2)] == ["status", "error"]
+            monkeypatch.undo()
+            monkeypatch.setattr(main, "_complete", lambda *a, **k: asyncio.sleep(0, "One sentence."))
+            monkeypatch.setattr(main.tts_backend, "synthesize", unreachable)
+            ws.send_bytes(tone(600))
+            ws.send_text(json.dumps({"type": "end"}))
+            messages = []
+            while not messages or messages[-1]["type"] != "audio_end":
+                messages.append(json.loads(ws.receive_text()))
+        assert [m["type"] for m in messages] == ["status", "transcript", "response", "error", "audio_end"]
+        assert messages[-1]["chunks"] == 0
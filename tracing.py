@@ -0,0 +1,231 @@
+"""
+Lightweight in-process request tracing.
+
+A trace is a tree of spans opened with ``tracer.trace(...)`` (the root) and
+``tracer.span(...)`` (children). The current span travels in a ContextVar, so spans
+nest correctly across awaits within a request and never leak between requests.
+Outside a trace, ``span()`` is a no-op.
+
+Finished traces slower than the threshold go into a fixed-size ring buffer. With an
+exporter configured, every finished trace is also written as one OTLP/JSON
+``resourceSpans`` document per line, the same layout the OpenTelemetry collector's
+file exporter produces. A background thread does the writing.
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("virgil_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def drop(self) -> None:
+        """Discard the whole trace, e.g. a scheduler tick that found nothing to do."""
+        self.trace.dropped = True
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def drop(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "dropped")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.dropped = False
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start": datetime.fromtimestamp(root.start_ns / 1e9, tz=timezone.utc).isoformat(),
+            "duration_ms": round(root.duration_ms, 3),
+            "error": root.error,
+            "spans": [
+                {
+                    "name": s.name,
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "start_offset_ms": round((s.start_ns - root.start_ns) / 1e6, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "attributes": s.attributes,
+                    "error": s.error,
+                }
+                for s in self.spans
+            ],
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace, service_name: str) -> Dict[str, Any]:
+    """Render a trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,  # SERVER for roots, INTERNAL otherwise
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            span["parentSpanId"] = s.parent_id
+        spans.append(span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{"scope": {"name": "virgil.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class OTLPFileExporter:
+    """Appends traces as OTLP/JSON lines from a background thread."""
+
+    def __init__(self, path: str, service_name: str = "virgil"):
+        self.path = path
+        self.service_name = service_name
+        self._queue: "queue.SimpleQueue[Optional[Trace]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace) -> None:
+        self._queue.put(trace)
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    return
+                try:
+                    f.write(json.dumps(to_otlp(trace, self.service_name)) + "\n")
+                    if self._queue.empty():
+                        f.flush()
+                except Exception as e:
+                    logger.error(f"Trace export failed: {e}")
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class Tracer:
+    def __init__(self, slow_threshold_ms: float = 500.0, buffer_size: int = 100,
+                 exporter: Optional[OTLPFileExporter] = None, enabled: bool = True):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.exporter = exporter
+        self.enabled = enabled
+        self.slow_traces: deque = deque(maxlen=buffer_size)
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Open a root span; nested calls inside an active trace become child spans."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        trace = parent.trace if parent is not None else Trace()
+        span = Span(trace, name, parent.span_id if parent is not None else None, attributes)
+        trace.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            if parent is None:
+                self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Open a child span of the current one; does nothing outside a trace."""
+        if _current_span.get() is None:
+            yield NOOP_SPAN
+            return
+        with self.trace(name, **attributes) as span:
+            yield span
+
+    def traced(self, name: str):
+        """Decorator running an async function inside trace(name)."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.trace(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, trace: Trace) -> None:
+        if trace.dropped:
+            return
+        if trace.root.duration_ms >= self.slow_threshold_ms:
+            self.slow_traces.append(trace)
+        if self.exporter is not None:
+            self.exporter.export(trace)
+
+    def recent_slow(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent slow traces, newest first."""
+        return [t.to_dict() for t in list(self.slow_traces)[::-1][:limit]]
@@ -0,0 +1,270 @@
+"""
+Content-addressed cache of synthesized speech.
+
+Replies are spoken one sentence at a time and many sentences recur verbatim: every
+fallback reply, greetings, error messages. AudioCache stores each synthesized sentence
+on disk under the SHA-256 of (voice, tone, text), so the same words in the same voice
+and tone are synthesized once and then read back:
+
+    <directory>/ab/ab12...ef.wav
+
+Entries are written to a temporary file and renamed into place, so a reader never sees
+a partial file. The cache is bounded by total size; least recently used entries are
+deleted first. Recency survives restarts because a hit touches the file's mtime and the
+index is rebuilt in mtime order. Hits are memory-mapped rather than read, so repeated
+replies come out of the page cache without a copy into the process.
+
+Several worker processes may share one directory (serve.py --workers). A key missing
+from this process's index is still looked for on disk, so what one worker synthesized
+the others read back. Each worker only sees part of the directory, so they are created
+with evict=False: over budget they forget their least recently used entries but leave
+the files alone, and one process bounds the whole directory with sweep(), which
+re-reads it and deletes the least recently used files host-wide (hits touch the mtime
+in every worker). A file swept away is forgotten by the others when they next miss it.
+
+CachedTTS wraps a TTS backend (see voice.py) with the cache and can pre-warm it with a
+list of texts at startup.
+"""
+
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Temporary files younger than this may be another worker's write in progress
+STALE_TMP_SECONDS = 600
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def cache_key(text: str, voice: str, tone: str) -> str:
+    """Whitespace differences in the text do not change the key."""
+    material = "\x1f".join((voice, tone or "default", " ".join(text.split())))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Size-bounded on-disk LRU of audio blobs, read back through mmap.
+
+    With evict=False entries over budget are only dropped from the index; see sweep().
+    """
+
+    def __init__(self, directory: str, max_bytes: int, evict: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evict = evict
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".wav")
+
+    def get(self, key: str) -> Optional[memoryview]:
+        """The cached audio as a read-only view of the mapped file, or None."""
+        with self._lock:
+            indexed = key in self._entries
+            if indexed:
+                self._entries.move_to_end(key)
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Deleted behind our back, or empty (mmap refuses zero-length files)
+            if indexed:
+                self._forget(key)
+            return None
+        if not indexed:
+            # Written by another process sharing the directory
+            self._index(key, len(mapped))
+        return memoryview(mapped)
+
+    def put(self, key: str, data: Buffer) -> bool:
+        """Store data under key; False if it is larger than the whole cache."""
+        size = len(data)
+        if not size or size > self.max_bytes:
+            return False
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+        self._index(key, size)
+        return True
+
+    def _index(self, key: str, size: int) -> None:
+        with self._lock:
+            self._bytes += size - self._entries.get(key, 0)
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            evicted = self._evict()
+        if self.evict:
+            for old in evicted:
+                self._unlink(old)
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        for key in keys:
+            self._unlink(key)
+
+    def _evict(self) -> List[str]:
+        evicted = []
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            evicted.append(key)
+        return evicted
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+
+    def _unlink(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except OSError:
+            pass
+
+    def sweep(self) -> int:
+        """Re-read the whole directory and delete least recently used files over budget.
+
+        For the one process bounding a directory shared with evict=False caches; blocking.
+        Returns the number of files deleted.
+        """
+        entries, size = self._scan()
+        with self._lock:
+            self._entries, self._bytes = entries, size
+            evicted = self._evict()
+        for key in evicted:
+            self._unlink(key)
+        return len(evicted)
+
+    def _load(self) -> None:
+        self._entries, self._bytes = self._scan()
+        evicted = self._evict()
+        if self.evict:
+            for key in evicted:
+                self._unlink(key)
+        if self._entries:
+            logger.info(f"TTS cache: {len(self._entries)} entries, {self._bytes / 1e6:.1f} MB in {self.directory}")
+
+    def _scan(self) -> Tuple["OrderedDict[str, int]", int]:
+        """Index what is on disk, oldest first, and drop leftovers of failed writes."""
+        found = []
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        try:
+                            os.unlink(path)
+                        except OSError:
+                            pass
+                    continue
+                if not name.endswith(".wav"):
+                    continue
+                found.append((stat.st_mtime, name[:-4], stat.st_size))
+        entries: "OrderedDict[str, int]" = OrderedDict()
+        for _, key, size in sorted(found):
+            entries[key] = size
+        return entries, sum(entries.values())
+
+
+class CachedTTS:
+    """A TTS backend with synthesized audio cached by text, voice and tone.
+
+    Concurrent requests for the same uncached sentence share one synthesis.
+    """
+
+    def __init__(self, backend, cache: AudioCache, voice: Optional[str] = None):
+        self.backend = backend
+        self.cache = cache
+        self.voice = voice or getattr(backend, "voice", type(backend).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def synthesize(self, text: str, tone: str = "default") -> Buffer:
+        key = cache_key(text, self.voice, tone)
+        audio = self.cache.get(key)
+        if audio is not None:
+            self.hits += 1
+            return audio
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        self.misses += 1
+        pending = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            audio = await self.backend.synthesize(text, tone)
+            pending.set_result(audio)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Waiters see the failure; nobody may be waiting, so mark it retrieved
+            pending.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        try:
+            await asyncio.to_thread(self.cache.put, key, audio)
+        except OSError as e:
+            logger.warning(f"Could not write TTS cache entry: {e}")
+        return audio
+
+    async def prewarm(self, texts: Iterable[str], tones: Iterable[str], concurrency: int = 4) -> int:
+        """Synthesize every (text, tone) pair not already cached; returns how many were added."""
+        tones = list(tones)
+        todo = [(text, tone) for text in dict.fromkeys(texts) for tone in tones
+                if cache_key(text, self.voice, tone) not in self.cache]
+        limit = asyncio.Semaphore(concurrency)
+        added = 0
+
+        async def warm(text, tone):
+            nonlocal added
+            async with limit:
+                try:
+                    await self.synthesize(text, tone)
+                    added += 1
+                except Exception as e:
+                    logger.warning(f"TTS pre-warm failed for {text[:40]!r} ({tone}): {e}")
+
+        await asyncio.gather(*(warm(text, tone) for text, tone in todo))
+        return added
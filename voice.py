@@ -0,0 +1,167 @@
+"""
+Voice pipeline pieces for the /ws/audio endpoint.
+
+Audio arrives as 16-bit little-endian mono PCM (or whole WAV files) and is cut into
+utterances by audioprep.SpeechPreprocessor before it reaches the STT backend.
+
+Speech-to-text and text-to-speech go through small backends chosen by name:
+
+    stub    local stand-ins with no model: the STT returns a fixed phrase and the TTS
+            a short tone per word, so the whole path can run in development and tests
+    http    a Hugging Face style inference endpoint: the STT posts WAV bytes and reads
+            {"text": ...} (Whisper), the TTS posts {"inputs": text} and expects WAV bytes
+
+stream_speech synthesizes a reply sentence by sentence, starting the next sentence while
+the previous one is being sent, so playback starts after the first sentence rather than
+the whole reply. A TTS backend's voice attribute names what it sounds like, so cached
+audio (see ttscache.py) is never served for a different voice.
+"""
+
+import asyncio
+import io
+import re
+import wave
+from typing import Awaitable, Callable, List, Tuple
+
+import numpy as np
+
+SAMPLE_WIDTH = 2  # bytes per 16-bit sample
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return out.getvalue()
+
+
+def wav_to_pcm(data: bytes) -> Tuple[bytes, int]:
+    """Mono 16-bit PCM and the sample rate from a WAV file; channels are averaged."""
+    with wave.open(io.BytesIO(data), "rb") as wf:
+        if wf.getsampwidth() != SAMPLE_WIDTH:
+            raise ValueError(f"Only 16-bit WAV is supported, got {wf.getsampwidth() * 8}-bit")
+        channels, rate = wf.getnchannels(), wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    if channels > 1:
+        samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels)
+        frames = samples.mean(axis=1).astype("<i2").tobytes()
+    return frames, rate
+
+
+def is_wav(data: bytes) -> bool:
+    return data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def wav_sample_rate(data: bytes) -> int:
+    """Sample rate from a canonical WAV header (fmt chunk first)."""
+    return int.from_bytes(data[24:28], "little") if is_wav(data) else 0
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in (part.strip() for part in _SENTENCE_END.split(text or "")) if s]
+
+
+class StubSTT:
+    """Local stand-in: every utterance transcribes to the same phrase."""
+
+    def __init__(self, text: str = "Hello Virgil, how can I stay focused today?"):
+        self.text = text
+
+    async def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        return self.text
+
+
+class HTTPSTT:
+    """Whisper-style endpoint: POST a WAV file, read {"text": ...}."""
+
+    def __init__(self, client, url: str, api_key: str = ""):
+        self.client = client
+        self.url = url
+        self.api_key = api_key
+
+    async def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        headers = {"Content-Type": "audio/wav"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        response = await self.client.post(self.url, content=pcm_to_wav(pcm, sample_rate), headers=headers)
+        response.raise_for_status()
+        return (response.json().get("text") or "").strip()
+
+
+class StubTTS:
+    """Local stand-in: a quiet 440 Hz tone, 120 ms per word, as WAV."""
+
+    def __init__(self, sample_rate: int = 16000, ms_per_word: int = 120):
+        self.sample_rate = sample_rate
+        self.ms_per_word = ms_per_word
+        self.voice = f"stub-{sample_rate}-{ms_per_word}"
+
+    async def synthesize(self, text: str, tone: str = "default") -> bytes:
+        samples = self.sample_rate * self.ms_per_word * max(1, len(text.split())) // 1000
+        tone = 0.2 * np.sin(2 * np.pi * 440 * np.arange(samples) / self.sample_rate)
+        return pcm_to_wav((tone * 32767).astype("<i2").tobytes(), self.sample_rate)
+
+
+class HTTPTTS:
+    """Inference endpoint taking {"inputs": text} and answering with WAV bytes.
+
+    The endpoint has one voice, so the tone does not change the request.
+    """
+
+    def __init__(self, client, url: str, api_key: str = ""):
+        self.client = client
+        self.url = url
+        self.api_key = api_key
+        self.voice = url
+
+    async def synthesize(self, text: str, tone: str = "default") -> bytes:
+        headers = {"Accept": "audio/wav"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        response = await self.client.post(self.url, json={"inputs": text}, headers=headers)
+        response.raise_for_status()
+        return response.content
+
+
+def make_stt(backend: str, client=None, url: str = "", api_key: str = ""):
+    if backend == "stub":
+        return StubSTT()
+    if backend == "http":
+        return HTTPSTT(client, url, api_key)
+    raise ValueError(f"Unknown STT backend: {backend!r} (expected 'stub' or 'http')")
+
+
+def make_tts(backend: str, client=None, url: str = "", api_key: str = "", sample_rate: int = 16000):
+    if backend == "stub":
+        return StubTTS(sample_rate)
+    if backend == "http":
+        return HTTPTTS(client, url, api_key)
+    raise ValueError(f"Unknown TTS backend: {backend!r} (expected 'stub' or 'http')")
+
+
+async def stream_speech(tts, text: str, send: Callable[[int, str, bytes, bool], Awaitable[None]],
+                        tone: str = "default") -> int:
+    """Synthesize text one sentence at a time and send(seq, sentence, wav, last) each in order.
+
+    The next sentence is synthesized while the current one is sent. Returns the number
+    of chunks sent.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return 0
+    pending = asyncio.ensure_future(tts.synthesize(sentences[0], tone))
+    try:
+        for seq, sentence in enumerate(sentences):
+            audio = await pending
+            if seq + 1 < len(sentences):
+                pending = asyncio.ensure_future(tts.synthesize(sentences[seq + 1], tone))
+            await send(seq, sentence, audio, seq + 1 == len(sentences))
+    finally:
+        if not pending.done():
+            pending.cancel()
+    return len(sentences)
@@ -14,6 +14,8 @@ from typing import Dict, Any
 # Import the standard websockets library
 import websockets
 
+from audioframes import echo_reply
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,  # Set to DEBUG for more verbose logging
@@ -59,6 +61,12 @@ async def handle_websocket(websocket, path):
         
         # Process incoming messages
         async for message in websocket:
+            if isinstance(message, bytes):
+                frame, reply = echo_reply(message)
+                if frame is not None:
+                    logger.info(f"Received audio frame {frame.seq} from {session_id}: {len(frame.payload)} bytes")
+                await websocket.send(reply)
+                continue
             logger.info(f"Received message from {session_id}: {message}")
             
             try:
@@ -12,6 +12,8 @@ import logging
 import uuid
 from websockets.server import serve
 
+from audioframes import echo_reply
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -43,6 +45,12 @@ async def echo_handler(websocket):
 
         # Handle incoming messages
         async for message in websocket:
+            if isinstance(message, bytes):
+                frame, reply = echo_reply(message)
+                if frame is not None:
+                    logger.info(f"Received audio frame {frame.seq} from client {client_id}: {len(frame.payload)} bytes")
+                await websocket.send(reply)
+                continue
             try:
                 logger.info(f"Received message from client {client_id}: {message}")
                 